@@ -0,0 +1,212 @@
+"""Offline batch analysis of recorded Keyboard Tester Pro sessions (needs NumPy, no display).
+
+    python kbbatch.py sessions/ [--layout QWERTY_Full_US] [--jobs 8] [--out DIR]
+    python pythonkytest.py analyze sessions/ ...
+
+Every .kbts file under the directory is analyzed in a process pool. Events are
+mapped to physical keys through the same LAYOUTS/LayoutIndex the GUI uses, and
+per-key press counts, dwell times and inter-key intervals are computed with
+vectorized NumPy code into a kbstats.KeyStats per session, then merged. Two CSV
+tables are written: one row per session and one row per key of the layout.
+"""
+import argparse
+import concurrent.futures
+import csv
+import os
+import sys
+import time
+
+import numpy as np
+
+import pythonkytest as kt
+from kbrecord import FILE_EXTENSION, SessionReader
+from kbstate import PRESS, RELEASE
+from kbstats import KeyStats
+
+SESSION_COLUMNS = ("session", "events", "presses", "keys_used", "duration_s", "mean_dwell_ms", "p95_dwell_ms",
+                   "mean_interval_ms", "chatter", "orphan_releases", "max_rollover", "unmapped_events")
+KEY_COLUMNS = ("key_id", "label", "keysyms", "presses", "mean_dwell_ms", "p50_dwell_ms", "p95_dwell_ms", "mean_interval_ms", "chatter")
+
+
+def find_sessions(directory):
+    """Sorted paths of every recorded session below directory."""
+    paths = []
+    for dirpath, _dirnames, filenames in os.walk(directory):
+        paths.extend(os.path.join(dirpath, name) for name in filenames if name.endswith(FILE_EXTENSION))
+    return sorted(paths)
+
+
+def _record_key_ids(records, strings, index):
+    """Layout key id of every record (-1 if the layout has no such key), resolving each distinct keysym/char pair once."""
+    pairs = (records["keysym_id"].astype(np.int64) << 16) | records["char_id"]
+    unique_pairs, inverse = np.unique(pairs, return_inverse=True)
+    resolved = np.array([(index.lookup(strings[pair >> 16], strings[pair & 0xFFFF]) or (-1,))[0] for pair in unique_pairs.tolist()], dtype=np.int64)
+    return resolved[inverse]
+
+
+def event_times_ms(records):
+    """Event times in ms as float64: Tk's event.time with 32-bit wraparound undone, or the host clock if it was not set."""
+    raw = records["time"].astype(np.int64)
+    if not raw.any(): return records["host_ns"].astype(np.float64) / 1e6
+    wraps = np.zeros(len(raw), dtype=np.int64)
+    wraps[1:] = np.cumsum(np.diff(raw) < -(1 << 31))
+    return (raw + (wraps << 32)).astype(np.float64)
+
+
+def drop_x11_autorepeat(keys, times, types, repeat_delay_ms=150):
+    """Removes X11 autorepeat from events grouped per key in time order: a release and a press of the same key
+    with one timestamp, once the key has been down for repeat_delay_ms (the rule KeyHealthAnalyzer uses)."""
+    n = len(keys)
+    same_key = np.zeros(n, dtype=bool)
+    same_key[1:] = keys[1:] == keys[:-1]
+    pair_press = np.zeros(n, dtype=bool)
+    pair_press[1:] = same_key[1:] & (types[1:] == PRESS) & (types[:-1] == RELEASE) & (times[1:] == times[:-1])
+    after_press = np.zeros(n, dtype=bool)
+    after_press[1:] = same_key[1:] & (types[:-1] == PRESS)
+    hold_start = (types == PRESS) & ~after_press & ~pair_press
+    last_start = np.maximum.accumulate(np.where(hold_start, np.arange(n), 0))
+    repeat = pair_press & (keys[last_start] == keys) & (times - times[last_start] >= repeat_delay_ms)
+    drop = repeat.copy()
+    drop[:-1] |= repeat[1:] # The release half of each pair
+    return keys[~drop], times[~drop], types[~drop]
+
+
+def analyze_file(path, layout_name, chatter_ms, repeat_delay_ms=150):
+    """Worker: returns (session row dict, KeyStats, per-key chatter counts) for one .kbts file."""
+    index = kt.get_layout_index(layout_name)
+    key_count = len(index.key_defs)
+    with SessionReader(path) as reader:
+        records = reader.as_array()
+        key_ids = _record_key_ids(records, reader.strings, index)
+        event_types = records["type"].astype(np.int64)
+        times_ms = event_times_ms(records)
+        del records # Drop the view into the memory map before the reader closes it
+    mapped = key_ids >= 0
+    keys, types, times = key_ids[mapped], event_types[mapped], times_ms[mapped]
+    # Group each key's events together, keeping time order within the key
+    order = np.lexsort((np.arange(len(keys)), keys))
+    k, t, typ = drop_x11_autorepeat(keys[order], times[order], types[order], repeat_delay_ms)
+    n = len(k)
+    group_start = np.ones(n, dtype=bool)
+    group_start[1:] = k[1:] != k[:-1]
+    prev_is_press = np.zeros(n, dtype=bool)
+    prev_is_press[1:] = typ[:-1] == PRESS
+    prev_is_press &= ~group_start
+    prev_time = np.empty(n); prev_time[1:] = t[:-1]; prev_time[:1] = np.nan
+    down = (typ == PRESS) & ~prev_is_press # First press of a run; later presses of the run are autorepeat
+    last_down = np.maximum.accumulate(np.where(down, np.arange(n), 0))
+    release = (typ == RELEASE) & prev_is_press
+    orphan = (typ == RELEASE) & ~prev_is_press
+    after_release = down & ~group_start
+    gaps = t[after_release] - prev_time[after_release]
+    chatter_keys = k[after_release][gaps < chatter_ms]
+
+    dwells = t[release] - t[last_down[release]]
+
+    stats = KeyStats(key_count)
+    stats.add_presses(k[down])
+    stats.add_dwells(k[release], dwells)
+    down_order = np.argsort(t[down], kind="stable")
+    down_keys, down_times = k[down][down_order], t[down][down_order]
+    stats.add_intervals(down_keys[1:], np.diff(down_times))
+    chatter = np.bincount(chatter_keys, minlength=key_count)
+
+    # Rollover: +1 per key going down, -1 per paired release, replayed in time order
+    steps = np.concatenate([np.ones(int(down.sum())), -np.ones(int(release.sum()))])
+    step_times = np.concatenate([t[down], t[release]])
+    rollover = np.cumsum(steps[np.argsort(step_times, kind="stable")])
+    with np.errstate(invalid="ignore"):
+        mean_dwell = stats.dwell_sum.sum() / stats.dwell_count.sum() if stats.dwell_count.any() else float("nan")
+        mean_interval = stats.interval_sum.sum() / stats.interval_count.sum() if stats.interval_count.any() else float("nan")
+    row = {"session": path, "events": len(key_ids), "presses": stats.total_presses, "keys_used": int((stats.counts > 0).sum()),
+           "duration_s": round((times_ms[-1] - times_ms[0]) / 1e3, 3) if len(times_ms) else 0.0,
+           "mean_dwell_ms": round(float(mean_dwell), 2), "p95_dwell_ms": round(float(np.percentile(dwells, 95)), 2) if len(dwells) else float("nan"),
+           "mean_interval_ms": round(float(mean_interval), 2), "chatter": int(chatter.sum()), "orphan_releases": int(orphan.sum()),
+           "max_rollover": int(rollover.max()) if len(rollover) else 0, "unmapped_events": int((~mapped).sum())}
+    return row, stats, chatter
+
+
+def analyze_or_skip(path, layout_name, chatter_ms, repeat_delay_ms=150):
+    """Worker: analyze_file()'s result, or (None, error text) for a file that cannot be read (truncated, unclosed, unreadable)."""
+    try:
+        return analyze_file(path, layout_name, chatter_ms, repeat_delay_ms)
+    except (OSError, ValueError) as e:
+        return None, str(e)
+
+
+def key_rows(stats, chatter, index):
+    """One summary row per key of the layout from merged KeyStats."""
+    columns = {"presses": stats.counts, "mean_dwell_ms": stats.metric("mean_dwell"), "p50_dwell_ms": stats.metric("p50_dwell"),
+               "p95_dwell_ms": stats.metric("p95_dwell"), "mean_interval_ms": stats.metric("mean_interval"), "chatter": chatter}
+    rows = []
+    for key_id, key_def in enumerate(index.key_defs):
+        row = {"key_id": key_id, "label": key_def.label, "keysyms": " ".join(sorted(key_def.keysyms))}
+        for name, values in columns.items():
+            value = values[key_id].item()
+            row[name] = round(value, 2) if isinstance(value, float) else value
+        rows.append(row)
+    return rows
+
+
+def write_table(path, columns, rows):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=columns)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def run(directory, layout_name, jobs=None, out_dir=None, chatter_ms=None):
+    """Analyzes every session under directory and writes the two CSV tables; returns (session rows, key rows, skipped).
+
+    Files that cannot be read are left out of the tables; skipped lists them as (path, error text)."""
+    paths = find_sessions(directory)
+    if not paths: return [], [], []
+    chatter_ms = kt.STYLE_CONFIG["health_chatter_ms"] if chatter_ms is None else chatter_ms
+    index = kt.get_layout_index(layout_name)
+    total = KeyStats(len(index.key_defs))
+    total_chatter = np.zeros(len(index.key_defs), dtype=np.int64)
+    session_rows, skipped = [], []
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as pool:
+        results = pool.map(analyze_or_skip, paths, [layout_name] * len(paths), [chatter_ms] * len(paths),
+                           chunksize=max(1, len(paths) // (4 * (jobs or os.cpu_count() or 1))))
+        for path, result in zip(paths, results):
+            if result[0] is None: skipped.append((path, result[1])); continue
+            row, stats, chatter = result
+            session_rows.append(row)
+            total.merge(stats)
+            total_chatter += chatter
+    rows = key_rows(total, total_chatter, index)
+    out_dir = out_dir or directory
+    os.makedirs(out_dir, exist_ok=True)
+    write_table(os.path.join(out_dir, "summary-sessions.csv"), SESSION_COLUMNS, session_rows)
+    write_table(os.path.join(out_dir, "summary-keys.csv"), KEY_COLUMNS, rows)
+    return session_rows, rows, skipped
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="kbbatch", description="Batch analysis of recorded Keyboard Tester Pro sessions")
+    parser.add_argument("directory", help="directory searched recursively for .kbts sessions")
+    parser.add_argument("--layout", default=next(iter(kt.LAYOUTS)), choices=list(kt.LAYOUTS), help="layout used to map keysyms to keys")
+    parser.add_argument("--jobs", type=int, default=None, help="worker processes (default: one per CPU)")
+    parser.add_argument("--out", metavar="DIR", help="where to write summary-sessions.csv and summary-keys.csv (default: the input directory)")
+    parser.add_argument("--chatter-ms", type=int, default=None, help="release-to-press gap below which a press counts as chatter")
+    args = parser.parse_args(argv)
+    start = time.perf_counter()
+    session_rows, rows, skipped = run(args.directory, args.layout, args.jobs, args.out, args.chatter_ms)
+    for path, error in skipped: print(f"skipped {path}: {error}", file=sys.stderr)
+    if not session_rows:
+        print(f"No readable {FILE_EXTENSION} sessions found under {args.directory}")
+        return 1
+    print(f"{'session':<40}{'events':>9}{'presses':>9}{'dwell ms':>10}{'p95 ms':>8}{'chatter':>9}{'rollover':>9}")
+    for row in session_rows:
+        print(f"{os.path.basename(row['session'])[-39:]:<40}{row['events']:>9}{row['presses']:>9}{row['mean_dwell_ms']:>10}"
+              f"{row['p95_dwell_ms']:>8}{row['chatter']:>9}{row['max_rollover']:>9}")
+    busiest = sorted(rows, key=lambda r: -r["presses"])[:5]
+    print("most pressed: " + ", ".join(f"{r['label']} ({r['presses']})" for r in busiest))
+    print(f"{len(session_rows)} sessions in {time.perf_counter() - start:.2f} s; tables written to {args.out or args.directory}"
+          + (f"; {len(skipped)} unreadable files skipped" if skipped else ""))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
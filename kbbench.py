@@ -0,0 +1,546 @@
+"""Micro-benchmarks for Keyboard Tester Pro.
+
+Run all benchmarks with ``python kbbench.py`` or pick some by name,
+e.g. ``python kbbench.py keysym_lookup``. Each benchmark returns a dict of
+metrics; ``--json FILE`` writes them out so runs can be tracked across releases.
+
+``--xvfb`` starts a private virtual X server for the benchmarks that need a
+display, and ``--baseline FILE`` compares the run against an earlier ``--json``
+output: any time metric more than ``--tolerance`` slower (or a widget count
+that grew) is reported and the exit status is 1.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import time
+import timeit
+import tkinter as tk
+import types
+
+import kbevdev
+import kblog
+import kbstate
+import kbstream
+import kbtyping
+import pythonkytest as kt
+
+
+def _layout_events(index):
+    """(keysym, char) pairs covering every key of a compiled layout."""
+    events = []
+    for key_def in index.key_defs:
+        char = key_def.char_override or (key_def.label if len(key_def.label) == 1 else '')
+        for keysym in sorted(key_def.keysyms):
+            events.append((keysym, char))
+    return events
+
+
+def bench_keysym_lookup(number=20):
+    """Per-event keysym/char -> key id resolution time for every layout."""
+    results = {}
+    print(f"{'Layout':<24}{'keys':>6}{'events':>8}{'warm ns/ev':>12}{'cold ns/ev':>12}")
+    for layout_name in kt.LAYOUTS:
+        index = kt.get_layout_index(layout_name)
+        events = _layout_events(index)
+        lookup, resolve = index.lookup, index._resolve
+        for keysym, char in events: lookup(keysym, char)  # warm the memo
+        warm = min(timeit.repeat(lambda: [lookup(k, c) for k, c in events], number=number, repeat=5))
+        cold = min(timeit.repeat(lambda: [resolve(k, c) for k, c in events], number=number, repeat=5))
+        per_event = 1e9 / (number * len(events))
+        print(f"{layout_name:<24}{len(index.key_defs):>6}{len(events):>8}{warm * per_event:>12.1f}{cold * per_event:>12.1f}")
+        results[f"{layout_name}.warm_ns"] = warm * per_event
+    return results
+
+
+def bench_engine_replay(count=2_000_000):
+    """Events/second through the Tk-free KeyboardStateEngine, with and without a subscriber."""
+    keysyms = sorted({ks for key_def in kt.get_layout_index("QWERTY_Full_US").key_defs for ks in key_def.keysyms})
+    events = kbstate.synthetic_events(count, keysyms)
+    engine = kbstate.KeyboardStateEngine()
+    n, seconds = engine.replay(events, notify=False)
+    print(f"{'rules only':<20}{n:>10} events{n / seconds / 1e6:>8.2f} M events/s")
+    results = {"rules_only.ns_per_event": seconds / n * 1e9}
+    engine.subscribe(lambda *change: None)
+    n, seconds = engine.replay(events[:count // 4])
+    print(f"{'with subscriber':<20}{n:>10} events{n / seconds / 1e6:>8.2f} M events/s")
+    results["with_subscriber.ns_per_event"] = seconds / n * 1e9
+    return results
+
+
+def bench_input_coalesce(count=300_000, frame_sizes=(1, 8, 64)):
+    """Autorepeat storm with a view subscribed to the engine (every event) vs to an InputCoalescer drained every
+    N events: time per raw event and view calls."""
+    events = kbstate.autorepeat_events(count)
+    print(f"{'path':<20}{'events':>9}{'ns/event':>10}{'notified':>10}{'folded':>9}")
+    results = {}
+    for frame_size in (0,) + tuple(frame_sizes):
+        engine = kbstate.KeyboardStateEngine()
+        coalescer = kbstate.InputCoalescer(engine)
+        notified = []
+        (engine if frame_size == 0 else coalescer).subscribe(lambda *change: notified.append(None))
+        start = time.perf_counter()
+        if frame_size == 0:
+            for event in events: engine.feed(*event)
+        else:
+            push, drain = coalescer.push, coalescer.drain
+            for i in range(0, len(events), frame_size):
+                for event in events[i:i + frame_size]: push(*event)
+                drain()
+        ns = (time.perf_counter() - start) / len(events) * 1e9
+        name = "direct" if frame_size == 0 else f"{frame_size} events/frame"
+        print(f"{name:<20}{len(events):>9}{ns:>10.1f}{len(notified):>10}{coalescer.events_folded:>9}")
+        results[f"{name.split()[0]}.ns_per_event"] = ns; results[f"{name.split()[0]}.notified"] = len(notified)
+    return results
+
+
+def bench_evdev_stream(count=200_000):
+    """Recorded evdev byte stream through EvdevReader: reader-thread read + translate, and Tk-side drain into the engine."""
+    rng = random.Random(0)
+    codes = list(range(16, 26)) + list(range(30, 39)) + list(range(44, 51))
+    keys, t = [], 0
+    for _ in range(count // 2):
+        code = rng.choice(codes)
+        keys.append((t, code, kbevdev.KEY_PRESS)); t += 30_000
+        keys.append((t, code, kbevdev.KEY_RELEASE)); t += 20_000
+    data = kbevdev.encode_key_events(keys)
+    start = time.perf_counter()
+    reader = kbevdev.EvdevReader(data)
+    while not reader.finished: time.sleep(0.001)
+    read_s = time.perf_counter() - start
+    engine = kbstate.KeyboardStateEngine()
+    start = time.perf_counter()
+    drained = reader.drain(engine.feed)
+    drain_s = time.perf_counter() - start
+    reader.close()
+    print(f"{len(data) / 1e6:.1f} MB, {reader.records_read} records, {drained} key events")
+    print(f"{'read + translate':<20}{read_s / drained * 1e9:>10.0f} ns/event  (reader thread)")
+    print(f"{'drain into engine':<20}{drain_s / drained * 1e9:>10.0f} ns/event  (Tk thread)")
+    return {"read.ns_per_event": read_s / drained * 1e9, "drain.ns_per_event": drain_s / drained * 1e9}
+
+
+def bench_stream_publish(count=200_000, chunk=500):
+    """Engine feed cost with the event stream server subscribed and a local viewer connected, vs no subscriber.
+    Events are fed in bursts of `chunk` with a 1 ms pause between, roughly a very fast typist on a macro pad."""
+    import asyncio
+    import threading
+    events = kbstate.synthetic_events(count)
+
+    def feed_paced(engine):
+        feed, busy = engine.feed, 0.0
+        for i in range(0, len(events), chunk):
+            start = time.perf_counter()
+            for event in events[i:i + chunk]: feed(*event)
+            busy += time.perf_counter() - start
+            time.sleep(0.001)
+        return busy / len(events) * 1e9
+    baseline = feed_paced(kbstate.KeyboardStateEngine())
+    engine = kbstate.KeyboardStateEngine()
+    server = kbstream.EventStreamServer(port=0, frame_ms=10)
+    engine.subscribe(server.on_state_change)
+    host, port = server.start()
+    received = {}
+    viewer = threading.Thread(target=lambda: received.update(asyncio.run(kbstream.watch(host, port, seconds=len(events) / chunk * 0.0015 + 2, quiet=True))))
+    viewer.start()
+    while not server.clients: time.sleep(0.01)
+    streamed = feed_paced(engine)
+    viewer.join()
+    server.close()
+    print(f"{'no subscriber':<20}{baseline:>10.0f} ns/event")
+    print(f"{'streaming':<20}{streamed:>10.0f} ns/event  ({received.get('events', 0)} of {len(events)} events reached the viewer "
+          f"in {received.get('frames', 0)} frames, {server.dropped} dropped)")
+    return {"baseline.ns_per_event": baseline, "streaming.ns_per_event": streamed}
+
+
+def bench_typing_test(words=500_000, keystrokes=200_000):
+    """Typing Test: word-list index build vs cached open, sampling, and per-keystroke scoring cost."""
+    import tempfile
+    rng = random.Random(0)
+    letters = "etaoinshrdlcumwfgypbvkjxqz"
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "words.txt")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("\n".join("".join(rng.choices(letters, k=rng.randint(1, 12))) for _ in range(words)))
+        start = time.perf_counter(); kbtyping.WordCorpus.open(path).close(); build_ms = (time.perf_counter() - start) * 1000
+        start = time.perf_counter(); corpus = kbtyping.WordCorpus.open(path); open_ms = (time.perf_counter() - start) * 1000
+        start = time.perf_counter(); sample = corpus.sample(rng, 1000, 3, 8); sample_us = (time.perf_counter() - start) * 1e6 / len(sample)
+        start = time.perf_counter(); corpus.sample(rng, 1000, 2, 6, "asdfjkl"); filtered_ms = (time.perf_counter() - start) * 1000
+        corpus.close()
+    index = kt.get_layout_index(next(iter(kt.LAYOUTS)))
+    session = kbtyping.TypingSession(sample, len(index.key_defs), lambda char: index.lookup(char, char)[0] if index.lookup(char, char) else -1)
+    while len(session.target) < keystrokes: session.extend(sample)
+    typed = [char if i % 17 else "x" for i, char in enumerate(session.target[:keystrokes])]
+    start = time.perf_counter()
+    for i, char in enumerate(typed):
+        session.type_char(char, -1, i)
+        if i % 50 == 49: session.backspace(); session.type_char(char, -1, i) # Correction: delete and retype
+    score_ns = (time.perf_counter() - start) / (len(typed) * 1.04) * 1e9 # 2 extra calls every 50 keystrokes
+    start = time.perf_counter(); stats = session.stats(60.0); stats_us = (time.perf_counter() - start) * 1e6
+    print(f"{words} words: index build {build_ms:.0f} ms, cached open {open_ms:.2f} ms")
+    print(f"sample {sample_us:.1f} us/word, first 1000 words with a letter filter {filtered_ms:.1f} ms")
+    print(f"scoring {score_ns:.0f} ns/keystroke, stats {stats_us:.1f} us ({stats['accuracy']:.1f}% accuracy)")
+    return {"index_build.ms": build_ms, "open.ms": open_ms, "sample_per_word.us": sample_us, "score.ns_per_event": score_ns}
+
+
+def bench_log_store(count=1_000_000):
+    """Event Logger store: append cost, filter query time and incremental match upkeep at `count` events."""
+    rng = random.Random(0)
+    index = kt.get_layout_index("QWERTY_Full_US")
+    events = _layout_events(index)
+    keycodes = {keysym: 9 + i for i, (keysym, _char) in enumerate(events)}
+    weights = [1 / (i + 1) for i in range(len(events))] # Zipf-like: a few keys take most of the presses
+    picks = rng.choices(events, weights, k=count // 2)
+    states = rng.choices((0, 0, 0, 0x1, 0x4, 0x10), k=count // 2)
+    store = kblog.EventStore(count)
+    start = time.perf_counter()
+    for i, ((keysym, char), state) in enumerate(zip(picks, states)):
+        store.append(kbstate.PRESS, keysym, char, keycodes[keysym], state, 2 * i)
+        store.append(kbstate.RELEASE, keysym, char, keycodes[keysym], state, 2 * i + 1)
+    append_ns = (time.perf_counter() - start) / count * 1e9
+    print(f"append {append_ns:.0f} ns/event ({len(store)} events)")
+    results = {"append.ns_per_event": append_ns}
+    keycode = keycodes[picks[0][0]]
+    for name, text in (("keycode_release_shift", f"keycode={keycode} release shift"), ("press_ctrl", "press ctrl"),
+                       ("keysym_not_shift", f"keysym={picks[0][0]} -shift")):
+        event_filter = kblog.EventFilter.parse(text)
+        start = time.perf_counter(); view = kblog.FilteredView(store, event_filter); query_ms = (time.perf_counter() - start) * 1000
+        print(f"{text:<32}{len(view):>9} matches {query_ms:>9.2f} ms")
+        results[f"{name}.query_ms"] = query_ms
+    view = kblog.FilteredView(store, kblog.EventFilter.parse(f"keycode={keycode} release shift"))
+    start = time.perf_counter()
+    for i in range(100_000):
+        store.append(kbstate.RELEASE, "a", "a", keycode, i & 1, i)
+        if i % 16 == 15: view.update() # Once per frame at 16 events a frame
+    view.update()
+    update_ns = (time.perf_counter() - start) / 100_000 * 1e9
+    rows = [view.row_at(i) for i in range(0, len(view), max(1, len(view) // 1000))]
+    start = time.perf_counter()
+    for row in rows: view.after(row); view.before(row)
+    jump_us = (time.perf_counter() - start) / (2 * len(rows)) * 1e6
+    print(f"append + match upkeep {update_ns:.0f} ns/event, jump {jump_us:.2f} us")
+    results.update({"append_with_filter.ns_per_event": update_ns, "jump.us": jump_us})
+    return results
+
+
+def bench_key_stats(count=1_000_000):
+    """Heatmap cost: KeyStats press/release time per event and one vectorized recolour per metric (needs NumPy)."""
+    try:
+        import kbstats
+    except ImportError:
+        print("skipped: NumPy is not installed")
+        return {}
+    rng = random.Random(0)
+    stats = kbstats.KeyStats(len(kt.get_layout_index("QWERTY_Full_US").key_defs))
+    strokes = [(rng.randrange(stats.key_count), rng.randint(30, 150), rng.randint(0, 300)) for _ in range(count // 2)]
+    press, release = stats.press, stats.release
+    t = 0
+    start = time.perf_counter()
+    for key_id, dwell, gap in strokes:
+        press(key_id, t); t += dwell
+        release(key_id, t); t += gap
+    ns = (time.perf_counter() - start) / (2 * len(strokes)) * 1e9
+    print(f"{'press/release':<20}{ns:>10.1f} ns/event  ({stats.total_presses} presses)")
+    results = {"update.ns_per_event": ns}
+    for metric in kbstats.METRICS:
+        best = min(timeit.repeat(lambda: kbstats.heat_colors(stats.metric(metric), kt.STYLE_CONFIG["heatmap_colors"]), number=10, repeat=5)) / 10
+        print(f"{metric:<20}{best * 1e3:>10.3f} ms/recolour")
+        results[f"{metric}.recolour_ms"] = best * 1e3
+    return results
+
+
+def count_widgets(widget):
+    """Number of Tk widgets below (and excluding) widget."""
+    return sum(1 + count_widgets(child) for child in widget.winfo_children())
+
+
+def bench_layout_draw(repeat=3):
+    """draw_visual_keyboard time and widget count per layout, for both key renderers. Needs a display."""
+    root = tk.Tk()
+    results = {}
+    try:
+        root.withdraw()
+        app = kt.KeyboardTesterApp(root)
+        saved_kind = kt.STYLE_CONFIG["key_renderer"]
+        print(f"{'Layout':<24}{'renderer':>10}{'widgets':>9}{'items':>7}{'best ms':>10}")
+        for kind in ("buttons", "canvas"):
+            kt.STYLE_CONFIG["key_renderer"] = kind
+            mode = kt.VisualKeyboardDisplayMode(app, app.content_frame)
+            for layout_name in kt.LAYOUTS:
+                best = float("inf")
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    mode.draw_visual_keyboard(layout_name)
+                    best = min(best, time.perf_counter() - start)
+                items = len(mode.renderer.canvas.find_all()) if kind == "canvas" else 0
+                widgets = count_widgets(mode.keyboard_draw_area)
+                print(f"{layout_name:<24}{kind:>10}{widgets:>9}{items:>7}{best * 1e3:>10.2f}")
+                results[f"{kind}.{layout_name}.ms"] = best * 1e3
+                results[f"{kind}.{layout_name}.widgets"] = widgets
+            mode.destroy_ui(); mode.frame.destroy()
+        kt.STYLE_CONFIG["key_renderer"] = saved_kind
+    finally:
+        root.destroy()
+    return results
+
+
+def bench_layout_switch():
+    """Cold (build) vs cached (show/hide) layout switch time through the LRU layout cache. Needs a display."""
+    root = tk.Tk()
+    saved = {k: kt.STYLE_CONFIG[k] for k in ("layout_cache_size", "layout_prebuild_count")}
+    try:
+        root.withdraw()
+        kt.STYLE_CONFIG["layout_cache_size"] = len(kt.LAYOUTS); kt.STYLE_CONFIG["layout_prebuild_count"] = 0
+        app = kt.KeyboardTesterApp(root)
+        mode = app.get_mode("Visual Keyboard")
+        print(f"{'Layout':<24}{'cold ms':>10}{'cached ms':>11}")
+        results, cold = {}, {}
+        for layout_name in kt.LAYOUTS:
+            mode.show_layout(layout_name); cold[layout_name] = mode.last_switch_ms
+        for layout_name in kt.LAYOUTS:
+            mode.show_layout(layout_name)
+            print(f"{layout_name:<24}{cold[layout_name]:>10.2f}{mode.last_switch_ms:>11.2f}")
+            results[f"{layout_name}.cold_ms"] = cold[layout_name]; results[f"{layout_name}.cached_ms"] = mode.last_switch_ms
+        stats = mode.layout_cache_stats()
+        print(f"hits={stats['hits']} misses={stats['misses']} evictions={stats['evictions']}")
+    finally:
+        kt.STYLE_CONFIG.update(saved)
+        root.destroy()
+    return results
+
+
+def bench_mode_switch(rounds=20):
+    """First (build) vs repeat (show/hide) tester mode switch time. Needs a display."""
+    root = tk.Tk()
+    try:
+        root.withdraw()
+        app = kt.KeyboardTesterApp(root)
+        first = {}
+        for mode_name in app.modes:
+            app.switch_mode(mode_name); first[mode_name] = app.last_mode_switch_ms
+        repeat = {mode_name: float("inf") for mode_name in app.modes}
+        for _ in range(rounds):
+            for mode_name in app.modes:
+                app.switch_mode(mode_name); root.update_idletasks()
+                repeat[mode_name] = min(repeat[mode_name], app.last_mode_switch_ms)
+        print(f"{'Mode':<24}{'first ms':>10}{'repeat ms':>11}")
+        results = {}
+        for mode_name in app.modes:
+            print(f"{mode_name:<24}{first[mode_name]:>10.2f}{repeat[mode_name]:>11.2f}")
+            results[f"{mode_name}.first_ms"] = first[mode_name]; results[f"{mode_name}.repeat_ms"] = repeat[mode_name]
+    finally:
+        root.destroy()
+    return results
+
+
+def _key_event_sequence(layout_name, count):
+    """count (keysym, char) pairs cycling over the letter and digit keys of a layout, each meant as a press + release."""
+    pairs = [(k, c) for k, c in _layout_events(kt.get_layout_index(layout_name)) if len(k) == 1 and k.isalnum()]
+    return [pairs[i % len(pairs)] for i in range(count)]
+
+
+def bench_key_events(count=2000):
+    """Per-event cost in the Visual Keyboard: direct on_key_press/on_key_release calls, and end to end through
+    Tk's event queue with event_generate (coalesced and per-event input). Needs a display."""
+    root = tk.Tk()
+    saved = kt.STYLE_CONFIG["input_coalescing"]
+    results = {}
+    try:
+        app = kt.KeyboardTesterApp(root)
+        root.update()
+        mode = app.get_mode("Visual Keyboard")
+        sequence = _key_event_sequence(mode.layout_var.get(), count)
+        events = [types.SimpleNamespace(keysym=k, char=c, keycode=0, state=0, time=i) for i, (k, c) in enumerate(sequence)]
+        start = time.perf_counter()
+        for event in events:
+            mode.on_key_press(event); mode.on_key_release(event)
+        root.update()
+        results["direct.us_per_event"] = (time.perf_counter() - start) / (2 * count) * 1e6
+        for coalescing in (True, False):
+            kt.STYLE_CONFIG["input_coalescing"] = coalescing
+            start = time.perf_counter()
+            for keysym, _char in sequence:
+                root.event_generate("<KeyPress>", keysym=keysym, when="tail")
+                root.event_generate("<KeyRelease>", keysym=keysym, when="tail")
+            root.update()
+            results[f"{'coalesced' if coalescing else 'per_event'}.us_per_event"] = (time.perf_counter() - start) / (2 * count) * 1e6
+        for name, value in results.items(): print(f"{name:<28}{value:>10.2f} us")
+    finally:
+        kt.STYLE_CONFIG["input_coalescing"] = saved
+        root.destroy()
+    return results
+
+
+def bench_log_event(count=2000, sizes=(0, 100_000, 1_000_000)):
+    """Per-event cost of EventLoggerMode.log_event plus its once-per-frame render, and the time to render a
+    scrolled-to page, with the event store already holding `size` events. Needs a display."""
+    root = tk.Tk()
+    results = {}
+    try:
+        root.withdraw()
+        app = kt.KeyboardTesterApp(root)
+        logger = app.get_mode("Event Logger")
+        frame_events = 16
+        print(f"{'stored':>10}{'us/event':>10}{'scroll ms':>11}")
+        for size in sizes:
+            logger.clear_log()
+            for i in range(size): logger.store.append(i & 1, "a", "a", 38, 0, i)
+            logger.render()
+            start = time.perf_counter()
+            for i in range(count):
+                logger.log_event(kt.PRESS if i % 2 == 0 else kt.RELEASE, "a", "a", 38, 0, i)
+                if i % frame_events == frame_events - 1: logger.render()
+            logger.render()
+            per_event = (time.perf_counter() - start) / count * 1e6
+            start = time.perf_counter()
+            for i in range(20): logger.scroll_to(len(logger.shown) * i // 20)
+            scroll_ms = (time.perf_counter() - start) / 20 * 1000
+            logger.scroll_to(len(logger.shown))
+            print(f"{size:>10}{per_event:>10.2f}{scroll_ms:>11.2f}")
+            results[f"events_{size}.us_per_event"] = per_event
+            results[f"events_{size}.scroll_ms"] = scroll_ms
+    finally:
+        root.destroy()
+    return results
+
+
+_IMPORT_PROBE = "import time; t = time.perf_counter(); import pythonkytest; print(time.perf_counter() - t)"
+_FIRST_PAINT_PROBE = """import time; t = time.perf_counter()
+import tkinter as tk, pythonkytest
+root = tk.Tk(); app = pythonkytest.KeyboardTesterApp(root); root.update()
+print(time.perf_counter() - t); root.destroy()"""
+
+
+def _run_probe(code):
+    """Runs code in a fresh interpreter next to this file; returns the seconds it prints, or None if it failed."""
+    proc = subprocess.run([sys.executable, "-c", code], cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True)
+    return float(proc.stdout.strip().splitlines()[-1]) if proc.returncode == 0 else None
+
+
+def bench_startup(repeat=5):
+    """Cold import time, layout compile time and time to first painted keyboard (the latter needs a display)."""
+    import_s = min(_run_probe(_IMPORT_PROBE) for _ in range(repeat))
+    kt.LAYOUTS.clear_compiled()
+    start = time.perf_counter()
+    for layout_name in kt.LAYOUTS: kt.LAYOUTS[layout_name]
+    compile_s = time.perf_counter() - start
+    print(f"{'import pythonkytest':<28}{import_s * 1e3:>9.2f} ms")
+    print(f"{'compile all layouts':<28}{compile_s * 1e3:>9.2f} ms")
+    results = {"import_ms": import_s * 1e3, "compile_all_layouts_ms": compile_s * 1e3}
+    paint_runs = [_run_probe(_FIRST_PAINT_PROBE) for _ in range(repeat)]
+    if None in paint_runs:
+        print(f"{'first painted keyboard':<28}  skipped (no display)")
+    else:
+        print(f"{'first painted keyboard':<28}{min(paint_runs) * 1e3:>9.2f} ms")
+        results["first_paint_ms"] = min(paint_runs) * 1e3
+    return results
+
+
+BENCHMARKS = {
+    "keysym_lookup": bench_keysym_lookup,
+    "engine_replay": bench_engine_replay,
+    "input_coalesce": bench_input_coalesce,
+    "evdev_stream": bench_evdev_stream,
+    "stream_publish": bench_stream_publish,
+    "typing_test": bench_typing_test,
+    "log_store": bench_log_store,
+    "key_stats": bench_key_stats,
+    "layout_draw": bench_layout_draw,
+    "layout_switch": bench_layout_switch,
+    "mode_switch": bench_mode_switch,
+    "key_events": bench_key_events,
+    "log_event": bench_log_event,
+    "startup": bench_startup,
+}
+
+
+def start_virtual_display(geometry="1280x1024x24", timeout=5.0):
+    """Starts Xvfb on a free display number and points DISPLAY at it; returns the process, or None without Xvfb."""
+    executable = shutil.which("Xvfb")
+    if executable is None: return None
+    for number in range(99, 199):
+        if os.path.exists(f"/tmp/.X{number}-lock"): continue
+        proc = subprocess.Popen([executable, f":{number}", "-screen", "0", geometry, "-nolisten", "tcp"],
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline and proc.poll() is None:
+            if os.path.exists(f"/tmp/.X11-unix/X{number}"):
+                os.environ["DISPLAY"] = f":{number}" # Inherited by the startup probes' subprocesses too
+                return proc
+            time.sleep(0.05)
+        proc.kill(); proc.wait()
+    return None
+
+
+# Noise floor per unit: differences smaller than this never count as a regression
+TIME_UNITS = {"ns": 20.0, "us": 1.0, "ms": 0.05}
+
+
+def _metric_unit(metric):
+    for unit in TIME_UNITS:
+        if metric.endswith(unit) or metric.endswith(f"{unit}_per_event"): return unit
+    return None
+
+
+def compare_to_baseline(results, baseline, tolerance):
+    """Lines describing every metric that regressed against a baseline run; times may grow by `tolerance` (a fraction)."""
+    regressions = []
+    for bench, metrics in results.items():
+        for metric, value in metrics.items():
+            old = baseline.get("results", {}).get(bench, {}).get(metric)
+            if old is None: continue
+            unit = _metric_unit(metric)
+            if unit and value > old * (1 + tolerance) and value - old > TIME_UNITS[unit]:
+                regressions.append(f"{bench}.{metric}: {old:.2f} -> {value:.2f} {unit} (+{(value / old - 1) * 100 if old else float('inf'):.0f}%)")
+            elif metric.endswith("widgets") and value > old:
+                regressions.append(f"{bench}.{metric}: {old} -> {value} widgets")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Keyboard Tester Pro benchmarks")
+    parser.add_argument("names", nargs="*", help=f"benchmarks to run (default: all of {', '.join(BENCHMARKS)})")
+    parser.add_argument("--json", metavar="FILE", help="write the collected metrics to FILE")
+    parser.add_argument("--baseline", metavar="FILE", help="compare against a previous --json run and exit 1 on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown against the baseline as a fraction (default 0.25)")
+    parser.add_argument("--xvfb", action="store_true", help="run the display benchmarks on a private Xvfb server")
+    args = parser.parse_args(argv)
+    unknown = [name for name in args.names if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"unknown benchmark(s): {', '.join(unknown)}")
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f: baseline = json.load(f)
+    xvfb = None
+    if args.xvfb:
+        xvfb = start_virtual_display()
+        print(f"Xvfb on {os.environ['DISPLAY']}" if xvfb else "Xvfb not available; display benchmarks will be skipped")
+    results = {}
+    try:
+        for name in args.names or list(BENCHMARKS):
+            print(f"== {name} ==")
+            try:
+                results[name] = BENCHMARKS[name]() or {}
+            except tk.TclError as e:
+                print(f"skipped: {e}")
+    finally:
+        if xvfb: xvfb.terminate(); xvfb.wait()
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"machine": platform.node(), "python": platform.python_version(), "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+                       "results": results}, f, indent=2)
+    if baseline is None: return 0
+    if baseline.get("machine") != platform.node():
+        print(f"note: baseline was recorded on {baseline.get('machine')!r}, this is {platform.node()!r}")
+    regressions = compare_to_baseline(results, baseline, args.tolerance)
+    print(f"== baseline {args.baseline} ==")
+    for line in regressions: print(f"REGRESSION {line}")
+    print(f"{len(regressions)} regression(s) beyond {args.tolerance:.0%}" if regressions else "no regressions")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
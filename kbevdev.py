@@ -0,0 +1,314 @@
+"""Raw Linux evdev keyboard input for Keyboard Tester Pro (no tkinter import).
+
+EvdevReader reads ``struct input_event`` records from a /dev/input/event*
+device on a background thread, in batched non-blocking reads, and turns key
+records into the same (event_type, keysym, char, keycode, state, time) tuples
+the Tk key handlers produce. The Tk thread collects them with drain() from an
+after() loop. Unlike Tk, this sees keys while the window is unfocused and
+keeps what X throws away: the hardware scancode (MSC_SCAN) and the kernel's
+microsecond timestamp of every event.
+
+Keysyms follow the US layout by key position (what a "us" XKB keymap would
+report), keycode is the X keycode (evdev code + 8, as Tk reports it on
+Linux) and state is the X modifier mask before the event. A recorded evdev
+stream (``cat /dev/input/eventN > keys.evdev``), a file object or bytes can
+be read in place of a device, which is how the backend is tested.
+
+Run ``python kbevdev.py [DEVICE|FILE]`` to print translated events.
+"""
+import argparse
+import io
+import os
+import queue
+import select
+import struct
+import sys
+import threading
+import time
+
+from kbmetrics import StreamingHistogram
+from kbstate import PRESS, RELEASE
+
+INPUT_EVENT = struct.Struct("llHHi") # struct input_event: timeval (native longs), type, code, value
+EV_SYN, EV_KEY, EV_MSC, EV_REP = 0x00, 0x01, 0x04, 0x14
+SYN_REPORT, SYN_DROPPED = 0, 3
+MSC_SCAN = 4
+KEY_RELEASE, KEY_PRESS, KEY_REPEAT = 0, 1, 2
+BTN_RANGE = range(0x100, 0x160) # Mouse/joystick buttons share EV_KEY with keys
+X_KEYCODE_OFFSET = 8
+LED_NUML, LED_CAPSL = 0, 1
+EVIOCGLED = 0x80000000 | (8 << 16) | (ord('E') << 8) | 0x19 # _IOR('E', 0x19, 8 bytes)
+
+# X modifier mask bits (event.state)
+X_SHIFT, X_LOCK, X_CONTROL, X_MOD1, X_MOD2, X_MOD4, X_MOD5 = 0x1, 0x2, 0x4, 0x8, 0x10, 0x40, 0x80
+
+# evdev code -> unshifted + shifted character of the printable keys (US positions)
+_PRINTABLE = {2: "1!", 3: "2@", 4: "3#", 5: "4$", 6: "5%", 7: "6^", 8: "7&", 9: "8*", 10: "9(", 11: "0)", 12: "-_", 13: "=+",
+              26: "[{", 27: "]}", 39: ";:", 40: "'\"", 41: "`~", 43: "\\|", 51: ",<", 52: ".>", 53: "/?", 57: "  ", 86: "<>"}
+_PRINTABLE.update({code: letter + letter.upper() for code, letter in zip(range(16, 26), "qwertyuiop")})
+_PRINTABLE.update({code: letter + letter.upper() for code, letter in zip(range(30, 39), "asdfghjkl")})
+_PRINTABLE.update({code: letter + letter.upper() for code, letter in zip(range(44, 51), "zxcvbnm")})
+CHAR_KEYSYMS = {'!': 'exclam', '@': 'at', '#': 'numbersign', '$': 'dollar', '%': 'percent', '^': 'asciicircum',
+                '&': 'ampersand', '*': 'asterisk', '(': 'parenleft', ')': 'parenright', '-': 'minus', '_': 'underscore',
+                '=': 'equal', '+': 'plus', '[': 'bracketleft', '{': 'braceleft', ']': 'bracketright', '}': 'braceright',
+                ';': 'semicolon', ':': 'colon', "'": 'apostrophe', '"': 'quotedbl', '`': 'grave', '~': 'asciitilde',
+                '\\': 'backslash', '|': 'bar', ',': 'comma', '<': 'less', '.': 'period', '>': 'greater', '/': 'slash',
+                '?': 'question', ' ': 'space'}
+# evdev code -> (keysym with Num Lock on, char, keysym with Num Lock off)
+_KEYPAD = {71: ("KP_7", "7", "KP_Home"), 72: ("KP_8", "8", "KP_Up"), 73: ("KP_9", "9", "KP_Prior"),
+           75: ("KP_4", "4", "KP_Left"), 76: ("KP_5", "5", "KP_Begin"), 77: ("KP_6", "6", "KP_Right"),
+           79: ("KP_1", "1", "KP_End"), 80: ("KP_2", "2", "KP_Down"), 81: ("KP_3", "3", "KP_Next"),
+           82: ("KP_0", "0", "KP_Insert"), 83: ("KP_Decimal", ".", "KP_Delete")}
+# evdev code -> (keysym, char) of every other key
+_NAMED = {1: ("Escape", "\x1b"), 14: ("BackSpace", "\x08"), 15: ("Tab", "\t"), 28: ("Return", "\r"), 29: ("Control_L", ""),
+          42: ("Shift_L", ""), 54: ("Shift_R", ""), 55: ("KP_Multiply", "*"), 56: ("Alt_L", ""), 58: ("Caps_Lock", ""),
+          69: ("Num_Lock", ""), 70: ("Scroll_Lock", ""), 74: ("KP_Subtract", "-"), 78: ("KP_Add", "+"), 87: ("F11", ""),
+          88: ("F12", ""), 96: ("KP_Enter", "\r"), 97: ("Control_R", ""), 98: ("KP_Divide", "/"), 99: ("Print", ""),
+          100: ("Alt_R", ""), 102: ("Home", ""), 103: ("Up", ""), 104: ("Prior", ""), 105: ("Left", ""), 106: ("Right", ""),
+          107: ("End", ""), 108: ("Down", ""), 109: ("Next", ""), 110: ("Insert", ""), 111: ("Delete", "\x7f"),
+          119: ("Pause", ""), 125: ("Super_L", ""), 126: ("Super_R", ""), 127: ("Menu", "")}
+_NAMED.update({code: (f"F{n}", "") for n, code in enumerate(range(59, 69), start=1)})
+# evdev code of each modifier key -> X state bit it sets while held
+_MODIFIER_CODES = {42: X_SHIFT, 54: X_SHIFT, 29: X_CONTROL, 97: X_CONTROL, 56: X_MOD1, 100: X_MOD1, 125: X_MOD4, 126: X_MOD4}
+KEY_CAPSLOCK, KEY_NUMLOCK = 58, 69
+
+
+class EvdevTranslator:
+    """Turns evdev records (sec, usec, type, code, value) into ((event tuple), scancode, time_us) triples.
+
+    Tracks held modifiers and the Caps/Num Lock toggles itself, so keysym, char and state are what X
+    would have reported. Autorepeat (value 2) comes out as another press, as it does from Tk.
+    """
+    def __init__(self, caps_lock=False, num_lock=True):
+        self.caps_lock = caps_lock
+        self.num_lock = num_lock
+        self.held_mask = 0 # X state bits of the held modifiers
+        self.held_modifiers = {} # evdev code -> X state bit, for held modifier keys
+        self.scancode = 0 # MSC_SCAN of the current SYN frame
+        self.scancodes = {} # X keycode -> last scancode seen for it
+        self.syn_dropped = 0 # Times the kernel's buffer overflowed and events were lost
+
+    def state(self):
+        return self.held_mask | (X_LOCK if self.caps_lock else 0) | (X_MOD2 if self.num_lock else 0)
+
+    def resolve(self, code):
+        """(keysym, char) for an evdev key code under the current modifier/toggle state."""
+        chars = _PRINTABLE.get(code)
+        if chars is not None:
+            shifted = bool(self.held_mask & X_SHIFT)
+            if chars[0].isalpha(): shifted ^= self.caps_lock
+            char = chars[shifted]
+            keysym = char if char.isalnum() else CHAR_KEYSYMS[char]
+            if self.held_mask & X_CONTROL and chars[0].isalpha(): char = chr(ord(chars[0]) & 0x1F)
+            return keysym, char
+        keypad = _KEYPAD.get(code)
+        if keypad is not None:
+            return (keypad[0], keypad[1]) if self.num_lock and not self.held_mask & X_SHIFT else (keypad[2], "")
+        return _NAMED.get(code, (f"evdev_{code}", ""))
+
+    def translate(self, records):
+        out = []
+        for sec, usec, ev_type, code, value in records:
+            if ev_type == EV_KEY:
+                if code in BTN_RANGE: continue
+                time_us = sec * 1_000_000 + usec
+                keysym, char = self.resolve(code)
+                keycode = code + X_KEYCODE_OFFSET
+                event_type = RELEASE if value == KEY_RELEASE else PRESS
+                if self.scancode: self.scancodes[keycode] = self.scancode
+                scancode = self.scancode or self.scancodes.get(keycode, 0) # Autorepeat frames carry no MSC_SCAN
+                out.append(((event_type, keysym, char, keycode, self.state(), (time_us // 1000) & 0xFFFFFFFF), scancode, time_us))
+                bit = _MODIFIER_CODES.get(code)
+                if bit:
+                    if value == KEY_RELEASE: self.held_modifiers.pop(code, None)
+                    else: self.held_modifiers[code] = bit
+                    self.held_mask = 0
+                    for held_bit in self.held_modifiers.values(): self.held_mask |= held_bit
+                elif value == KEY_PRESS:
+                    if code == KEY_CAPSLOCK: self.caps_lock = not self.caps_lock
+                    elif code == KEY_NUMLOCK: self.num_lock = not self.num_lock
+            elif ev_type == EV_MSC:
+                if code == MSC_SCAN: self.scancode = value & 0xFFFFFFFF
+            elif ev_type == EV_SYN:
+                if code == SYN_DROPPED: self.syn_dropped += 1
+                self.scancode = 0
+        return out
+
+
+class EvdevReader:
+    """Reads an evdev device, file, file object or bytes on a background thread.
+
+    The reader thread does the blocking work (select, batched os.read, unpacking, translation) and puts
+    one list of translated events per read on a SimpleQueue. drain() runs on the Tk thread; while it
+    feeds an event, ``current`` is that event's (scancode, kernel time in us). For a live device the
+    kernel-to-drain delay of every event goes into ``delay_histogram`` (us).
+    """
+    READ_RECORDS = 64
+    POLL_S = 0.1 # select() timeout, so close() is noticed promptly
+
+    def __init__(self, source, record_struct=INPUT_EVENT):
+        self.record_struct = record_struct
+        self.queue = queue.SimpleQueue()
+        self.current = None
+        self.error = None
+        self.finished = False
+        self.records_read = 0
+        self.events_drained = 0
+        self.delay_histogram = StreamingHistogram()
+        self._stop = threading.Event()
+        self._fd = self._file = None
+        caps_lock = num_lock = None
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            self.name, self._file = "<bytes>", io.BytesIO(bytes(source))
+        elif hasattr(source, "read"):
+            self.name, self._file = getattr(source, "name", "<stream>"), source
+        else:
+            self.name = os.fspath(source)
+            self._fd = os.open(self.name, os.O_RDONLY | os.O_NONBLOCK)
+            caps_lock, num_lock = _read_lock_leds(self._fd)
+        self.live = self._fd is not None and not os.path.isfile(self.name)
+        self.translator = EvdevTranslator(*(() if caps_lock is None else (caps_lock, num_lock)))
+        self.scancodes = self.translator.scancodes
+        self._thread = threading.Thread(target=self._read_loop, name="kbevdev-reader", daemon=True)
+        self._thread.start()
+
+    def _read(self, size):
+        """Up to size bytes; b'' at end of input, None if nothing arrived within POLL_S."""
+        if self._fd is None: return self._file.read(size)
+        try:
+            return os.read(self._fd, size)
+        except BlockingIOError:
+            select.select([self._fd], [], [], self.POLL_S)
+            return None
+
+    def _read_loop(self):
+        record_size = self.record_struct.size
+        chunk_size = record_size * self.READ_RECORDS
+        translate = self.translator.translate
+        leftover = b""
+        try:
+            while not self._stop.is_set():
+                data = self._read(chunk_size)
+                if data is None: continue
+                if not data: break
+                if leftover: data = leftover + data
+                usable = len(data) - len(data) % record_size
+                leftover = data[usable:]
+                self.records_read += usable // record_size
+                events = translate(self.record_struct.iter_unpack(data[:usable]))
+                if events: self.queue.put(events)
+        except (OSError, ValueError) as e: # ValueError: the file object was closed under us
+            if not self._stop.is_set(): self.error = e
+        finally:
+            self.finished = True
+
+    def drain(self, feed):
+        """Calls feed(*event) for every event queued since the last drain; returns how many were fed."""
+        count = 0
+        now_us = time.time_ns() // 1000 if self.live else None
+        get = self.queue.get_nowait
+        record_delay = self.delay_histogram.record
+        while True:
+            try: batch = get()
+            except queue.Empty: break
+            for event, scancode, time_us in batch:
+                self.current = (scancode, time_us)
+                if now_us is not None: record_delay(now_us - time_us)
+                feed(*event)
+            count += len(batch)
+        self.current = None
+        self.events_drained += count
+        return count
+
+    @property
+    def syn_dropped(self): return self.translator.syn_dropped
+
+    def close(self):
+        self._stop.set()
+        if self._fd is not None:
+            self._thread.join(2 * self.POLL_S)
+            os.close(self._fd); self._fd = None
+        elif self._file is not None:
+            self._thread.join(2 * self.POLL_S)
+
+
+def _read_lock_leds(fd):
+    """(caps_lock, num_lock) from the device's LED state, or (None, None) if it has no LEDs to ask."""
+    try:
+        import fcntl
+        leds = int.from_bytes(fcntl.ioctl(fd, EVIOCGLED, bytes(8)), "little")
+    except (ImportError, OSError):
+        return None, None
+    return bool(leds & (1 << LED_CAPSL)), bool(leds & (1 << LED_NUML))
+
+
+def find_keyboards(devices_path="/proc/bus/input/devices"):
+    """/dev/input/event* paths of the devices that look like keyboards (a kbd handler plus key autorepeat)."""
+    try:
+        with open(devices_path, encoding="utf-8", errors="replace") as f: text = f.read()
+    except OSError:
+        return []
+    paths = []
+    for block in text.split("\n\n"):
+        handlers, ev_bits = [], 0
+        for line in block.splitlines():
+            if line.startswith("H: Handlers="): handlers = line.split("=", 1)[1].split()
+            elif line.startswith("B: EV="): ev_bits = int(line.split("=", 1)[1], 16)
+        if "kbd" in handlers and ev_bits & (1 << EV_KEY) and ev_bits & (1 << EV_REP):
+            paths.extend(f"/dev/input/{handler}" for handler in handlers if handler.startswith("event"))
+    return paths
+
+
+def encode_key_events(keys, record_struct=INPUT_EVENT):
+    """evdev byte stream for (time_us, evdev code, value[, scancode]) key events, one SYN frame each,
+    as a keyboard driver would emit them (scancode defaults to the evdev code)."""
+    pack = record_struct.pack
+    out = bytearray()
+    for key in keys:
+        time_us, code, value = key[:3]
+        sec, usec = divmod(time_us, 1_000_000)
+        if value != KEY_REPEAT: out += pack(sec, usec, EV_MSC, MSC_SCAN, key[3] if len(key) > 3 else code)
+        out += pack(sec, usec, EV_KEY, code, value)
+        out += pack(sec, usec, EV_SYN, SYN_REPORT, 0)
+    return bytes(out)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Print the key events Keyboard Tester Pro would get from an evdev device or recording")
+    parser.add_argument("source", nargs="?", help="/dev/input/eventN or a recorded evdev stream (default: the first keyboard found)")
+    parser.add_argument("--list", action="store_true", help="list the keyboards found under /dev/input and exit")
+    args = parser.parse_args(argv)
+    keyboards = find_keyboards()
+    if args.list:
+        print("\n".join(keyboards) or "no keyboards found")
+        return 0
+    source = args.source or (keyboards[0] if keyboards else None)
+    if source is None:
+        print("no keyboard found under /dev/input; pass a device or recorded stream", file=sys.stderr)
+        return 1
+    try:
+        reader = EvdevReader(source)
+    except OSError as e:
+        print(f"cannot open {source}: {e} (reading /dev/input usually needs the 'input' group)", file=sys.stderr)
+        return 1
+
+    def show(event_type, keysym, char, keycode, state, time_ms):
+        scancode, time_us = reader.current
+        print(f"{'Press' if event_type == PRESS else 'Release':<8} {keysym:<14} char {char!r:<7} keycode {keycode:<4} "
+              f"scan {scancode:#06x}  state {state:#06x}  t {time_us // 1_000_000}.{time_us % 1_000_000:06d}")
+    try:
+        while not (reader.finished and reader.queue.empty()):
+            reader.drain(show)
+            time.sleep(0.01)
+        reader.drain(show)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        reader.close()
+    if reader.error: print(f"read error: {reader.error}", file=sys.stderr)
+    print(f"{reader.records_read} records, {reader.events_drained} key events, {reader.syn_dropped} overflows", file=sys.stderr)
+    return 1 if reader.error else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,185 @@
+"""Streaming switch-health analysis for Keyboard Tester Pro (no tkinter import).
+
+KeyHealthAnalyzer watches a stream of (event_type, keysym, char, keycode, state, time)
+tuples, live (as a KeyboardStateEngine subscriber) or from a recorded .kbts session, and flags:
+
+    chatter           a press of a key less than chatter_ms after that key's release
+    missing release   a key pressed again while still down, with no autorepeat in between,
+                      or still down when the session ends (stuck)
+    orphan release    a release of a key that was never seen going down (a lost press)
+    ghost suspect     a press that lands within ghost_window_ms of another press while two or
+                      more keys are already held, the usual signature of matrix ghosting
+
+X11 sends autorepeat as a release and a press with one timestamp; such a pair
+after the key has been down for repeat_delay_ms counts as a repeat, not as
+chatter. The largest rollover (keys down at once) is measured too. Work per
+event is O(1) and memory is one small record per distinct key.
+
+Run ``python kbhealth.py SESSION.kbts [...]`` to analyze recorded sessions.
+"""
+import argparse
+import json
+import sys
+
+from kbstate import PRESS
+
+FAULTS = ("chatter", "missing_releases", "orphan_releases", "ghost_suspects")
+
+
+class KeyRecord:
+    """Per-key counters; times are event times in ms, -1 when unset."""
+    __slots__ = ("keysym", "char", "keycode", "down_since", "last_down_since", "last_seen", "last_release", "presses", "repeats",
+                 "chatter", "min_gap_ms", "missing_releases", "orphan_releases", "ghost_suspects")
+
+    def __init__(self, keysym, char, keycode):
+        self.keysym = keysym; self.char = char; self.keycode = keycode
+        self.down_since = self.last_down_since = self.last_seen = self.last_release = -1
+        self.presses = self.repeats = 0
+        self.chatter = self.missing_releases = self.orphan_releases = self.ghost_suspects = 0
+        self.min_gap_ms = None
+
+    def faults(self):
+        return {name: getattr(self, name) for name in FAULTS if getattr(self, name)}
+
+    def as_dict(self, stuck=False):
+        record = {"keysym": self.keysym, "keycode": self.keycode, "presses": self.presses, "repeats": self.repeats,
+                  "min_release_to_press_ms": self.min_gap_ms, "stuck": stuck}
+        record.update({name: getattr(self, name) for name in FAULTS})
+        return record
+
+
+class KeyHealthAnalyzer:
+    """Flags chatter, missing/orphan releases and likely ghosting, and tracks maximum rollover.
+
+    Keys are identified by keycode (by keysym when the keycode is 0, e.g. synthetic events). Pass the
+    engine's currently_pressed_physical_keys as pressed_keys to share it when running live; otherwise the
+    analyzer keeps its own {key id: keysym} map. ``revision`` goes up whenever a new fault is found and ``last_finding``
+    describes it, so a UI can poll cheaply.
+    """
+    def __init__(self, chatter_ms=10, ghost_window_ms=2, repeat_gap_ms=500, repeat_delay_ms=150, pressed_keys=None):
+        self.chatter_ms = chatter_ms
+        self.ghost_window_ms = ghost_window_ms
+        self.repeat_gap_ms = repeat_gap_ms # A re-press later than this after the last press/repeat is not autorepeat
+        self.repeat_delay_ms = repeat_delay_ms # Shortest hold after which a zero-gap release/press pair is X11 autorepeat
+        self._owns_pressed = pressed_keys is None
+        self.pressed_keys = {} if pressed_keys is None else pressed_keys
+        self.revision = 0
+        self.reset()
+
+    def reset(self):
+        self.keys = {}
+        self.events = 0
+        self.max_rollover = 0
+        self.max_rollover_keys = ()
+        self.suspects = {} # keysym -> char of every key with at least one fault
+        self.revision += 1 # Never goes back, so pollers also notice a reset
+        self.last_finding = None
+        self._last_press_ms = -1
+        if self._owns_pressed: self.pressed_keys.clear()
+
+    def _flag(self, record, fault, detail):
+        setattr(record, fault, getattr(record, fault) + 1)
+        self.suspects[record.keysym] = record.char
+        self.revision += 1
+        self.last_finding = f"{fault.replace('_', ' ')}: {record.keysym} {detail}".rstrip()
+        return fault
+
+    def feed(self, event_type, keysym, char='', keycode=0, state=0, time=0):
+        """Analyzes one event; returns the name of the fault it revealed, or None."""
+        self.events += 1
+        key = keycode or keysym
+        record = self.keys.get(key)
+        if record is None: record = self.keys[key] = KeyRecord(keysym, char, keycode)
+        finding = None
+        if event_type == PRESS:
+            if self._owns_pressed: self.pressed_keys[key] = keysym
+            down_since = time
+            if record.down_since >= 0:
+                if time - record.last_seen <= self.repeat_gap_ms:
+                    record.repeats += 1; record.last_seen = time
+                    return None
+                finding = self._flag(record, "missing_releases", f"(down since {record.down_since} ms)")
+            elif record.last_release >= 0:
+                gap = time - record.last_release
+                if gap == 0 and record.last_down_since >= 0: # Released and pressed at once: the hold goes on
+                    down_since = record.last_down_since
+                    if time - down_since >= self.repeat_delay_ms:
+                        record.repeats += 1; record.down_since = down_since; record.last_seen = time
+                        return None
+                if record.min_gap_ms is None or gap < record.min_gap_ms: record.min_gap_ms = gap
+                if 0 <= gap < self.chatter_ms: finding = self._flag(record, "chatter", f"({gap} ms after release)")
+            held = len(self.pressed_keys) - 1
+            if held >= 2 and 0 <= time - self._last_press_ms <= self.ghost_window_ms:
+                finding = self._flag(record, "ghost_suspects", f"({held} keys held)")
+            record.presses += 1
+            record.down_since = down_since; record.last_seen = time
+            self._last_press_ms = time
+            if held + 1 > self.max_rollover:
+                self.max_rollover = held + 1; self.max_rollover_keys = tuple(sorted(self.pressed_keys.values()))
+        else:
+            if self._owns_pressed: self.pressed_keys.pop(key, None)
+            if record.down_since < 0:
+                finding = self._flag(record, "orphan_releases", "")
+            record.last_down_since = record.down_since
+            record.down_since = -1
+            record.last_release = time
+        return finding
+
+    def on_state_change(self, event_type, keysym, char, keycode, state, time, modifiers_changed):
+        """KeyboardStateEngine subscriber signature."""
+        self.feed(event_type, keysym, char, keycode, state, time)
+
+    def report(self):
+        """Summary dict: totals, max rollover and one entry per suspect key (keys still down count as stuck)."""
+        suspects, totals = [], dict.fromkeys(FAULTS, 0)
+        for record in self.keys.values():
+            stuck = record.down_since >= 0
+            for name in FAULTS: totals[name] += getattr(record, name)
+            if stuck or record.faults(): suspects.append(record.as_dict(stuck))
+        totals["stuck"] = sum(1 for s in suspects if s["stuck"])
+        suspects.sort(key=lambda s: -sum(s[name] for name in FAULTS))
+        return {"events": self.events, "keys_seen": len(self.keys), "max_rollover": self.max_rollover,
+                "max_rollover_keys": list(self.max_rollover_keys), "chatter_ms": self.chatter_ms,
+                "ghost_window_ms": self.ghost_window_ms, "totals": totals, "suspects": suspects}
+
+    def summary_text(self):
+        report = self.report()
+        totals = report["totals"]
+        lines = [f"{report['events']} events, {report['keys_seen']} keys, max rollover {report['max_rollover']}",
+                 "  ".join(f"{name.replace('_', ' ')}: {totals[name]}" for name in FAULTS + ("stuck",))]
+        for suspect in report["suspects"][:10]:
+            faults = [f"{name.replace('_', ' ')} {suspect[name]}" for name in FAULTS if suspect[name]]
+            if suspect["stuck"]: faults.append("stuck")
+            lines.append(f"  {suspect['keysym']:<14} {', '.join(faults)}")
+        return "\n".join(lines)
+
+
+def analyze_session(path, **options):
+    """Runs a KeyHealthAnalyzer over a recorded .kbts session and returns it."""
+    from kbrecord import SessionReader
+    analyzer = KeyHealthAnalyzer(**options)
+    feed = analyzer.feed
+    with SessionReader(path) as reader:
+        for event in reader.iter_events(): feed(*event)
+    return analyzer
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Keyboard Tester Pro switch-health report for recorded sessions")
+    parser.add_argument("sessions", nargs="+", help=".kbts files to analyze")
+    parser.add_argument("--chatter-ms", type=int, default=10, help="release-to-press gap below which a press counts as chatter")
+    parser.add_argument("--ghost-window-ms", type=int, default=2, help="press spacing that counts as simultaneous for ghost detection")
+    parser.add_argument("--json", metavar="FILE", help="write the reports to FILE")
+    args = parser.parse_args(argv)
+    reports = {}
+    for path in args.sessions:
+        analyzer = analyze_session(path, chatter_ms=args.chatter_ms, ghost_window_ms=args.ghost_window_ms)
+        print(f"== {path} ==\n{analyzer.summary_text()}")
+        reports[path] = analyzer.report()
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f: json.dump(reports, f, indent=2)
+    return 1 if any(r["suspects"] for r in reports.values()) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,351 @@
+"""Columnar in-memory event log for Keyboard Tester Pro (no tkinter import).
+
+EventStore keeps every logged key event as one row across typed arrays
+(type, keysym id, char id, keycode, state, time, evdev scancode and kernel
+time), so a million events take tens of megabytes rather than a million
+tuples. Rows have stable ids that keep counting up across clear() and
+capacity trimming. Alongside the columns the store maintains sorted row-id
+lists ("postings") per keysym, keycode, event type and set `state` bit;
+appending an event adds its id to a handful of them.
+
+EventFilter answers queries such as "keycode 38 releases with Shift held"
+by walking the shortest posting list involved and checking the other
+conditions against the columns. FilteredView keeps a filter's matches
+current by querying only the rows added since its last update, so the log
+view can filter, count and jump between matches at millions of events.
+
+Filter syntax (terms are ANDed; values may be comma-separated lists):
+
+    press | release                  event type
+    keycode=38  kc=38,39             keycodes
+    keysym=a,A  ks=Return  Return    keysyms (a bare word that is not a modifier name)
+    shift  ctrl  alt  super  ...     modifier held (X11 state bits; see STATE_BIT_NAMES)
+    -shift  !caps                    modifier not held
+    state=0x14                       all of these state bits held
+
+    python kblog.py session.kbts "keycode=38 release shift" --limit 20
+"""
+import argparse
+import array
+import bisect
+import heapq
+import sys
+import time
+
+from kbrecord import SessionReader
+from kbstate import PRESS, RELEASE
+
+DEFAULT_CAPACITY = 2_000_000
+NO_KERNEL_TIME = -1 # kernel_us of rows that did not come from the evdev backend
+
+# X11 modifier state bits as Tk reports them in event.state. Other platforms use
+# other bits; state=MASK works with any of them.
+STATE_BIT_NAMES = {
+    "shift": 0x1, "lock": 0x2, "caps": 0x2, "control": 0x4, "ctrl": 0x4,
+    "mod1": 0x8, "alt": 0x8, "mod2": 0x10, "numlock": 0x10, "mod3": 0x20,
+    "mod4": 0x40, "super": 0x40, "mod5": 0x80, "altgr": 0x80,
+}
+
+
+def _bits(mask):
+    while mask:
+        low = mask & -mask
+        yield low
+        mask ^= low
+
+
+class EventStore:
+    """Bounded columnar event store with incrementally maintained row indexes.
+
+    Row ids run from `base` to `end` (exclusive). Once `capacity` rows are held, the oldest half is
+    dropped in one go: every column and posting list is cut with a single slice, so trimming costs
+    O(1) amortized per event however long the session runs.
+    """
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        self.capacity = max(2, capacity)
+        self.strings = [""]
+        self._string_ids = {"": 0}
+        self.dropped = 0 # Rows trimmed for capacity (clear() does not count)
+        self.base = 0
+        self._reset()
+
+    def _reset(self):
+        self.types = array.array("B"); self.keysyms = array.array("I"); self.chars = array.array("I")
+        self.keycodes = array.array("I"); self.states = array.array("I"); self.times = array.array("I")
+        self.scancodes = array.array("I"); self.kernel_us = array.array("q")
+        self.by_keysym = {}; self.by_keycode = {}; self.by_type = {}; self.by_state_bit = {}
+
+    def _columns(self):
+        return (self.types, self.keysyms, self.chars, self.keycodes, self.states, self.times, self.scancodes, self.kernel_us)
+
+    def _indexes(self):
+        return (self.by_keysym, self.by_keycode, self.by_type, self.by_state_bit)
+
+    def __len__(self): return len(self.types)
+
+    @property
+    def end(self): return self.base + len(self.types)
+
+    def string_id(self, text):
+        """Interned id of a keysym/char string, or None if no stored event used it."""
+        return self._string_ids.get(text)
+
+    def _intern(self, text):
+        string_id = self._string_ids[text] = len(self.strings)
+        self.strings.append(text)
+        return string_id
+
+    def append(self, event_type, keysym, char, keycode, state, time_ms, raw=None):
+        """Stores one event; raw is the evdev backend's (scancode, kernel time in us), if any. Returns the row id."""
+        if len(self.types) >= self.capacity: self._trim(len(self.types) // 2)
+        row = self.base + len(self.types)
+        ids = self._string_ids
+        keysym_id = ids.get(keysym)
+        if keysym_id is None: keysym_id = self._intern(keysym)
+        char_id = ids.get(char)
+        if char_id is None: char_id = self._intern(char)
+        self.types.append(event_type); self.keysyms.append(keysym_id); self.chars.append(char_id)
+        self.keycodes.append(keycode); self.states.append(state); self.times.append(time_ms & 0xFFFFFFFF)
+        if raw is None: self.scancodes.append(0); self.kernel_us.append(NO_KERNEL_TIME)
+        else: self.scancodes.append(raw[0]); self.kernel_us.append(raw[1])
+        for index, key in ((self.by_keysym, keysym_id), (self.by_keycode, keycode), (self.by_type, event_type)):
+            rows = index.get(key)
+            if rows is None: rows = index[key] = array.array("q")
+            rows.append(row)
+        by_bit = self.by_state_bit
+        while state:
+            bit = state & -state
+            rows = by_bit.get(bit)
+            if rows is None: rows = by_bit[bit] = array.array("q")
+            rows.append(row)
+            state ^= bit
+        return row
+
+    def _trim(self, count):
+        """Drops the oldest `count` rows. Posting lists are sorted, so each is cut after one bisect."""
+        self.base += count; self.dropped += count
+        for column in self._columns(): del column[:count]
+        for index in self._indexes():
+            for key, rows in list(index.items()):
+                cut = bisect.bisect_left(rows, self.base)
+                if cut == len(rows): del index[key]
+                elif cut: del rows[:cut]
+
+    def clear(self):
+        """Forgets every row; ids carry on from the current end so open views notice."""
+        self.base = self.end
+        self._reset()
+
+    def truncate(self, end):
+        """Drops the rows from id `end` on (e.g. synthetic input); their ids are given out again. Views drop them on update()."""
+        keep = max(end, self.base) - self.base
+        if keep >= len(self.types): return
+        for column in self._columns(): del column[keep:]
+        end = self.base + keep
+        for index in self._indexes():
+            for key, rows in list(index.items()):
+                cut = bisect.bisect_left(rows, end)
+                if cut == 0: del index[key]
+                elif cut < len(rows): del rows[cut:]
+
+    def row(self, row_id):
+        """(event_type, keysym, char, keycode, state, time, raw) for a stored row; raw is None unless it came from evdev."""
+        i = row_id - self.base
+        if not 0 <= i < len(self.types): raise IndexError(row_id)
+        kernel_us = self.kernel_us[i]
+        return (self.types[i], self.strings[self.keysyms[i]], self.strings[self.chars[i]], self.keycodes[i], self.states[i],
+                self.times[i], None if kernel_us == NO_KERNEL_TIME else (self.scancodes[i], kernel_us))
+
+    def format_row(self, row_id):
+        """One log line for a row."""
+        event_type, keysym, char, keycode, state, _time, raw = self.row(row_id)
+        line = (f"{row_id:>9}  {'Press' if event_type == PRESS else 'Release':<8} Keysym: '{keysym}', Char: {char!r}, "
+                f"KeyCode: {keycode}, State: {hex(state)}")
+        if raw: line += f", Scan: {hex(raw[0])}, Kernel: {raw[1] // 1_000_000}.{raw[1] % 1_000_000:06d}"
+        return line
+
+
+class EventFilter:
+    """Conjunction of event conditions; None/0 fields do not constrain."""
+    __slots__ = ("keysyms", "keycodes", "event_type", "state_all", "state_none")
+
+    def __init__(self, keysyms=None, keycodes=None, event_type=None, state_all=0, state_none=0):
+        self.keysyms = frozenset(keysyms) if keysyms is not None else None
+        self.keycodes = frozenset(keycodes) if keycodes is not None else None
+        self.event_type = event_type
+        self.state_all = state_all
+        self.state_none = state_none
+
+    @property
+    def empty(self):
+        return self.keysyms is None and self.keycodes is None and self.event_type is None and not self.state_all and not self.state_none
+
+    @classmethod
+    def parse(cls, text):
+        """Filter from the syntax in the module docstring; raises ValueError on a malformed term."""
+        keysyms = keycodes = event_type = None
+        state_all = state_none = 0
+        for term in text.split():
+            name, sep, value = term.partition("=")
+            lowered = name.lower()
+            if sep:
+                values = [v for v in value.split(",") if v]
+                if not values: raise ValueError(f"'{term}' has no value")
+                if lowered in ("keycode", "kc"):
+                    try: keycodes = (keycodes or set()) | {int(v, 0) for v in values}
+                    except ValueError: raise ValueError(f"'{term}': keycodes are numbers") from None
+                elif lowered in ("keysym", "ks"): keysyms = (keysyms or set()) | set(values)
+                elif lowered == "state":
+                    try: state_all |= int(value, 0)
+                    except ValueError: raise ValueError(f"'{term}': state is a number such as 0x4") from None
+                else: raise ValueError(f"unknown filter field '{name}' (keycode, keysym, state)")
+            elif lowered in ("press", "release"):
+                event_type = PRESS if lowered == "press" else RELEASE
+            elif term[0] in "-!" and len(term) > 1:
+                bit = STATE_BIT_NAMES.get(lowered[1:])
+                if bit is None: raise ValueError(f"'{term}': unknown modifier (one of {', '.join(STATE_BIT_NAMES)})")
+                state_none |= bit
+            elif lowered in STATE_BIT_NAMES: state_all |= STATE_BIT_NAMES[lowered]
+            else: keysyms = (keysyms or set()) | {term}
+        if state_all & state_none: raise ValueError("a modifier cannot be both required and excluded")
+        return cls(keysyms, keycodes, event_type, state_all, state_none)
+
+    def describe(self):
+        terms = []
+        if self.event_type is not None: terms.append("press" if self.event_type == PRESS else "release")
+        if self.keysyms is not None: terms.append("keysym=" + ",".join(sorted(self.keysyms)))
+        if self.keycodes is not None: terms.append("keycode=" + ",".join(map(str, sorted(self.keycodes))))
+        if self.state_all: terms.append(f"state={hex(self.state_all)}")
+        if self.state_none: terms.append(f"not state {hex(self.state_none)}")
+        return " ".join(terms) or "all events"
+
+    def matches_index(self, store, i):
+        """Whether the row at column position i (row id - store.base) passes."""
+        if self.event_type is not None and store.types[i] != self.event_type: return False
+        if self.keycodes is not None and store.keycodes[i] not in self.keycodes: return False
+        if self.keysyms is not None and store.strings[store.keysyms[i]] not in self.keysyms: return False
+        state = store.states[i]
+        return state & self.state_all == self.state_all and not state & self.state_none
+
+    def _posting_sets(self, store):
+        """One list of posting arrays per indexed condition; a condition's rows are the union of its arrays."""
+        sets = []
+        if self.keysyms is not None:
+            sets.append([store.by_keysym.get(store.string_id(keysym)) for keysym in self.keysyms])
+        if self.keycodes is not None: sets.append([store.by_keycode.get(keycode) for keycode in self.keycodes])
+        if self.event_type is not None: sets.append([store.by_type.get(self.event_type)])
+        for bit in _bits(self.state_all): sets.append([store.by_state_bit.get(bit)])
+        return [[rows for rows in arrays if rows] for arrays in sets]
+
+    def query(self, store, start=0):
+        """Sorted array of the matching row ids >= start.
+
+        Only the rows of the shortest posting list involved are visited; the other conditions are
+        checked against the columns. (Intersecting the lists as sets would walk the long ones, such
+        as every release, in full.)
+        """
+        start = max(start, store.base)
+        base = store.base
+        sets = self._posting_sets(store)
+        if not sets: # Only excluded modifiers (or nothing): scan the rows
+            return array.array("q", (row for row in range(start, store.end) if self.matches_index(store, row - base)))
+        tails = min(([rows[bisect.bisect_left(rows, start):] for rows in arrays] for arrays in sets), key=lambda tails: sum(map(len, tails)))
+        candidates = tails[0] if len(tails) == 1 else array.array("q", heapq.merge(*tails))
+        if len(sets) == 1 and not self.state_none: return candidates # The posting lists are the answer
+        # matches_index inlined: this loop is most of a query's time
+        types, keycodes, keysyms, states, strings = store.types, store.keycodes, store.keysyms, store.states, store.strings
+        event_type, wanted_keycodes, wanted_keysyms, state_all, state_none = self.event_type, self.keycodes, self.keysyms, self.state_all, self.state_none
+        return array.array("q", (row for row in candidates
+                                 if (event_type is None or types[row - base] == event_type)
+                                 and (wanted_keycodes is None or keycodes[row - base] in wanted_keycodes)
+                                 and (wanted_keysyms is None or strings[keysyms[row - base]] in wanted_keysyms)
+                                 and states[row - base] & state_all == state_all and not states[row - base] & state_none))
+
+
+class FilteredView:
+    """The rows of a store that pass a filter, as a sorted sequence kept current by update().
+
+    An empty filter is every stored row and needs no id list at all.
+    """
+    def __init__(self, store, event_filter=None):
+        self.store = store
+        self.rows = array.array("q")
+        self.checked = store.base # Rows below this id have been tested against the filter
+        self.set_filter(event_filter or EventFilter())
+
+    def set_filter(self, event_filter):
+        self.filter = event_filter
+        self.rows = array.array("q")
+        self.checked = self.store.base
+        self.update()
+
+    def update(self):
+        """Adds matches among rows stored since the last update and forgets rows the store trimmed or truncated."""
+        store = self.store
+        if self.filter.empty: self.checked = store.end; return
+        rows = self.rows
+        if rows and rows[0] < store.base: del rows[:bisect.bisect_left(rows, store.base)]
+        if self.checked > store.end:
+            del rows[bisect.bisect_left(rows, store.end):]
+            self.checked = store.end
+        if self.checked < store.end:
+            rows.extend(self.filter.query(store, self.checked))
+            self.checked = store.end
+
+    def __len__(self):
+        return len(self.store) if self.filter.empty else len(self.rows)
+
+    def row_at(self, position):
+        return self.store.base + position if self.filter.empty else self.rows[position]
+
+    def position_of(self, row):
+        """Position of the first shown row >= row."""
+        if self.filter.empty: return max(0, min(row, self.store.end) - self.store.base)
+        return bisect.bisect_left(self.rows, row)
+
+    def __contains__(self, row):
+        if self.filter.empty: return self.store.base <= row < self.store.end
+        i = bisect.bisect_left(self.rows, row)
+        return i < len(self.rows) and self.rows[i] == row
+
+    def after(self, row):
+        """First matching row id > row, or None."""
+        i = self.position_of(row + 1)
+        return self.row_at(i) if i < len(self) else None
+
+    def before(self, row):
+        """Last matching row id < row, or None."""
+        i = self.position_of(row)
+        return self.row_at(i - 1) if i > 0 else None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Filter the key events of a recorded .kbts session")
+    parser.add_argument("session")
+    parser.add_argument("filter", nargs="?", default="", help="e.g. \"keycode=38 release shift\"")
+    parser.add_argument("--limit", type=int, default=50, help="matching rows to print (0: only count them)")
+    args = parser.parse_args(argv)
+    try: event_filter = EventFilter.parse(args.filter)
+    except ValueError as e:
+        print(f"Bad filter: {e}", file=sys.stderr)
+        return 2
+    start = time.perf_counter()
+    try:
+        with SessionReader(args.session) as reader:
+            store = EventStore(max(len(reader), 2))
+            for event in reader.iter_events(): store.append(*event)
+    except (OSError, ValueError) as e:
+        print(f"Cannot read {args.session}: {e}", file=sys.stderr)
+        return 1
+    load_s = time.perf_counter() - start
+    start = time.perf_counter()
+    view = FilteredView(store, event_filter)
+    query_ms = (time.perf_counter() - start) * 1e3
+    for position in range(min(len(view), args.limit)): print(store.format_row(view.row_at(position)))
+    print(f"{len(view)} of {len(store)} events match {event_filter.describe()} "
+          f"(loaded in {load_s:.2f} s, filtered in {query_ms:.1f} ms)", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
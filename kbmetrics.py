@@ -0,0 +1,64 @@
+"""Low-overhead streaming metrics for Keyboard Tester Pro (no tkinter import)."""
+import math
+
+
+class StreamingHistogram:
+    """Log-linear histogram of non-negative integer samples (e.g. microseconds).
+
+    record() is O(1) and memory is bounded: values below 64 get exact buckets, and
+    every power of two above that is split into 32 sub-buckets (about 3% precision).
+    Values above max_value land in the last bucket; the exact maximum is kept aside.
+    """
+    SUB_BUCKET_BITS = 5
+
+    def __init__(self, max_value=60_000_000):
+        self.max_value = max_value
+        self.counts = [0] * (self.bucket_index(max_value) + 1)
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    @classmethod
+    def bucket_index(cls, value):
+        bits = value.bit_length()
+        if bits <= cls.SUB_BUCKET_BITS + 1: return value
+        shift = bits - cls.SUB_BUCKET_BITS - 1
+        return (shift << cls.SUB_BUCKET_BITS) + (value >> shift)
+
+    @classmethod
+    def bucket_bounds(cls, index):
+        """Inclusive (low, high) value range of a bucket."""
+        if index < 1 << (cls.SUB_BUCKET_BITS + 1): return index, index
+        shift = (index >> cls.SUB_BUCKET_BITS) - 1
+        mantissa = index - (shift << cls.SUB_BUCKET_BITS)
+        return mantissa << shift, ((mantissa + 1) << shift) - 1
+
+    def record(self, value):
+        value = int(value)
+        if value < 0: value = 0
+        self.counts[self.bucket_index(value) if value <= self.max_value else -1] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max: self.max = value
+
+    def reset(self):
+        self.counts = [0] * len(self.counts)
+        self.count = 0; self.total = 0; self.max = 0
+
+    def percentile(self, pct):
+        """Upper bound of the bucket holding the pct-th percentile (0 when empty)."""
+        if not self.count: return 0
+        target = max(1, math.ceil(self.count * pct / 100.0))
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= target: return min(self.bucket_bounds(index)[1], self.max)
+        return self.max
+
+    def summary(self):
+        return {"count": self.count, "mean": self.total / self.count if self.count else 0.0,
+                "p50": self.percentile(50), "p95": self.percentile(95), "p99": self.percentile(99), "max": self.max}
+
+    def nonzero_buckets(self):
+        """[(low, high, count)] for every bucket that has samples."""
+        return [(*self.bucket_bounds(i), c) for i, c in enumerate(self.counts) if c]
@@ -0,0 +1,109 @@
+"""Switchable hot-path timers for Keyboard Tester Pro (no tkinter import).
+
+HotPathProfiler wraps a list of methods with perf_counter_ns timers by
+replacing the class attributes while enabled and putting the original
+functions back when disabled, so a switched-off profiler costs nothing.
+Callbacks bound before enable() (Tk bindings, engine subscribers) keep
+calling the originals, so profile the methods they delegate to. Times are
+inclusive: a timed method that calls another timed method counts both.
+cProfile and pstats are only imported once a cProfile run is started.
+"""
+import functools
+import io
+import time
+
+
+class HotPathProfiler:
+    """Per-method call counts and times for (owner class, attribute name) targets.
+
+    counters[name] is [calls, total_ns, max_ns] since the last reset(); window() returns what changed
+    since the previous window() call, which is what a periodically refreshed display wants.
+    """
+    def __init__(self, targets):
+        self.targets = list(targets)
+        self.counters = {}
+        self._originals = []
+        self._window_base = {}
+        self._window_start = time.perf_counter()
+        self._cprofile = None
+
+    @property
+    def enabled(self):
+        return bool(self._originals)
+
+    def enable(self):
+        if self._originals: return
+        for owner, attribute in self.targets:
+            original = owner.__dict__[attribute]
+            name = f"{owner.__name__}.{attribute}"
+            setattr(owner, attribute, self._timed(name, original))
+            self._originals.append((owner, attribute, original))
+        self._window_base = {name: list(c) for name, c in self.counters.items()}
+        self._window_start = time.perf_counter()
+
+    def disable(self):
+        for owner, attribute, original in reversed(self._originals): setattr(owner, attribute, original)
+        self._originals.clear()
+
+    def reset(self):
+        for counters in self.counters.values(): counters[:] = [0, 0, 0]
+        self._window_base.clear()
+        self._window_start = time.perf_counter()
+
+    def _timed(self, name, function):
+        counters = self.counters.setdefault(name, [0, 0, 0])
+        clock = time.perf_counter_ns
+
+        @functools.wraps(function)
+        def timed(*args, **kwargs):
+            start = clock()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                elapsed = clock() - start
+                counters[0] += 1; counters[1] += elapsed
+                if elapsed > counters[2]: counters[2] = elapsed
+        return timed
+
+    def window(self):
+        """(seconds, {name: (calls, total_ns)}) accumulated since the previous window() call."""
+        now = time.perf_counter()
+        seconds, self._window_start = now - self._window_start, now
+        deltas = {}
+        for name, (calls, total_ns, _max_ns) in self.counters.items():
+            base_calls, base_ns = self._window_base.get(name, (0, 0, 0))[:2]
+            if calls > base_calls: deltas[name] = (calls - base_calls, total_ns - base_ns)
+        self._window_base = {name: list(c) for name, c in self.counters.items()}
+        return seconds, deltas
+
+    @staticmethod
+    def format_window(seconds, deltas, limit=4):
+        """One-line "name calls x time" summary of a window, busiest first."""
+        if not deltas: return f"Profiler: idle for {seconds:.1f} s"
+        busiest = sorted(deltas.items(), key=lambda item: -item[1][1])[:limit]
+        parts = [f"{name.split('.')[-1]} {calls}x {total_ns / 1e6:.1f}ms" for name, (calls, total_ns) in busiest]
+        return f"Profiler {seconds:.1f}s: " + ", ".join(parts)
+
+    def report_text(self):
+        """Table of the totals since the last reset(), busiest first."""
+        lines = [f"{'method':<48}{'calls':>9}{'total ms':>11}{'mean us':>10}{'max us':>10}"]
+        for name, (calls, total_ns, max_ns) in sorted(self.counters.items(), key=lambda item: -item[1][1]):
+            if calls: lines.append(f"{name:<48}{calls:>9}{total_ns / 1e6:>11.2f}{total_ns / calls / 1e3:>10.1f}{max_ns / 1e3:>10.1f}")
+        return "\n".join(lines)
+
+    def start_cprofile(self):
+        if self._cprofile is None:
+            import cProfile
+            self._cprofile = cProfile.Profile()
+            self._cprofile.enable()
+
+    def stop_cprofile(self, path=None, top=20):
+        """Stops the cProfile run, dumps pstats data to path (if given) and returns the top entries as text."""
+        if self._cprofile is None: return ""
+        profile, self._cprofile = self._cprofile, None
+        profile.disable()
+        if path: profile.dump_stats(path)
+        import pstats
+        out = io.StringIO()
+        pstats.Stats(profile, stream=out).sort_stats("cumulative").print_stats(top)
+        return out.getvalue()
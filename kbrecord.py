@@ -0,0 +1,212 @@
+"""Compact binary session recording for Keyboard Tester Pro.
+
+File layout (all little-endian):
+
+    header   32 bytes   magic, version, record size, start wall-clock time, start monotonic ns
+    records  N * 32     fixed-width records, see RECORD_STRUCT
+    strings             u32 count, then per string: u16 byte length + UTF-8 bytes
+    trailer  24 bytes   strings offset, record count, end magic
+
+keysym and char are stored as indexes into the string table, so records are
+fixed-width and can be read straight out of a memory map. SessionRecorder
+takes events on the caller's thread and does all packing and disk I/O on a
+background writer thread.
+"""
+import itertools
+import mmap
+import os
+import queue
+import struct
+import threading
+import time
+
+MAGIC = b"KBTSES1\0"
+END_MAGIC = b"KBTEND\0\0"
+VERSION = 1
+HEADER_STRUCT = struct.Struct("<8sHHIdQ")         # magic, version, record size, flags, start epoch s, start monotonic ns
+RECORD_STRUCT = struct.Struct("<QIIIHHB7x")       # host ns since start, event time, keycode, state, keysym id, char id, type
+TRAILER_STRUCT = struct.Struct("<QQ8s")           # strings offset, record count, end magic
+HEADER_SIZE = HEADER_STRUCT.size
+RECORD_SIZE = RECORD_STRUCT.size
+FILE_EXTENSION = ".kbts"
+
+# numpy dtype equivalent of RECORD_STRUCT, for vectorized readers (see SessionReader.as_array).
+RECORD_DTYPE_SPEC = {
+    "names": ["host_ns", "time", "keycode", "state", "keysym_id", "char_id", "type"],
+    "formats": ["<u8", "<u4", "<u4", "<u4", "<u2", "<u2", "u1"],
+    "offsets": [0, 8, 12, 16, 20, 22, 24],
+    "itemsize": RECORD_SIZE,
+}
+
+
+class SessionRecorder:
+    """Streams key events to a .kbts file from a background writer thread.
+
+    record() only timestamps the event and hands it to a SimpleQueue, so the Tk
+    thread never waits on packing or disk I/O. If the writer thread fails (e.g. the
+    disk fills up), it keeps the exception in `error` and close() raises it.
+    """
+    BATCH_RECORDS = 512
+
+    def __init__(self, path):
+        self.path = path
+        self.records_written = 0
+        self.error = None
+        self._closing = False
+        self._queue = queue.SimpleQueue()
+        self._start_ns = time.perf_counter_ns()
+        self._file = open(path, "wb")
+        self._file.write(HEADER_STRUCT.pack(MAGIC, VERSION, RECORD_SIZE, 0, time.time(), self._start_ns))
+        self._strings = {}
+        self._thread = threading.Thread(target=self._writer_loop, name="kbrecord-writer", daemon=True)
+        self._thread.start()
+
+    def record(self, event_type, keysym, char, keycode, state, time_ms):
+        self._queue.put((time.perf_counter_ns() - self._start_ns, event_type, keysym, char, keycode, state, time_ms))
+
+    def on_state_change(self, event_type, keysym, char, keycode, state, time_ms, modifiers_changed):
+        """KeyboardStateEngine subscriber signature."""
+        self.record(event_type, keysym, char, keycode, state, time_ms)
+
+    def close(self):
+        """Flushes pending records, writes the string table and trailer and waits for the writer thread."""
+        if self._thread is None: return
+        self._queue.put(None)
+        self._thread.join()
+        self._thread = None
+        if self.error is not None: raise self.error
+
+    def _string_id(self, text):
+        string_id = self._strings.get(text)
+        if string_id is None:
+            string_id = self._strings[text] = len(self._strings)
+        return string_id
+
+    def _writer_loop(self):
+        try:
+            self._write_records()
+        except Exception as e: # Kept for close(), which the Tk thread calls
+            self.error = e
+            try: self._file.close()
+            except OSError: pass
+            if not self._closing:
+                while self._queue.get() is not None: pass # Drop what record() still queues until close()
+
+    def _write_records(self):
+        pack_into, get, string_id = RECORD_STRUCT.pack_into, self._queue.get, self._string_id
+        buffer = bytearray(RECORD_SIZE * self.BATCH_RECORDS)
+        running = True
+        while running:
+            item = get()
+            used = 0
+            while True:
+                if item is None:
+                    running = False; self._closing = True
+                    break
+                host_ns, event_type, keysym, char, keycode, state, time_ms = item
+                pack_into(buffer, used, host_ns, time_ms & 0xFFFFFFFF, keycode & 0xFFFFFFFF, state & 0xFFFFFFFF,
+                          string_id(keysym), string_id(char), event_type)
+                used += RECORD_SIZE
+                if used == len(buffer): break
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+            if used:
+                self._file.write(memoryview(buffer)[:used])
+                self.records_written += used // RECORD_SIZE
+        strings_offset = self._file.tell()
+        table = [struct.pack("<I", len(self._strings))]
+        for text in self._strings:  # dicts keep insertion order, i.e. id order
+            encoded = text.encode("utf-8")
+            table.append(struct.pack("<H", len(encoded)) + encoded)
+        self._file.write(b"".join(table))
+        self._file.write(TRAILER_STRUCT.pack(strings_offset, self.records_written, END_MAGIC))
+        self._file.close()
+
+
+class SessionReader:
+    """Memory-mapped reader for .kbts files; records are decoded lazily by index."""
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size < HEADER_SIZE + TRAILER_STRUCT.size:
+                raise ValueError(f"{path}: truncated session file")
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            self._read_layout()
+        except struct.error as exc:
+            self._mm.close()
+            raise ValueError(f"{path}: corrupt session file ({exc})") from exc
+        except ValueError:
+            self._mm.close()
+            raise
+
+    def _read_layout(self):
+        magic, version, record_size, _flags, self.start_epoch, self.start_monotonic_ns = HEADER_STRUCT.unpack_from(self._mm, 0)
+        if magic != MAGIC or record_size != RECORD_SIZE:
+            raise ValueError(f"{self.path}: not a keyboard tester session file")
+        self.version = version
+        strings_offset, self.record_count, end_magic = TRAILER_STRUCT.unpack_from(self._mm, len(self._mm) - TRAILER_STRUCT.size)
+        if end_magic != END_MAGIC:
+            raise ValueError(f"{self.path}: session was not closed cleanly (missing trailer)")
+        if strings_offset != HEADER_SIZE + self.record_count * RECORD_SIZE or strings_offset > len(self._mm) - TRAILER_STRUCT.size:
+            raise ValueError(f"{self.path}: record count does not match the file size")
+        self.strings = self._read_strings(strings_offset)
+
+    def _read_strings(self, offset):
+        (count,) = struct.unpack_from("<I", self._mm, offset)
+        offset += 4
+        strings = []
+        for _ in range(count):
+            (length,) = struct.unpack_from("<H", self._mm, offset)
+            strings.append(self._mm[offset + 2:offset + 2 + length].decode("utf-8"))
+            offset += 2 + length
+        return strings
+
+    def __len__(self):
+        return self.record_count
+
+    def __getitem__(self, index):
+        """Returns (event_type, keysym, char, keycode, state, time, host_ns) for one record."""
+        if index < 0: index += self.record_count
+        if not 0 <= index < self.record_count: raise IndexError(index)
+        host_ns, time_ms, keycode, state, keysym_id, char_id, event_type = RECORD_STRUCT.unpack_from(self._mm, HEADER_SIZE + index * RECORD_SIZE)
+        return event_type, self.strings[keysym_id], self.strings[char_id], keycode, state, time_ms, host_ns
+
+    def iter_events(self):
+        """Yields KeyboardStateEngine-style (event_type, keysym, char, keycode, state, time) tuples."""
+        strings = self.strings
+        end = HEADER_SIZE + self.record_count * RECORD_SIZE
+        with memoryview(self._mm) as view:
+            for host_ns, time_ms, keycode, state, keysym_id, char_id, event_type in RECORD_STRUCT.iter_unpack(view[HEADER_SIZE:end]):
+                yield event_type, strings[keysym_id], strings[char_id], keycode, state, time_ms
+
+    def as_array(self):
+        """Zero-copy numpy structured view of all records (requires numpy); drop it before close()."""
+        import numpy as np
+        return np.frombuffer(self._mm, dtype=np.dtype(RECORD_DTYPE_SPEC), count=self.record_count, offset=HEADER_SIZE)
+
+    def close(self):
+        self._mm.close()
+
+    def __enter__(self): return self
+    def __exit__(self, *exc): self.close()
+
+
+def new_session_path(directory):
+    """Timestamped path for a new session file in `directory` (created if missing).
+
+    The name has millisecond resolution plus a counter if needed, and the file is created here (empty) so
+    two recordings started in quick succession can never get, and overwrite, the same file."""
+    os.makedirs(directory, exist_ok=True)
+    now = time.time()
+    stem = os.path.join(directory, time.strftime("session-%Y%m%d-%H%M%S", time.localtime(now)) + f"-{int(now * 1000) % 1000:03d}")
+    suffix = ""
+    for attempt in itertools.count(2):
+        path = stem + suffix + FILE_EXTENSION
+        try:
+            open(path, "xb").close()
+            return path
+        except FileExistsError:
+            suffix = f"-{attempt}"
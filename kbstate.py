@@ -0,0 +1,269 @@
+"""Tk-independent keyboard state engine for Keyboard Tester Pro.
+
+The engine tracks held modifiers, toggle keys (Caps Lock / Num Lock) and the
+set of physically pressed keys. It consumes plain event tuples
+
+    (event_type, keysym, char, keycode, state, time)
+
+where event_type is PRESS or RELEASE, and notifies subscribers with the same
+fields plus a flag telling whether a modifier or toggle changed. Pressed keys
+are identified by keycode (by keysym when the keycode is 0, e.g. synthetic
+events), because X reports a key's release with whatever keysym the modifiers
+give it by then: press a, hold Shift, and the release is for A. Nothing here
+imports tkinter, so the logic can be driven, replayed and profiled headless.
+"""
+import collections
+import collections.abc
+import random
+import time as _time
+
+from kbmetrics import StreamingHistogram
+
+PRESS, RELEASE = 1, 0
+
+TOGGLE_KEYSYMS = ('Caps_Lock', 'Num_Lock')
+DEFAULT_MODIFIER_STATE = {
+    'Shift_L': False, 'Shift_R': False, 'Control_L': False, 'Control_R': False,
+    'Alt_L': False, 'Alt_R': False, 'ISO_Level3_Shift': False, 'Caps_Lock': False,
+    'Num_Lock': True, 'Super_L': False, 'Super_R': False, 'Meta_L': False, 'Meta_R': False
+}
+# Modifier/toggle state is kept as an int: one bit per keysym in DEFAULT_MODIFIER_STATE.
+MODIFIER_BITS = {keysym: 1 << i for i, keysym in enumerate(DEFAULT_MODIFIER_STATE)}
+DEFAULT_MODIFIER_MASK = sum(MODIFIER_BITS[k] for k, on in DEFAULT_MODIFIER_STATE.items() if on)
+
+
+def modifier_mask(keysyms):
+    """OR of the MODIFIER_BITS of every modifier/toggle keysym in `keysyms` (0 if none)."""
+    mask = 0
+    for keysym in keysyms: mask |= MODIFIER_BITS.get(keysym, 0)
+    return mask
+
+
+class ModifierStateView(collections.abc.Mapping):
+    """Read-only {keysym: bool} view over an engine's modifier bitmask."""
+    __slots__ = ("_engine",)
+
+    def __init__(self, engine): self._engine = engine
+    def __getitem__(self, keysym): return bool(self._engine.modifier_mask & MODIFIER_BITS[keysym])
+    def __contains__(self, keysym): return keysym in MODIFIER_BITS
+    def __iter__(self): return iter(MODIFIER_BITS)
+    def __len__(self): return len(MODIFIER_BITS)
+
+
+class KeyboardStateEngine:
+    """Applies the held/toggle rules to a stream of key events and fans state changes out to subscribers.
+
+    Subscribers are called as ``callback(event_type, keysym, char, keycode, state, time, modifiers_changed)``.
+    Held modifiers and active toggles live in the ``modifier_mask`` int (see MODIFIER_BITS);
+    ``modifier_keys_state`` is a live {keysym: bool} view of it. ``currently_pressed_physical_keys``
+    maps the key id (keycode, or keysym if the keycode is 0) of every key that is down to its press keysym.
+    """
+    def __init__(self, toggle_keysyms=TOGGLE_KEYSYMS):
+        self.modifier_mask = DEFAULT_MODIFIER_MASK
+        self.modifier_keys_state = ModifierStateView(self)
+        self.toggle_keysyms = frozenset(toggle_keysyms)
+        self.toggle_mask = modifier_mask(self.toggle_keysyms)
+        self.currently_pressed_physical_keys = {}
+        self.subscribers = []
+        self.events_processed = 0
+
+    def subscribe(self, callback):
+        if callback not in self.subscribers: self.subscribers.append(callback)
+        return callback
+
+    def unsubscribe(self, callback):
+        if callback in self.subscribers: self.subscribers.remove(callback)
+
+    def reset(self):
+        """Releases every key and restores the default modifier/toggle state."""
+        self.modifier_mask = DEFAULT_MODIFIER_MASK
+        self.currently_pressed_physical_keys.clear()
+        self.events_processed = 0
+
+    def feed(self, event_type, keysym, char='', keycode=0, state=0, time=0):
+        """Applies one event and notifies subscribers; returns True if a modifier or toggle changed."""
+        bit = MODIFIER_BITS.get(keysym, 0)
+        changed = False
+        if event_type == PRESS:
+            self.currently_pressed_physical_keys[keycode or keysym] = keysym
+            if bit:
+                if bit & self.toggle_mask:
+                    self.modifier_mask ^= bit; changed = True
+                else:
+                    changed = not self.modifier_mask & bit; self.modifier_mask |= bit
+        else:
+            self.currently_pressed_physical_keys.pop(keycode or keysym, None)
+            if bit and not bit & self.toggle_mask:
+                changed = bool(self.modifier_mask & bit); self.modifier_mask &= ~bit
+        self.events_processed += 1
+        for callback in self.subscribers:
+            callback(event_type, keysym, char, keycode, state, time, changed)
+        return changed
+
+    def replay(self, events, notify=True):
+        """Pushes an iterable of event tuples through the engine as fast as possible.
+
+        With notify=False subscribers are skipped and the rules run in a tight local loop,
+        which is the mode to use for throughput testing. Returns (events, seconds).
+        """
+        start = _time.perf_counter()
+        if notify:
+            feed = self.feed
+            count = 0
+            for event in events:
+                feed(*event); count += 1
+            return count, _time.perf_counter() - start
+        bits_get = MODIFIER_BITS.get
+        toggle_mask = self.toggle_mask
+        mask = self.modifier_mask
+        pressed = self.currently_pressed_physical_keys
+        pressed_pop = pressed.pop
+        count = 0
+        for event_type, keysym, _char, keycode, _state, _time_ms in events:
+            count += 1
+            bit = bits_get(keysym, 0)
+            if event_type == PRESS:
+                pressed[keycode or keysym] = keysym
+                if bit: mask = mask ^ bit if bit & toggle_mask else mask | bit
+            else:
+                pressed_pop(keycode or keysym, None)
+                if bit and not bit & toggle_mask: mask &= ~bit
+        self.modifier_mask = mask
+        self.events_processed += count
+        return count, _time.perf_counter() - start
+
+
+def fold_autorepeat(events, held):
+    """Drops autorepeat from a batch of event tuples; returns (kept, folded_count).
+
+    `held` maps the key id (keycode, or keysym if the keycode is 0) of every key down before the batch to the
+    (keysym, char) of its press and is updated in place. A PRESS of a key that is already down is a repeat,
+    and so is a RELEASE immediately followed by a PRESS of the same key with the same time (X11 sends
+    autorepeat as such pairs). Kept releases carry the keysym and char of their press, so a key released
+    after Shift went down still lets go of what its press lit. What is kept is the batch's net state delta,
+    in order.
+    """
+    kept = []
+    folded = 0
+    i, n = 0, len(events)
+    while i < n:
+        event = events[i]
+        key = event[3] or event[1]
+        if event[0] == PRESS:
+            if key in held: folded += 1
+            else: held[key] = (event[1], event[2]); kept.append(event)
+        else:
+            following = events[i + 1] if i + 1 < n else None
+            if following is not None and following[0] == PRESS and (following[3] or following[1]) == key and following[5] == event[5] and key in held:
+                folded += 2; i += 2
+                continue
+            pressed = held.pop(key, None)
+            kept.append(event if pressed is None else (RELEASE,) + pressed + event[3:])
+        i += 1
+    return kept, folded
+
+
+class InputCoalescer:
+    """Feeds key events to an engine as they arrive and hands a folded copy to views once per frame.
+
+    push() feeds the engine at once, so its subscribers (logging, recording, streaming, health analysis)
+    see every event, autorepeat included, at the time it was handled. The event is also queued, and drain(),
+    called once per frame, folds autorepeat out of the queue and passes the net state delta to the
+    coalescer's own subscribers: views that only repaint key state. ``draining`` is True while they are
+    called, and ``held`` is the key state as far as that folded stream has gone. Every pushed event is
+    counted; queue depth and events folded per batch go into StreamingHistograms.
+    """
+    def __init__(self, engine):
+        self.engine = engine
+        self.pending = collections.deque()
+        self.held = {} # key id -> (keysym, char) of its press, see fold_autorepeat
+        self.subscribers = []
+        self.draining = False
+        self.events_received = 0
+        self.events_folded = 0
+        self.batches = 0
+        self.depth_histogram = StreamingHistogram(1 << 16)
+        self.folded_histogram = StreamingHistogram(1 << 16)
+
+    def subscribe(self, callback):
+        """Adds a subscriber to the folded stream; same signature as KeyboardStateEngine subscribers."""
+        if callback not in self.subscribers: self.subscribers.append(callback)
+        return callback
+
+    def unsubscribe(self, callback):
+        if callback in self.subscribers: self.subscribers.remove(callback)
+
+    def push(self, event_type, keysym, char='', keycode=0, state=0, time=0):
+        """Feeds one event to the engine and queues it; returns True if the queue was empty, i.e. the caller should schedule a drain."""
+        self.engine.feed(event_type, keysym, char, keycode, state, time)
+        self.pending.append((event_type, keysym, char, keycode, state, time))
+        self.events_received += 1
+        return len(self.pending) == 1
+
+    def drain(self):
+        """Passes everything queued since the last drain, autorepeat folded, to the subscribers; returns the number of events taken."""
+        batch = list(self.pending)
+        self.pending.clear()
+        if not batch: return 0
+        kept, folded = fold_autorepeat(batch, self.held)
+        self.batches += 1
+        self.events_folded += folded
+        self.depth_histogram.record(len(batch))
+        self.folded_histogram.record(folded)
+        bits_get, toggle_mask, subscribers = MODIFIER_BITS.get, self.engine.toggle_mask, self.subscribers
+        self.draining = True
+        try:
+            for event in kept:
+                bit = bits_get(event[1], 0)
+                changed = bool(bit) and (event[0] == PRESS or not bit & toggle_mask) # Kept events are never repeats
+                for callback in subscribers: callback(*event, changed)
+        finally:
+            self.draining = False
+        return len(batch)
+
+    def reset_stats(self):
+        self.events_received = self.events_folded = self.batches = 0
+        self.depth_histogram.reset(); self.folded_histogram.reset()
+
+    def stats(self):
+        return {"events": self.events_received, "folded": self.events_folded, "batches": self.batches,
+                "depth": self.depth_histogram.summary(), "folded_per_batch": self.folded_histogram.summary()}
+
+
+def synthetic_events(count, keysyms=None, seed=0, modifier_ratio=0.1):
+    """Builds a list of roughly `count` press/release event tuples for replay.
+
+    Keys are drawn from `keysyms` (letters by default) with an occasional modifier held around them.
+    """
+    rng = random.Random(seed)
+    keysyms = list(keysyms) if keysyms else [chr(c) for c in range(ord('a'), ord('z') + 1)]
+    modifiers = [k for k in MODIFIER_BITS if k not in TOGGLE_KEYSYMS]
+    events, t = [], 0
+    while len(events) < count:
+        keysym = rng.choice(keysyms)
+        char = keysym if len(keysym) == 1 else ''
+        modifier = rng.choice(modifiers) if rng.random() < modifier_ratio else None
+        if modifier: events.append((PRESS, modifier, '', 0, 0, t)); t += 1
+        events.append((PRESS, keysym, char, 0, 0, t)); t += 1
+        events.append((RELEASE, keysym, char, 0, 0, t)); t += 1
+        if modifier: events.append((RELEASE, modifier, '', 0, 0, t)); t += 1
+    return events
+
+
+def autorepeat_events(count, keysyms=None, seed=0, repeats=30, x11_pairs=True):
+    """Builds roughly `count` event tuples of keys held down with autorepeat, optionally as X11-style
+    RELEASE/PRESS pairs that share a timestamp."""
+    rng = random.Random(seed)
+    keysyms = list(keysyms) if keysyms else [chr(c) for c in range(ord('a'), ord('z') + 1)]
+    events, t = [], 0
+    while len(events) < count:
+        keysym = rng.choice(keysyms)
+        char = keysym if len(keysym) == 1 else ''
+        events.append((PRESS, keysym, char, 0, 0, t))
+        for _ in range(repeats):
+            t += 33
+            if x11_pairs: events.append((RELEASE, keysym, char, 0, 0, t))
+            events.append((PRESS, keysym, char, 0, 0, t))
+        t += 33
+        events.append((RELEASE, keysym, char, 0, 0, t))
+    return events
@@ -0,0 +1,148 @@
+"""Per-key typing statistics for Keyboard Tester Pro, kept in preallocated NumPy arrays (no tkinter import).
+
+Keys are addressed by their dense per-layout key id (the position used by
+LayoutIndex), so press()/release() are a handful of array stores and the
+memory use does not grow with the number of keystrokes. Dwell times get a
+per-key log-linear histogram (StreamingHistogram's buckets), from which
+percentiles are computed for all keys at once.
+"""
+import numpy as np
+
+from kbmetrics import StreamingHistogram
+
+METRICS = ("count", "mean_dwell", "p50_dwell", "p95_dwell", "mean_interval")
+METRIC_LABELS = {"count": "Press count", "mean_dwell": "Mean dwell (ms)", "p50_dwell": "Median dwell (ms)",
+                 "p95_dwell": "p95 dwell (ms)", "mean_interval": "Inter-key interval (ms)"}
+
+
+class KeyStats:
+    """Press counts, dwell times (release minus press) and inter-key intervals for `key_count` keys, in ms.
+
+    Times are event times in milliseconds (Tk's event.time); a dwell or interval that comes out negative
+    (the 32-bit X clock wrapped) or longer than the configured maximum is counted as a press but not timed.
+    """
+    def __init__(self, key_count, max_dwell_ms=60_000, max_interval_ms=2_000):
+        self.key_count = key_count
+        self.max_dwell_ms = max_dwell_ms
+        self.max_interval_ms = max_interval_ms
+        buckets = StreamingHistogram.bucket_index(max_dwell_ms) + 1
+        self.bucket_upper = np.array([StreamingHistogram.bucket_bounds(i)[1] for i in range(buckets)], dtype=np.float64)
+        self.counts = np.zeros(key_count, dtype=np.int64)
+        self.dwell_sum = np.zeros(key_count, dtype=np.float64)
+        self.dwell_count = np.zeros(key_count, dtype=np.int64)
+        self.dwell_histogram = np.zeros((key_count, buckets), dtype=np.uint32)
+        self.interval_sum = np.zeros(key_count, dtype=np.float64)
+        self.interval_count = np.zeros(key_count, dtype=np.int64)
+        self.down_since = [-1] * key_count # Press time per held key, -1 when up (a list: cheaper scalar access)
+        self.last_press_ms = -1
+        self.total_presses = 0
+
+    def reset(self):
+        for array in (self.counts, self.dwell_sum, self.dwell_count, self.dwell_histogram, self.interval_sum, self.interval_count):
+            array.fill(0)
+        self.down_since[:] = [-1] * self.key_count
+        self.last_press_ms = -1
+        self.total_presses = 0
+
+    def copy(self):
+        other = KeyStats.__new__(KeyStats)
+        other.__dict__.update(self.__dict__)
+        for name in ("counts", "dwell_sum", "dwell_count", "dwell_histogram", "interval_sum", "interval_count", "down_since"):
+            setattr(other, name, getattr(self, name).copy())
+        return other
+
+    def press(self, key_id, time_ms):
+        """Counts a press; a press of a key that is already down (autorepeat) is ignored."""
+        if self.down_since[key_id] >= 0: return
+        self.down_since[key_id] = time_ms
+        self.counts[key_id] += 1
+        self.total_presses += 1
+        interval = time_ms - self.last_press_ms
+        if self.last_press_ms >= 0 and 0 <= interval <= self.max_interval_ms:
+            self.interval_sum[key_id] += interval
+            self.interval_count[key_id] += 1
+        self.last_press_ms = time_ms
+
+    def release(self, key_id, time_ms):
+        pressed_at = self.down_since[key_id]
+        if pressed_at < 0: return
+        self.down_since[key_id] = -1
+        dwell = time_ms - pressed_at
+        if 0 <= dwell <= self.max_dwell_ms:
+            self.dwell_sum[key_id] += dwell
+            self.dwell_count[key_id] += 1
+            self.dwell_histogram[key_id, StreamingHistogram.bucket_index(dwell)] += 1
+
+    def add_presses(self, key_ids):
+        """Vectorized press counting for an int array of key ids (offline analysis)."""
+        self.counts += np.bincount(key_ids, minlength=self.key_count)
+        self.total_presses += len(key_ids)
+
+    def add_dwells(self, key_ids, dwells_ms):
+        """Vectorized counterpart of release(): adds already-paired dwell times (ms) per key id."""
+        dwells_ms = np.rint(dwells_ms).astype(np.int64)
+        keep = (dwells_ms >= 0) & (dwells_ms <= self.max_dwell_ms)
+        key_ids, dwells_ms = key_ids[keep], dwells_ms[keep]
+        self.dwell_sum += np.bincount(key_ids, weights=dwells_ms, minlength=self.key_count)
+        self.dwell_count += np.bincount(key_ids, minlength=self.key_count)
+        buckets = self.dwell_histogram.shape[1]
+        flat = key_ids * buckets + bucket_indexes(dwells_ms)
+        self.dwell_histogram += np.bincount(flat, minlength=self.key_count * buckets).reshape(self.key_count, buckets).astype(np.uint32)
+
+    def add_intervals(self, key_ids, intervals_ms):
+        """Adds inter-key intervals (ms) credited to the key pressed at the end of each interval."""
+        keep = (intervals_ms >= 0) & (intervals_ms <= self.max_interval_ms)
+        self.interval_sum += np.bincount(key_ids[keep], weights=intervals_ms[keep], minlength=self.key_count)
+        self.interval_count += np.bincount(key_ids[keep], minlength=self.key_count)
+
+    def merge(self, other):
+        """Adds another KeyStats of the same shape (e.g. one per session) into this one."""
+        for name in ("counts", "dwell_sum", "dwell_count", "dwell_histogram", "interval_sum", "interval_count"):
+            getattr(self, name).__iadd__(getattr(other, name))
+        self.total_presses += other.total_presses
+
+    def dwell_percentile(self, pct):
+        """Per-key upper bound of the bucket holding the pct-th dwell percentile; NaN for keys with no dwell."""
+        cumulative = np.cumsum(self.dwell_histogram, axis=1, dtype=np.int64)
+        target = np.maximum(1, np.ceil(self.dwell_count * pct / 100.0)).astype(np.int64)
+        bucket = np.argmax(cumulative >= target[:, None], axis=1)
+        return np.where(self.dwell_count > 0, self.bucket_upper[bucket], np.nan)
+
+    def metric(self, name):
+        """Float array with one value per key for one of METRICS; NaN where a key has no data."""
+        with np.errstate(invalid="ignore", divide="ignore"):
+            if name == "count": return np.where(self.counts > 0, self.counts.astype(np.float64), np.nan)
+            if name == "mean_dwell": return self.dwell_sum / np.where(self.dwell_count > 0, self.dwell_count, np.nan)
+            if name == "p50_dwell": return self.dwell_percentile(50)
+            if name == "p95_dwell": return self.dwell_percentile(95)
+            if name == "mean_interval": return self.interval_sum / np.where(self.interval_count > 0, self.interval_count, np.nan)
+        raise ValueError(f"unknown metric: {name}")
+
+
+def bucket_indexes(values):
+    """Vectorized StreamingHistogram.bucket_index for a non-negative int64 array."""
+    values = np.asarray(values, dtype=np.int64)
+    sub_bits = StreamingHistogram.SUB_BUCKET_BITS
+    bits = np.zeros(values.shape, dtype=np.int64)
+    positive = values > 0
+    bits[positive] = np.floor(np.log2(values[positive])).astype(np.int64) + 1
+    shift = np.maximum(bits - sub_bits - 1, 0)
+    return np.where(bits <= sub_bits + 1, values, (shift << sub_bits) + (values >> shift))
+
+
+def _hex_to_rgb(color):
+    return [int(color[i:i + 2], 16) for i in (1, 3, 5)]
+
+
+def heat_colors(values, stops):
+    """Maps a float array onto a colour ramp (a sequence of '#rrggbb' stops, low to high), scaled to the
+    array's own min..max. Returns (colors, low, high); colors[i] is None where values[i] is NaN."""
+    finite = np.isfinite(values)
+    if not finite.any(): return [None] * len(values), 0.0, 0.0
+    low, high = float(values[finite].min()), float(values[finite].max())
+    t = (np.nan_to_num(values, nan=low) - low) / (high - low) if high > low else np.ones(len(values))
+    positions = np.linspace(0.0, 1.0, len(stops))
+    rgb = np.array([_hex_to_rgb(color) for color in stops], dtype=np.float64)
+    channels = np.stack([np.interp(t, positions, rgb[:, c]) for c in range(3)], axis=1).round().astype(np.uint8)
+    colors = ["#%02x%02x%02x" % (r, g, b) for r, g, b in channels.tolist()]
+    return [color if ok else None for color, ok in zip(colors, finite.tolist())], low, high
@@ -0,0 +1,400 @@
+"""Live key event streaming for Keyboard Tester Pro (no tkinter import).
+
+EventStreamServer is a KeyboardStateEngine subscriber that publishes the key
+event stream and per-key state to local viewers, so one dashboard can watch
+many test stations. The subscriber only appends to a deque; an asyncio loop
+on its own thread takes the queued events every ``frame_ms``, encodes them
+once as a JSON frame and hands that to every client. One port serves both:
+
+    WebSocket   a browser connects with an HTTP Upgrade request (text frames)
+    TCP         any client that first sends the line ``KBSTREAM 1`` gets
+                newline-delimited JSON
+
+Messages are JSON objects:
+
+    {"type": "hello", "station": ..., "version": 1}
+    {"type": "state", "seq": n, "pressed": [keysym, ...], "held": [[keycode, keysym], ...], "state": x_state,
+     "counts": {keysym: presses}}
+    {"type": "events", "seq": n, "events": [[event_type, keysym, char, keycode, state, time], ...]}
+
+Every client has a bounded frame queue. A client that falls more than
+``client_queue`` frames behind has its backlog dropped and gets a fresh
+"state" message instead, so a slow viewer costs bounded memory and can
+never hold up the key handlers.
+
+    python kbstream.py watch [--host H] [--port P] [--websocket]   headless subscriber
+    python kbstream.py serve [--rate 50]                           server fed with synthetic events
+"""
+import argparse
+import asyncio
+import base64
+import collections
+import hashlib
+import json
+import os
+import socket
+import struct
+import sys
+import threading
+import time
+
+from kbstate import PRESS
+
+PROTOCOL_VERSION = 1
+TCP_GREETING = b"KBSTREAM 1"
+WEBSOCKET_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+WS_TEXT, WS_CLOSE, WS_PING, WS_PONG = 0x1, 0x8, 0x9, 0xA
+
+
+def websocket_frame(payload, opcode=WS_TEXT, mask=None):
+    """One unfragmented WebSocket frame (servers send unmasked frames; clients pass a 4-byte mask)."""
+    n = len(payload)
+    first = 0x80 | opcode
+    mask_bit = 0x80 if mask else 0
+    if n < 126: header = bytes((first, mask_bit | n))
+    elif n < 1 << 16: header = struct.pack("!BBH", first, mask_bit | 126, n)
+    else: header = struct.pack("!BBQ", first, mask_bit | 127, n)
+    if not mask: return header + payload
+    return header + mask + bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+
+
+async def read_websocket_frame(reader):
+    """(opcode, payload) of the next frame, unmasking client frames."""
+    first, second = await reader.readexactly(2)
+    n = second & 0x7F
+    if n == 126: n = struct.unpack("!H", await reader.readexactly(2))[0]
+    elif n == 127: n = struct.unpack("!Q", await reader.readexactly(8))[0]
+    mask = await reader.readexactly(4) if second & 0x80 else None
+    payload = await reader.readexactly(n)
+    if mask: payload = bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+    return first & 0x0F, payload
+
+
+class _Client:
+    """One connected viewer: a bounded queue of encoded frames and the flag asking for a state resync."""
+    __slots__ = ("writer", "websocket", "limit", "frames", "wakeup", "resync", "frames_dropped", "name")
+
+    def __init__(self, writer, websocket, limit):
+        self.writer = writer
+        self.websocket = websocket
+        self.limit = limit
+        self.frames = collections.deque()
+        self.wakeup = asyncio.Event()
+        self.resync = True # Every client starts with a state snapshot
+        self.frames_dropped = 0
+        peer = writer.get_extra_info("peername")
+        self.name = f"{peer[0]}:{peer[1]}" if peer else "?"
+
+    def offer(self, frame):
+        if len(self.frames) >= self.limit: # Too far behind: drop the backlog, catch up from a snapshot
+            self.frames_dropped += len(self.frames)
+            self.frames.clear()
+            self.resync = True
+        else:
+            self.frames.append(frame)
+        self.wakeup.set()
+
+
+class EventStreamServer:
+    """Streams engine events to local viewers over TCP/WebSocket from a background asyncio thread.
+
+    on_state_change() is the only method the Tk thread calls; it does one deque append. The loop thread
+    mirrors pressed keys, X state and press counts from the stream, so snapshots never touch engine state.
+    """
+    MAX_FRAME_EVENTS = 1024 # A burst is split into several frames of at most this many events
+
+    def __init__(self, host="127.0.0.1", port=8765, frame_ms=50, client_queue=256, station=None, max_pending=65536):
+        self.host = host
+        self.port = port
+        self.frame_ms = frame_ms
+        self.client_queue = client_queue
+        self.station = station or socket.gethostname()
+        self.pending = collections.deque(maxlen=max_pending) # Tk thread appends, loop thread pops
+        self.published = 0 # Events handed over by the Tk thread
+        self.sent = 0 # Events taken off the deque by the loop thread
+        self.seq = 0
+        self.clients = set()
+        self.pressed = {} # Key id (keycode, or keysym if 0) -> press keysym, like the engine's
+        self.state = 0
+        self.counts = collections.Counter()
+        self.error = None
+        self._loop = self._stopping = self._thread = None
+        self._ready = threading.Event()
+        self._tasks = set()
+
+    # --- Tk thread ---
+    def on_state_change(self, event_type, keysym, char, keycode, state, time, modifiers_changed):
+        """KeyboardStateEngine subscriber signature."""
+        self.pending.append((event_type, keysym, char, keycode, state, time))
+        self.published += 1
+
+    def start(self, timeout=5.0):
+        """Starts the loop thread and waits until it listens; returns the bound (host, port). Raises OSError."""
+        self._thread = threading.Thread(target=self._run, name="kbstream-server", daemon=True)
+        self._thread.start()
+        if not self._ready.wait(timeout): raise OSError(f"stream server did not start within {timeout} s")
+        if self.error: raise self.error
+        return self.host, self.port
+
+    def close(self):
+        if self._loop is not None and self._stopping is not None:
+            self._loop.call_soon_threadsafe(self._stopping.set)
+        if self._thread is not None: self._thread.join(2.0); self._thread = None
+
+    @property
+    def dropped(self):
+        """Events lost because the loop thread fell max_pending events behind."""
+        return self.published - self.sent - len(self.pending)
+
+    # --- loop thread ---
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        try:
+            self._loop.run_until_complete(self._serve())
+        finally:
+            self._loop.close()
+            self._ready.set()
+
+    async def _serve(self):
+        self._stopping = asyncio.Event()
+        try:
+            server = await asyncio.start_server(self._handle_client, self.host, self.port)
+        except OSError as e:
+            self.error = e; self._ready.set()
+            return
+        self.port = server.sockets[0].getsockname()[1]
+        self._ready.set()
+        pump = asyncio.ensure_future(self._pump())
+        try:
+            await self._stopping.wait()
+        finally:
+            pump.cancel()
+            server.close()
+            for client in list(self.clients): client.writer.transport.abort() # Ends each client's loops without flushing
+            if self._tasks: await asyncio.wait(list(self._tasks), timeout=1.0)
+            await server.wait_closed()
+
+    async def _pump(self):
+        """Every frame_ms: takes the queued events, updates the mirrored state and offers frames to every client."""
+        interval = self.frame_ms / 1000
+        while True:
+            await asyncio.sleep(interval)
+            while self.pending: self._publish_frame()
+
+    def _publish_frame(self):
+        """Takes up to MAX_FRAME_EVENTS queued events, mirrors their state and offers them to every client as one frame."""
+        popleft = self.pending.popleft
+        events = []
+        try:
+            while len(events) < self.MAX_FRAME_EVENTS: events.append(popleft())
+        except IndexError:
+            pass
+        if not events: return
+        self.sent += len(events)
+        pressed, counts = self.pressed, self.counts
+        for event_type, keysym, _char, keycode, state, _time in events:
+            key = keycode or keysym
+            if event_type == PRESS:
+                if key not in pressed: counts[keysym] += 1; pressed[key] = keysym
+            else:
+                pressed.pop(key, None)
+            self.state = state
+        self.seq += 1
+        if not self.clients: return
+        payload = json.dumps({"type": "events", "seq": self.seq, "events": events}, separators=(",", ":")).encode()
+        line = ws = None
+        for client in self.clients:
+            if client.websocket:
+                if ws is None: ws = websocket_frame(payload)
+                client.offer(ws)
+            else:
+                if line is None: line = payload + b"\n"
+                client.offer(line)
+
+    def snapshot(self):
+        held = [[key if isinstance(key, int) else 0, keysym] for key, keysym in self.pressed.items()]
+        return {"type": "state", "seq": self.seq, "pressed": sorted(self.pressed.values()), "held": held,
+                "state": self.state, "counts": dict(self.counts)}
+
+    def _encode(self, client, message):
+        payload = json.dumps(message, separators=(",", ":")).encode()
+        return websocket_frame(payload) if client.websocket else payload + b"\n"
+
+    async def _handle_client(self, reader, writer):
+        try:
+            greeting = await asyncio.wait_for(reader.readline(), 5.0)
+            if greeting.startswith(b"GET "):
+                headers = {}
+                while True:
+                    line = await asyncio.wait_for(reader.readline(), 5.0)
+                    if line in (b"\r\n", b"\n", b""): break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                key = headers.get("sec-websocket-key")
+                if not key:
+                    writer.write(b"HTTP/1.1 400 Bad Request\r\nContent-Length: 0\r\n\r\n"); writer.close()
+                    return
+                accept = base64.b64encode(hashlib.sha1((key + WEBSOCKET_GUID).encode()).digest()).decode()
+                writer.write(("HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                              f"Sec-WebSocket-Accept: {accept}\r\n\r\n").encode())
+                websocket = True
+            elif greeting.strip() == TCP_GREETING:
+                websocket = False
+            else:
+                writer.close()
+                return
+        except (asyncio.TimeoutError, ConnectionError, asyncio.IncompleteReadError):
+            writer.close()
+            return
+        client = _Client(writer, websocket, self.client_queue)
+        writer.write(self._encode(client, {"type": "hello", "station": self.station, "version": PROTOCOL_VERSION}))
+        task = asyncio.current_task()
+        self.clients.add(client)
+        self._tasks.add(task)
+        client.wakeup.set() # Sends the first state snapshot right away
+        sender = asyncio.ensure_future(self._send_loop(client))
+        try:
+            await self._receive_loop(client, reader)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.clients.discard(client)
+            self._tasks.discard(task)
+            sender.cancel()
+            await asyncio.gather(sender, return_exceptions=True)
+            writer.close()
+
+    async def _send_loop(self, client):
+        writer = client.writer
+        try:
+            while True:
+                await client.wakeup.wait()
+                client.wakeup.clear()
+                if client.resync: # The snapshot covers every frame still queued
+                    client.resync = False
+                    client.frames.clear()
+                    writer.write(self._encode(client, self.snapshot()))
+                while client.frames:
+                    writer.write(client.frames.popleft())
+                    await writer.drain() # Backpressure: a slow viewer only ever waits here, on its own task
+                    if client.resync: break
+                if client.resync: client.wakeup.set()
+        except ConnectionError:
+            writer.close()
+
+    async def _receive_loop(self, client, reader):
+        """Waits for the viewer to go away; answers WebSocket pings and close frames."""
+        if not client.websocket:
+            while await reader.read(1024): pass
+            return
+        while True:
+            opcode, payload = await read_websocket_frame(reader)
+            if opcode == WS_CLOSE:
+                client.writer.write(websocket_frame(payload[:2], WS_CLOSE))
+                return
+            if opcode == WS_PING: client.writer.write(websocket_frame(payload, WS_PONG))
+
+
+# --- Headless subscriber ---
+async def subscribe(host="127.0.0.1", port=8765, websocket=False):
+    """Async generator of the messages a stream server sends, over plain TCP or a WebSocket."""
+    reader, writer = await asyncio.open_connection(host, port, limit=1 << 22)
+    try:
+        if websocket:
+            key = base64.b64encode(os.urandom(16)).decode()
+            writer.write((f"GET / HTTP/1.1\r\nHost: {host}:{port}\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                          f"Sec-WebSocket-Key: {key}\r\nSec-WebSocket-Version: 13\r\n\r\n").encode())
+            status = await reader.readline()
+            if b" 101 " not in status: raise ConnectionError(f"WebSocket upgrade refused: {status!r}")
+            while await reader.readline() not in (b"\r\n", b""): pass
+            while True:
+                opcode, payload = await read_websocket_frame(reader)
+                if opcode == WS_CLOSE: return
+                if opcode == WS_TEXT: yield json.loads(payload)
+        else:
+            writer.write(TCP_GREETING + b"\n")
+            while True:
+                line = await reader.readline()
+                if not line: return
+                yield json.loads(line)
+    finally:
+        writer.close()
+
+
+async def watch(host, port, websocket=False, seconds=None, quiet=False):
+    """Prints a line per second (events/s, frames, keys held); returns the totals."""
+    totals = {"frames": 0, "events": 0, "states": 0, "gaps": 0}
+    last_seq, window_start, window_events = None, time.monotonic(), 0
+    deadline = time.monotonic() + seconds if seconds else None
+    messages = subscribe(host, port, websocket)
+    pressed = {} # Key id -> keysym, as on the server
+    try:
+        while True:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                message = await asyncio.wait_for(messages.__anext__(), timeout)
+            except (asyncio.TimeoutError, StopAsyncIteration):
+                break
+            kind = message["type"]
+            if kind == "hello":
+                if not quiet: print(f"connected to station {message['station']}")
+            elif kind == "state":
+                totals["states"] += 1; last_seq = message["seq"]
+                pressed = {keycode or keysym: keysym for keycode, keysym in message.get("held", [[0, k] for k in message["pressed"]])}
+            elif kind == "events":
+                if last_seq is not None and message["seq"] <= last_seq: continue # Already in the last snapshot
+                if last_seq is not None and message["seq"] != last_seq + 1: totals["gaps"] += 1
+                last_seq = message["seq"]
+                totals["frames"] += 1; totals["events"] += len(message["events"]); window_events += len(message["events"])
+                for event_type, keysym, _char, keycode, *_rest in message["events"]:
+                    if event_type == PRESS: pressed.setdefault(keycode or keysym, keysym)
+                    else: pressed.pop(keycode or keysym, None)
+            now = time.monotonic()
+            if now - window_start >= 1.0:
+                if not quiet: print(f"{window_events / (now - window_start):8.0f} events/s  seq {last_seq}  held: {' '.join(sorted(pressed.values())) or '-'}")
+                window_start, window_events = now, 0
+    finally:
+        await messages.aclose()
+    return totals
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Keyboard Tester Pro live event stream tools")
+    parser.add_argument("command", choices=("watch", "serve"), help="watch: subscribe and print; serve: stream synthetic events")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--websocket", action="store_true", help="watch over a WebSocket instead of plain TCP")
+    parser.add_argument("--seconds", type=float, default=None, help="stop after this long")
+    parser.add_argument("--rate", type=float, default=50.0, help="serve: key presses per second")
+    args = parser.parse_args(argv)
+    if args.command == "watch":
+        try:
+            totals = asyncio.run(watch(args.host, args.port, args.websocket, args.seconds))
+        except (OSError, KeyboardInterrupt) as e:
+            if isinstance(e, OSError): print(f"cannot connect to {args.host}:{args.port}: {e}", file=sys.stderr); return 1
+            return 0
+        print(f"{totals['events']} events in {totals['frames']} frames, {totals['states']} state snapshots, {totals['gaps']} gaps")
+        return 0
+    import kbstate
+    engine = kbstate.KeyboardStateEngine()
+    server = EventStreamServer(args.host, args.port)
+    engine.subscribe(server.on_state_change)
+    host, port = server.start()
+    print(f"streaming synthetic events on {host}:{port} (TCP greeting '{TCP_GREETING.decode()}' or WebSocket)")
+    events = kbstate.synthetic_events(1_000_000)
+    start, deadline = time.monotonic(), time.monotonic() + args.seconds if args.seconds else None
+    try:
+        for i, event in enumerate(events):
+            delay = start + i / (2 * args.rate) - time.monotonic()
+            if delay > 0: time.sleep(delay)
+            if deadline and time.monotonic() > deadline: break
+            engine.feed(*event)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,225 @@
+"""Event-rate saturation probe results for Keyboard Tester Pro (no tkinter import).
+
+The app's stress probe (``python pythonkytest.py stress``) offers synthetic
+key events at rising rates; this module holds what is measured per ramp
+step, decides where the machine stops keeping up, and keeps the results
+per machine so stations can be compared and regressions spotted.
+
+Each event is stamped with the moment the offered rate schedules it, so the
+lag seen at handler entry includes any falling behind. A step is saturated
+when that lag keeps growing (least-squares slope of the per-bucket mean lag
+over the step), when events are still queued well after the step ends, or
+when handler time per event has grown several-fold while the handlers keep
+Tk busy. The sustained rate is the fastest step below the saturated ones.
+
+Results go to ``<dir>/<machine id>.stress.json`` (one file per machine,
+newest runs last), so result directories from several stations can simply
+be copied together:
+
+    python kbstress.py sessions/stress        latest result per station, mode and layout
+"""
+import argparse
+import glob
+import json
+import os
+import platform
+import re
+import sys
+
+from kbmetrics import StreamingHistogram
+
+RESULTS_SUFFIX = ".stress.json"
+MAX_RUNS = 50 # Runs kept per machine file
+LAG_BUCKET_MS = 100 # Lag is averaged per bucket of scheduled time before fitting its growth
+LAG_SLOPE_LIMIT = 25.0 # ms of extra lag per second of step: falling 2.5% further behind every second
+HANDLER_GROWTH_LIMIT = 3.0 # Handler time per event relative to the cheapest step...
+BUSY_LIMIT = 0.8 # ...only counts once handlers take this share of the step's wall time
+
+
+class StepStats:
+    """Samples of one ramp step. Times are ms on the probe's clock; handler times are ns."""
+    def __init__(self, rate, start_ms):
+        self.rate = rate
+        self.start_ms = start_ms
+        self.end_ms = None # Injection finished
+        self.drained_ms = None # Last event handled, or the drain timeout
+        self.injected = 0
+        self.handled = 0
+        self.handler_ns = 0
+        self.lag = StreamingHistogram() # us
+        self._lag_sums = {}
+        self._lag_counts = {}
+
+    def observe(self, entry_ms, scheduled_ms, handler_ns):
+        """One probe event reached its handler at entry_ms; scheduled_ms is the time it carried (event.time)."""
+        self.handled += 1
+        self.handler_ns += handler_ns
+        lag_ms = entry_ms - scheduled_ms
+        self.lag.record(lag_ms * 1000)
+        bucket = int((scheduled_ms - self.start_ms) // LAG_BUCKET_MS)
+        self._lag_sums[bucket] = self._lag_sums.get(bucket, 0.0) + lag_ms
+        self._lag_counts[bucket] = self._lag_counts.get(bucket, 0) + 1
+
+    def add_handler_ns(self, handler_ns):
+        """Handler time not tied to one event (e.g. a coalesced batch drain)."""
+        self.handler_ns += handler_ns
+
+    def lag_slope(self):
+        """Least-squares growth of the mean lag in ms per second of the step (0 with under 3 buckets)."""
+        points = [((bucket + 0.5) * LAG_BUCKET_MS / 1000, self._lag_sums[bucket] / count) for bucket, count in self._lag_counts.items()]
+        if len(points) < 3: return 0.0
+        mean_x = sum(x for x, _ in points) / len(points)
+        mean_y = sum(y for _, y in points) / len(points)
+        var_x = sum((x - mean_x) ** 2 for x, _ in points)
+        return sum((x - mean_x) * (y - mean_y) for x, y in points) / var_x if var_x else 0.0
+
+    def summary(self):
+        lag = self.lag.summary()
+        end_ms = self.end_ms if self.end_ms is not None else self.start_ms
+        wall_ms = max(1e-3, (self.drained_ms if self.drained_ms is not None else end_ms) - self.start_ms)
+        return {"rate": self.rate, "injected": self.injected, "handled": self.handled, "backlog": max(0, self.injected - self.handled),
+                "duration_s": round((end_ms - self.start_ms) / 1000, 3),
+                "drain_ms": round((self.drained_ms - end_ms) if self.drained_ms is not None else 0.0, 1),
+                "lag_ms": {key: round(lag[key] / 1000, 1) for key in ("p50", "p95", "p99", "max")},
+                "lag_slope_ms_per_s": round(self.lag_slope(), 2) or 0.0,
+                "handler_us_per_event": round(self.handler_ns / self.handled / 1000, 2) if self.handled else 0.0,
+                "busy": round(self.handler_ns / 1e6 / wall_ms, 3)}
+
+
+class StressRamp:
+    """Rate schedule and verdict: the rate grows by `factor` per step until `confirm_steps` steps in a
+    row are saturated, or a step at `max_rate` has run."""
+    def __init__(self, start_rate=500, factor=1.5, max_rate=50_000, confirm_steps=2,
+                 lag_slope_limit=LAG_SLOPE_LIMIT, handler_growth_limit=HANDLER_GROWTH_LIMIT):
+        self.rate = start_rate
+        self.factor = factor
+        self.max_rate = max_rate
+        self.confirm_steps = max(1, confirm_steps)
+        self.lag_slope_limit = lag_slope_limit
+        self.handler_growth_limit = handler_growth_limit
+        self.steps = []
+        self.done = False
+
+    def saturation_reasons(self, step):
+        reasons = []
+        if step["lag_slope_ms_per_s"] > self.lag_slope_limit:
+            reasons.append(f"lag growing {step['lag_slope_ms_per_s']:.0f} ms/s")
+        if step["backlog"]:
+            reasons.append(f"{step['backlog']} events still queued {step['drain_ms']:.0f} ms after the step")
+        costs = [s["handler_us_per_event"] for s in self.steps if s["handled"]]
+        if costs and min(costs) > 0 and step["busy"] > BUSY_LIMIT:
+            growth = step["handler_us_per_event"] / min(costs)
+            if growth > self.handler_growth_limit: reasons.append(f"handler time x{growth:.1f} at {step['busy']:.0%} busy")
+        return reasons
+
+    def add(self, step):
+        """Records a finished step's summary; returns False once the ramp is over."""
+        step["saturated"] = self.saturation_reasons(step)
+        self.steps.append(step)
+        recent = self.steps[-self.confirm_steps:]
+        if self.rate >= self.max_rate or (len(recent) == self.confirm_steps and all(s["saturated"] for s in recent)):
+            self.done = True
+        else:
+            self.rate = min(self.max_rate, max(self.rate + 1, round(self.rate * self.factor)))
+        return not self.done
+
+    def verdict(self):
+        """{"sustained_rate", "saturation_rate", "reasons"}; saturation_rate is None if every rate was kept up with."""
+        first = len(self.steps)
+        while first > 0 and self.steps[first - 1]["saturated"]: first -= 1
+        passed = [s["rate"] for s in self.steps[:first] if not s["saturated"]]
+        if first == len(self.steps):
+            return {"sustained_rate": max(passed, default=None), "saturation_rate": None,
+                    "reasons": [f"kept up at every rate up to {self.max_rate}/s"]}
+        return {"sustained_rate": max(passed, default=None), "saturation_rate": self.steps[first]["rate"],
+                "reasons": self.steps[first]["saturated"]}
+
+
+def machine_id():
+    """File-name-safe name of this machine (its host name)."""
+    return re.sub(r"[^A-Za-z0-9_.-]+", "_", platform.node()).strip("._") or "unknown-host"
+
+
+def machine_info(extra=None):
+    info = {"id": machine_id(), "host": platform.node(), "platform": platform.platform(), "machine": platform.machine(),
+            "processor": platform.processor(), "cpus": os.cpu_count(), "python": platform.python_version()}
+    if extra: info.update(extra)
+    return info
+
+
+def config_key(run):
+    """Runs are only compared with runs of the same mode, layout and input settings."""
+    settings = run.get("settings", {})
+    return (run.get("mode"), run.get("layout"), tuple(sorted((k, str(v)) for k, v in settings.items())))
+
+
+def load_history(path):
+    try:
+        with open(path, encoding="utf-8") as f: history = json.load(f)
+    except FileNotFoundError:
+        return {"machine": None, "runs": []}
+    history.setdefault("runs", [])
+    return history
+
+
+def save_run(directory, run, keep=MAX_RUNS):
+    """Appends a run to its machine's results file; returns (path, the previous comparable run or None)."""
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, run["machine"]["id"] + RESULTS_SUFFIX)
+    history = load_history(path)
+    key = config_key(run)
+    previous = next((r for r in reversed(history["runs"]) if config_key(r) == key), None)
+    history["machine"] = run["machine"]
+    history["runs"] = (history["runs"] + [run])[-keep:]
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f: json.dump(history, f, indent=2)
+    os.replace(tmp_path, path)
+    return path, previous
+
+
+def compare_runs(run, previous, tolerance=0.2):
+    """Lines describing a regression against the previous comparable run (empty if none)."""
+    if previous is None: return []
+    old, new = previous.get("sustained_rate"), run.get("sustained_rate")
+    if not old: return []
+    if not new or new < old * (1 - tolerance):
+        return [f"sustained rate {old}/s -> {new or 0}/s since {previous.get('generated', 'the previous run')} "
+                f"({((new or 0) / old - 1) * 100:+.0f}%)"]
+    return []
+
+
+def format_report(run):
+    lines = [f"Stress probe on {run['machine']['id']}: mode {run['mode']}, layout {run['layout']}",
+             f"{'rate/s':>8}{'handled':>9}{'lag p50':>9}{'p95':>7}{'max ms':>8}{'ms/s':>8}{'us/event':>10}{'busy':>6}  saturated"]
+    for step in run["steps"]:
+        lag = step["lag_ms"]
+        lines.append(f"{step['rate']:>8}{step['handled']:>9}{lag['p50']:>9.1f}{lag['p95']:>7.1f}{lag['max']:>8.1f}"
+                     f"{step['lag_slope_ms_per_s']:>8.1f}{step['handler_us_per_event']:>10.1f}{step['busy']:>6.0%}  {'; '.join(step['saturated'])}")
+    rate = run["sustained_rate"]
+    lines.append(f"Sustained: {f'{rate} events/s' if rate else 'none of the tested rates'}"
+                 + (f"; saturated at {run['saturation_rate']}/s" if run["saturation_rate"] else "") + f" ({'; '.join(run['reasons'])})")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare saved Keyboard Tester Pro stress probe results across stations")
+    parser.add_argument("directory", nargs="?", default=os.path.join("sessions", "stress"))
+    args = parser.parse_args(argv)
+    paths = sorted(glob.glob(os.path.join(args.directory, "*" + RESULTS_SUFFIX)))
+    if not paths:
+        print(f"No {RESULTS_SUFFIX} files in {args.directory}; run 'python pythonkytest.py stress' on each station first")
+        return 1
+    print(f"{'station':<24}{'mode':<18}{'layout':<22}{'sustained/s':>12}{'previous':>10}  {'date':<20}{'Tk':<8}")
+    for path in paths:
+        history = load_history(path)
+        latest = {}
+        for run in history["runs"]: latest.setdefault(config_key(run), []).append(run)
+        for runs in latest.values():
+            run, previous = runs[-1], (runs[-2] if len(runs) > 1 else None)
+            print(f"{run['machine']['id'][:23]:<24}{run['mode'][:17]:<18}{run['layout'][:21]:<22}{run['sustained_rate'] or 0:>12}"
+                  f"{(previous['sustained_rate'] or 0) if previous else '-':>10}  {run['generated']:<20}{run['machine'].get('tk', ''):<8}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
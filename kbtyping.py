@@ -0,0 +1,288 @@
+"""Typing test engine for Keyboard Tester Pro (no tkinter import).
+
+WordCorpus serves words from a one-word-per-line UTF-8 list (extra columns,
+e.g. frequencies, are ignored). The list is memory-mapped, and a compact
+index is cached next to it in ``<list>.kbidx``:
+
+    header    magic, version, list size + mtime, word count
+    starts    u32 per word length 0..MAX_WORD_LEN+1: first index entry of that length
+    offsets   u32 per word: byte offset of the word in the list
+    meta      u32 per word: letter mask (bits 0-25 a-z, bit 26 anything else) | byte length << 27
+
+Entries are sorted by word length, so a length range is one slice and a
+letter-set filter is a mask test. Opening a list with a current index maps
+the two files and parses nothing, whatever their size. The index is in
+native byte order; it is a cache and is rebuilt whenever it is missing or stale.
+
+TypingSession scores a test incrementally: every keystroke and backspace
+updates a few counters, so WPM, accuracy and the per-key error counts are
+O(1) to read at any time.
+
+    python kbtyping.py index words.txt               build (or refresh) the index
+    python kbtyping.py sample words.txt --letters asdfjkl --min 3 --max 6
+"""
+import argparse
+import array
+import mmap
+import os
+import random
+import re
+import struct
+import sys
+import time
+
+MAX_WORD_LEN = 31 # Characters and UTF-8 bytes; longer words are not indexed
+OTHER_BIT = 1 << 26 # Any character outside a-z (case-folded)
+LETTER_BITS = OTHER_BIT - 1
+INDEX_MAGIC = b"KBWIDX1\0"
+INDEX_VERSION = 1
+INDEX_HEADER = struct.Struct("<8sIQdI")          # magic, version, list size, list mtime, word count
+INDEX_SUFFIX = ".kbidx"
+_WORD_RE = re.compile(rb"^[ \t]*([^\s]+)", re.M)
+_CHAR_BITS = {chr(c): 1 << (c - ord('a')) for c in range(ord('a'), ord('z') + 1)}
+
+# Fallback corpus when no word list is configured: common English words
+BUILTIN_WORDS = """the be of and a to in he have it that for they with as not on she at by this we you do but from or
+which one would all will there say who make when can more if no man out other so what time up go about than into could
+state only new year some take come these know see use get like then first any work now may such give over think most
+even find day also after way many must look before great back through long where much should well people down own just
+because good each those feel seem how high too place little world very still nation hand old life tell write become here
+show house both between need mean call develop under last right move thing general school never same another begin while
+number part turn real leave might want point form off child few small since against ask late home interest large person
+end open public follow during present without again hold govern around possible head consider word program problem however
+lead system set order eye plan run keep face fact group play stand increase early course change help line""".split()
+
+
+def letter_mask(text):
+    """Bit mask of the letters in text (case-folded); OTHER_BIT if it has anything outside a-z."""
+    mask = 0
+    for char in text.lower(): mask |= _CHAR_BITS.get(char, OTHER_BIT)
+    return mask
+
+
+class WordCorpus:
+    """Random words by length range and allowed letter set, from a memory-mapped word list and its index."""
+    MAX_TRIES = 64 # Rejection-sampling attempts per word before falling back to a filtered scan
+
+    def __init__(self, data, starts, offsets, meta, name="<words>"):
+        self.data = data # bytes or mmap of the word list
+        self.starts, self.offsets, self.meta = starts, offsets, meta
+        self.name = name
+        self._candidates = {} # (lo, hi, forbidden) -> matching entry indexes, for very selective filters
+        self._maps = []
+
+    @classmethod
+    def from_words(cls, words, name="<builtin>"):
+        data = "\n".join(words).encode("utf-8")
+        return cls(data, *build_index(data), name=name)
+
+    @classmethod
+    def open(cls, path, write_index=True):
+        """Maps a word list, reusing <path>.kbidx if it is current and (re)building it otherwise."""
+        with open(path, "rb") as f:
+            stat = os.fstat(f.fileno())
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if stat.st_size else b""
+        index_path = path + INDEX_SUFFIX
+        loaded = _load_index(index_path, stat)
+        if loaded is not None:
+            index_map, starts, offsets, meta = loaded
+            corpus = cls(data, starts, offsets, meta, name=path)
+            corpus._maps.append(index_map)
+            return corpus
+        starts, offsets, meta = build_index(data)
+        if write_index:
+            try:
+                _write_index(index_path, stat, starts, offsets, meta)
+            except OSError:
+                pass # Read-only location: keep the index in memory only
+        return cls(data, starts, offsets, meta, name=path)
+
+    def __len__(self): return len(self.offsets)
+
+    def word(self, i):
+        offset, meta = self.offsets[i], self.meta[i]
+        return bytes(self.data[offset:offset + (meta >> 27)]).decode("utf-8", "replace")
+
+    def sample(self, rng, count, min_len=1, max_len=MAX_WORD_LEN, letters=None):
+        """count random words of min_len..max_len characters using only `letters` (any word if None or empty).
+        Returns fewer words (possibly none) if the filter matches nothing."""
+        min_len, max_len = max(1, min_len), min(MAX_WORD_LEN, max_len)
+        if min_len > max_len: return []
+        lo, hi = self.starts[min_len], self.starts[max_len + 1]
+        if hi <= lo: return []
+        forbidden = (OTHER_BIT | LETTER_BITS) & ~letter_mask("".join(letters.split())) if letters else 0
+        meta, words, randrange = self.meta, [], rng.randrange
+        candidates = self._candidates.get((lo, hi, forbidden))
+        for _ in range(count):
+            if candidates is None:
+                for _try in range(self.MAX_TRIES):
+                    i = randrange(lo, hi)
+                    if not meta[i] & forbidden:
+                        words.append(self.word(i))
+                        break
+                else:
+                    candidates = self._candidates[(lo, hi, forbidden)] = [i for i in range(lo, hi) if not meta[i] & forbidden]
+            if candidates is not None:
+                if not candidates: break
+                words.append(self.word(candidates[randrange(len(candidates))]))
+        return words
+
+    def close(self):
+        for view in (self.starts, self.offsets, self.meta):
+            if isinstance(view, memoryview): view.release()
+        for m in self._maps: m.close()
+        if isinstance(self.data, mmap.mmap): self.data.close()
+
+
+def build_index(data):
+    """(starts, offsets, meta) arrays for a word list held in bytes or an mmap."""
+    buckets = [[] for _ in range(MAX_WORD_LEN + 1)]
+    for match in _WORD_RE.finditer(data):
+        raw = match.group(1)
+        if len(raw) > MAX_WORD_LEN: continue
+        word = raw.decode("utf-8", "replace")
+        buckets[len(word)].append((match.start(1), letter_mask(word) | len(raw) << 27))
+    starts, offsets, meta = array.array("I", [0]), array.array("I"), array.array("I")
+    for bucket in buckets:
+        for offset, word_meta in bucket: offsets.append(offset); meta.append(word_meta)
+        starts.append(len(offsets))
+    return starts, offsets, meta
+
+
+def _write_index(index_path, stat, starts, offsets, meta):
+    tmp_path = index_path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(INDEX_HEADER.pack(INDEX_MAGIC, INDEX_VERSION, stat.st_size, stat.st_mtime, len(offsets)))
+        starts.tofile(f); offsets.tofile(f); meta.tofile(f)
+    os.replace(tmp_path, index_path)
+
+
+def _load_index(index_path, stat):
+    """(mmap, starts, offsets, meta) views of a current index file, or None if it is missing or stale."""
+    try:
+        f = open(index_path, "rb")
+    except OSError:
+        return None
+    with f:
+        header = f.read(INDEX_HEADER.size)
+        if len(header) < INDEX_HEADER.size: return None
+        magic, version, size, mtime, count = INDEX_HEADER.unpack(header)
+        expected = INDEX_HEADER.size + 4 * (MAX_WORD_LEN + 2 + 2 * count)
+        if (magic, version, size, mtime) != (INDEX_MAGIC, INDEX_VERSION, stat.st_size, stat.st_mtime): return None
+        if os.fstat(f.fileno()).st_size != expected: return None
+        index_map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    view = memoryview(index_map)[INDEX_HEADER.size:]
+    starts = view[:4 * (MAX_WORD_LEN + 2)].cast("I")
+    offsets = view[4 * (MAX_WORD_LEN + 2):4 * (MAX_WORD_LEN + 2 + count)].cast("I")
+    meta = view[4 * (MAX_WORD_LEN + 2 + count):].cast("I")
+    return index_map, starts, offsets, meta
+
+
+class TypingSession:
+    """Incremental scoring of one typing test against a growing target text.
+
+    Each typed character is compared with the target character at the cursor. ``key_of(char)`` maps a
+    target character to the layout key id it is typed on (-1 if none), and the caller passes the key id
+    actually pressed, so errors are counted against physical keys: ``key_attempts``/``key_misses`` per
+    expected key and ``key_wrong_hits`` per key pressed instead. Backspace undoes the text, not the
+    keystroke counts (accuracy counts every keystroke, as in Monkeytype).
+    """
+    def __init__(self, words, key_count=0, key_of=None):
+        self.target = list(" ".join(words))
+        self.typed_ok = bytearray() # 1 per typed position whose character was right
+        self.key_of = key_of or (lambda char: -1)
+        self._key_cache = {}
+        self.keystrokes = self.correct_keystrokes = 0
+        self.correct_chars = 0 # Positions currently typed right
+        self.key_attempts = [0] * key_count
+        self.key_misses = [0] * key_count
+        self.key_wrong_hits = [0] * key_count
+        self.started_ms = None # Wall-clock time of the first keystroke (time.monotonic() in ms)
+
+    @property
+    def position(self): return len(self.typed_ok)
+
+    def extend(self, words):
+        """Appends more words to the target; returns the text appended."""
+        text = (" " if self.target else "") + " ".join(words)
+        self.target.extend(text)
+        return text
+
+    def expected_key(self, char):
+        key_id = self._key_cache.get(char)
+        if key_id is None: key_id = self._key_cache[char] = self.key_of(char)
+        return key_id
+
+    def type_char(self, char, pressed_key=-1, now_ms=None):
+        """Scores one typed character; returns True if it matched the target. Past the end of the target it is ignored."""
+        pos = len(self.typed_ok)
+        if pos >= len(self.target): return False
+        if self.started_ms is None: self.started_ms = time.monotonic() * 1000 if now_ms is None else now_ms
+        expected = self.target[pos]
+        ok = char == expected
+        self.typed_ok.append(ok)
+        self.keystrokes += 1
+        key_id = self.expected_key(expected)
+        if key_id >= 0: self.key_attempts[key_id] += 1
+        if ok:
+            self.correct_keystrokes += 1; self.correct_chars += 1
+        else:
+            if key_id >= 0: self.key_misses[key_id] += 1
+            if pressed_key >= 0 and pressed_key != key_id: self.key_wrong_hits[pressed_key] += 1
+        return ok
+
+    def backspace(self):
+        """Removes the last typed character; returns its position, or -1 at the start."""
+        if not self.typed_ok: return -1
+        self.correct_chars -= self.typed_ok.pop()
+        return len(self.typed_ok)
+
+    def elapsed_s(self, now_ms=None):
+        if self.started_ms is None: return 0.0
+        return max(0.0, ((time.monotonic() * 1000 if now_ms is None else now_ms) - self.started_ms) / 1000)
+
+    def stats(self, elapsed_s):
+        """WPM (correct characters / 5 per minute), raw WPM (all typed characters), accuracy (% of keystrokes right)."""
+        minutes = elapsed_s / 60
+        return {"wpm": self.correct_chars / 5 / minutes if minutes > 0 else 0.0,
+                "raw_wpm": len(self.typed_ok) / 5 / minutes if minutes > 0 else 0.0,
+                "accuracy": 100.0 * self.correct_keystrokes / self.keystrokes if self.keystrokes else 100.0,
+                "keystrokes": self.keystrokes, "errors": self.keystrokes - self.correct_keystrokes, "chars": len(self.typed_ok)}
+
+    def worst_keys(self, limit=5, min_attempts=3):
+        """[(key id, miss rate, attempts)] of the keys missed most often, highest rate first."""
+        rates = [(key_id, misses / attempts, attempts) for key_id, (misses, attempts) in enumerate(zip(self.key_misses, self.key_attempts))
+                 if misses and attempts >= min_attempts]
+        rates.sort(key=lambda item: (-item[1], -item[2]))
+        return rates[:limit]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Keyboard Tester Pro typing test word lists")
+    parser.add_argument("command", choices=("index", "sample"))
+    parser.add_argument("wordlist", help="UTF-8 word list, one word per line")
+    parser.add_argument("--count", type=int, default=20)
+    parser.add_argument("--min", type=int, default=1, dest="min_len")
+    parser.add_argument("--max", type=int, default=MAX_WORD_LEN, dest="max_len")
+    parser.add_argument("--letters", default=None, help="only words made of these letters")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args(argv)
+    if args.command == "index" and os.path.exists(args.wordlist + INDEX_SUFFIX): os.remove(args.wordlist + INDEX_SUFFIX)
+    start = time.perf_counter()
+    corpus = WordCorpus.open(args.wordlist)
+    opened_ms = (time.perf_counter() - start) * 1000
+    if args.command == "index":
+        counts = [corpus.starts[n + 1] - corpus.starts[n] for n in range(MAX_WORD_LEN + 1)]
+        print(f"{len(corpus)} words indexed in {opened_ms:.0f} ms -> {args.wordlist + INDEX_SUFFIX}")
+        print("by length: " + ", ".join(f"{n}:{c}" for n, c in enumerate(counts) if c))
+    else:
+        start = time.perf_counter()
+        words = corpus.sample(random.Random(args.seed), args.count, args.min_len, args.max_len, args.letters)
+        print(" ".join(words))
+        print(f"opened in {opened_ms:.1f} ms, sampled {len(words)} words in {(time.perf_counter() - start) * 1000:.2f} ms", file=sys.stderr)
+    corpus.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,7 +1,28 @@
+import argparse
+import collections
+import collections.abc
+import importlib.util
+import json
+import os
+import random
+import sys
+import time
+import types
 import tkinter as tk
 from tkinter import ttk
 import tkinter.font # Explicitly import tkinter.font
-from tkinter.scrolledtext import ScrolledText # For the event logger
+
+from kbstate import KeyboardStateEngine, InputCoalescer, PRESS, RELEASE, MODIFIER_BITS, TOGGLE_KEYSYMS, modifier_mask
+from kbrecord import SessionRecorder, new_session_path
+from kbmetrics import StreamingHistogram
+from kbhealth import KeyHealthAnalyzer
+from kbprofile import HotPathProfiler
+from kbevdev import EvdevReader, find_keyboards, CHAR_KEYSYMS
+from kblog import EventStore, EventFilter, FilteredView
+from kbstress import StepStats, StressRamp, machine_info, save_run, compare_runs, format_report
+from kbtyping import WordCorpus, TypingSession, BUILTIN_WORDS, MAX_WORD_LEN
+HAVE_NUMPY = importlib.util.find_spec("numpy") is not None # NumPy is optional; without it the Heatmap mode is not offered
+kbstats = None # Imported (with NumPy) when the Heatmap mode is first built
 
 # --- Style Configuration (Monkeytype-inspired) ---
 STYLE_CONFIG = {
@@ -22,17 +43,80 @@ STYLE_CONFIG = {
     "key_relief": tk.FLAT,
     "key_borderwidth": 2,
     "highlight_thickness": 0,
+    "key_renderer": "canvas", # "canvas" (single tk.Canvas) or "buttons" (one tk.Button per key)
+    "canvas_key_gap": 3,
+    "key_sunken_outline": "#16171a",
+    "layout_cache_size": 4, # Built layouts kept alive for instant switching (LRU)
+    "layout_prebuild_count": 2, # Neighbouring layouts to prebuild when idle; 0 disables
+    "layout_prebuild_delay_ms": 150,
+    "log_store_capacity": 2_000_000, # Events the Event Logger keeps in memory; the oldest half is dropped when full
+    "log_flush_interval_ms": 16, # Event log view is redrawn at most once per frame
+    "log_match_fg": "#e2b714", # Filter matches when the log shows all events
+    "log_current_bg": "#3a3d42", # Match selected with Prev/Next
+    "session_dir": "sessions", # Where recorded .kbts sessions and reports are written
+    "latency_monitor": True, # Time every key event from handler entry to painted update
+    "latency_overlay_refresh_ms": 500,
+    "input_coalescing": True, # Repaint key visuals once per frame with autorepeat folded (logs and recordings still get every event)
+    "input_drain_ms": 0, # 0 drains when Tk goes idle (after_idle); >0 drains on a fixed after() tick
+    "input_backend": "tk", # "evdev": read keys straight from /dev/input on Linux (also: KBTEST_EVDEV=auto|DEVICE|FILE)
+    "evdev_source": "auto", # evdev device or recorded evdev stream; "auto" picks the first keyboard found
+    "evdev_poll_ms": 4, # How often the Tk thread collects the evdev reader thread's events
+    "stream_server": False, # Publish key events to local viewers (see kbstream.py; also: KBTEST_STREAM=[host:]port)
+    "stream_host": "127.0.0.1", # Use "0.0.0.0" to let other machines on the network watch this station
+    "stream_port": 8765,
+    "stream_frame_ms": 50, # Events are sent to viewers in one frame per interval
+    "stream_client_queue": 256, # Frames a viewer may fall behind before its backlog is replaced by a state snapshot
+    "stress_start_rate": 500, # Key events/s offered by the first step of the stress probe (python pythonkytest.py stress)
+    "stress_rate_factor": 1.5, # Each step offers this many times the previous rate
+    "stress_max_rate": 50_000,
+    "stress_step_ms": 2000, # How long each rate is held
+    "stress_tick_ms": 5, # Injection timer; each tick generates the events the rate has scheduled since the last one
+    "stress_drain_timeout_ms": 1000, # Events still queued this long after a step count as a backlog
+    "stress_regression_tolerance": 0.2, # A sustained rate this much below the machine's previous comparable run is a regression
+    "health_chatter_ms": 10, # A press this soon after the same key's release counts as switch chatter
+    "health_ghost_window_ms": 2, # Presses this close together while 2+ keys are held are ghosting suspects
+    "key_suspect_bg": "#7a2e2e", # Resting colour of keys the health analyzer flagged
+    "profiler": False, # Start with the hot-path timers on (also: KBTEST_PROFILE=1)
+    "profiler_refresh_ms": 1000, # How often the info bar shows the profiler's rolling figures
+    "profile_dump_path": None, # cProfile the whole run and write pstats here on exit (also: KBTEST_PROFILE_DUMP=path)
+    "typing_corpus": None, # One-word-per-line word list for the Typing Test (None: a built-in list of common English words)
+    "typing_default_seconds": 30,
+    "typing_refresh_ms": 100, # How often the live WPM/accuracy figures are refreshed
+    "typing_pending_fg": "#7a7d82",
+    "typing_correct_fg": "#d4d4d4",
+    "typing_error_fg": "#ca4754",
+    "typing_caret_bg": "#e2b714",
+    "heatmap_refresh_ms": 250, # Heatmap colours are recomputed at most this often
+    "heatmap_colors": ("#2d4f73", "#7a6a1f", "#a63a24"), # Low -> high; keys without data keep key_bg
 }
-try:
-    # Test if font exists
-    _test_label = tk.Label(font=(STYLE_CONFIG["font_family"], STYLE_CONFIG["font_size_normal"]))
-    _test_label.destroy()
-except tk.TclError:
-    STYLE_CONFIG["font_family"] = "Arial" # A common fallback
 
 # --- Key Definitions Helper (KD) ---
+KeySpec = collections.namedtuple("KeySpec", "label keysyms width height char_override small_font")
+
 def KD(label, keysyms, width=1.0, height=1.0, char_override=None, small_font=False):
-    """Helper to create key definition dictionaries."""
+    """Declares a key. Only the arguments are stored; compile_key_def() expands them when the layout is first used."""
+    return KeySpec(label, keysyms, width, height, char_override, small_font)
+
+class KeyDef:
+    """A compiled key. keysyms is a frozenset; modifier_mask has the kbstate.MODIFIER_BITS of the modifier and
+    toggle keysyms the key carries, so "is this key a modifier / is it active" is a single AND."""
+    __slots__ = ("label", "keysyms", "char_override", "width_factor", "height_factor", "small_font", "modifier_mask")
+
+    def __init__(self, label, keysyms, char_override=None, width_factor=1.0, height_factor=1.0, small_font=False):
+        self.label = label
+        self.keysyms = frozenset(keysyms)
+        self.char_override = char_override
+        self.width_factor = width_factor
+        self.height_factor = height_factor
+        self.small_font = small_font
+        self.modifier_mask = modifier_mask(self.keysyms)
+
+    def __repr__(self):
+        return f"KeyDef({self.label!r}, {sorted(self.keysyms)!r}, width={self.width_factor}, height={self.height_factor})"
+
+def compile_key_def(spec):
+    """Expands a KD() declaration into a KeyDef."""
+    label, keysyms, width, height, char_override, small_font = spec
     if isinstance(keysyms, str):
         keysyms = [keysyms]
     final_keysyms = set()
@@ -58,10 +142,38 @@ def KD(label, keysyms, width=1.0, height=1.0, char_override=None, small_font=Fal
             punct_map_qwerty = {'`': ['grave', 'asciitilde'], '-': ['minus', 'underscore'], '=': ['equal', 'plus'], '[': ['bracketleft', 'braceleft'], ']': ['bracketright', 'braceright'], '\\': ['backslash', 'bar'], ';': ['semicolon', 'colon'], "'": ['apostrophe', 'quotedbl'], ',': ['comma', 'less'], '.': ['period', 'greater'], '/': ['slash', 'question']}
             if label in punct_map_qwerty: final_keysyms.update(punct_map_qwerty[label])
 
-    return {'label': label, 'keysyms': list(final_keysyms), 'char_override': char_override, 'width_factor': width, 'height_factor': height, 'small_font': small_font}
+    return KeyDef(label, final_keysyms, char_override, width, height, small_font)
 
 SPACER = "SPACER"
 
+class LazyLayouts(collections.abc.Mapping):
+    """Read-only mapping of layout name -> layout config. Layouts are declared with KD() specs and compiled
+    into slotted KeyDef objects on first access; compiled layouts and (shared) blocks are cached."""
+    def __init__(self, specs):
+        self._specs = specs
+        self._compiled = {}
+        self._compiled_blocks = {}
+
+    def __getitem__(self, layout_name):
+        layout = self._compiled.get(layout_name)
+        if layout is None:
+            layout = self._compiled[layout_name] = {block_name: self._compile_block(rows) for block_name, rows in self._specs[layout_name].items()}
+        return layout
+
+    def __iter__(self): return iter(self._specs)
+    def __len__(self): return len(self._specs)
+
+    def _compile_block(self, rows):
+        compiled = self._compiled_blocks.get(id(rows))
+        if compiled is None:
+            compiled = self._compiled_blocks[id(rows)] = [[key if key == SPACER else compile_key_def(key) for key in row] for row in rows]
+        return compiled
+
+    def is_compiled(self, layout_name): return layout_name in self._compiled
+
+    def clear_compiled(self):
+        self._compiled.clear(); self._compiled_blocks.clear()
+
 # --- Standard Peripheral Blocks (Can be reused by most layouts) ---
 STD_F_KEYS_ROW = [
     [KD('Esc', 'Escape', width=1.4), SPACER, KD('F1', 'F1'), KD('F2', 'F2'), KD('F3', 'F3'), KD('F4', 'F4'), SPACER,
@@ -94,7 +206,7 @@ STD_NUMPAD_BLOCK_COMMA_DECIMAL = [ # Numpad with , as decimal
     [KD('0', ['KP_0', 'KP_Insert'], width=2.3), KD(',', ['KP_Separator', 'KP_Delete'], width=1.1, char_override=',')]]
 
 # --- Layout Definitions (EXTENSIVE LIST) ---
-LAYOUTS = {
+LAYOUTS = LazyLayouts({
     "QWERTY_Full_US": {
         "f_keys_row": STD_F_KEYS_ROW,
         "main_block": [
@@ -227,30 +339,444 @@ LAYOUTS = {
         "edit_block": STD_EDIT_BLOCK, "navigation_block": STD_NAVIGATION_BLOCK,
         "arrow_keys_block": STD_ARROW_KEYS_BLOCK, "numpad_block": STD_NUMPAD_BLOCK_COMMA_DECIMAL
     },
-}
+})
 # --- End of Layout Definitions ---
 
+# --- Compiled Layout Index (keysym/char -> key ids) ---
+# Blocks in the order draw_visual_keyboard draws them; a key's position in this order is its key id.
+LAYOUT_BLOCK_ORDER = ("f_keys_row", "edit_block", "main_block", "navigation_block", "arrow_keys_block", "numpad_block")
+
+def iter_layout_keys(layout_config):
+    """Yields the key definitions of a layout in draw order (SPACERs skipped)."""
+    for block_name in LAYOUT_BLOCK_ORDER:
+        for row_keys in layout_config.get(block_name, ()):
+            for key_def in row_keys:
+                if key_def != SPACER: yield key_def
+
+class LayoutIndex:
+    """Lookup tables for one layout, compiled once: char_override and case folding are resolved up front,
+    and each (keysym, char) pair seen at runtime is memoized so per-event resolution is a single dict hit."""
+    __slots__ = ("name", "key_defs", "char_overrides", "identifiers", "_resolved")
+    MAX_RESOLVED = 4096
+
+    def __init__(self, name, layout_config):
+        self.name = name
+        self.key_defs = tuple(iter_layout_keys(layout_config))
+        char_overrides, identifiers = {}, {}
+        for key_id, key_def in enumerate(self.key_defs):
+            if key_def.char_override: char_overrides.setdefault(key_def.char_override, (key_id,))
+            all_identifiers = {str(identifier).lower() for identifier in key_def.keysyms}
+            if key_def.char_override: all_identifiers.add(str(key_def.char_override).lower())
+            for identifier in all_identifiers: identifiers.setdefault(identifier, []).append(key_id)
+        self.char_overrides = types.MappingProxyType(char_overrides)
+        self.identifiers = types.MappingProxyType({k: tuple(v) for k, v in identifiers.items()})
+        self._resolved = {}
+
+    def lookup(self, keysym, char):
+        """Returns the tuple of key ids an event with this keysym/char should highlight."""
+        try:
+            return self._resolved[(keysym, char)]
+        except KeyError:
+            if len(self._resolved) >= self.MAX_RESOLVED: self._resolved.clear()
+            key_ids = self._resolved[(keysym, char)] = self._resolve(keysym, char)
+            return key_ids
+
+    def _resolve(self, keysym, char):
+        if char and char in self.char_overrides: return self.char_overrides[char]
+        keys_to_check = {keysym, keysym.lower(), keysym.upper()}
+        if char: keys_to_check.add(char)
+        key_ids = set()
+        for k_check in keys_to_check: key_ids.update(self.identifiers.get(str(k_check).lower(), ()))
+        return tuple(sorted(key_ids))
+
+_LAYOUT_INDEXES = {}
+
+def get_layout_index(layout_name):
+    """Returns the compiled LayoutIndex for a LAYOUTS entry, building it on first use."""
+    index = _LAYOUT_INDEXES.get(layout_name)
+    if index is None:
+        index = _LAYOUT_INDEXES[layout_name] = LayoutIndex(layout_name, LAYOUTS[layout_name])
+    return index
+
+
+# --- Incremental Key Renderer ---
+class IncrementalKeyRenderer:
+    """Remembers the bg/relief last applied to each key widget and only calls widget.config() when it changes."""
+    def __init__(self):
+        self.applied = {}
+        self.config_calls = 0
+        self.skipped_calls = 0
+
+    def reset(self):
+        self.applied.clear()
+
+    def track(self, widget, bg, relief):
+        """Registers the visual state a widget was created with, without touching Tk."""
+        self.applied[widget] = (bg, relief)
+
+    def set_visual(self, widget, bg, relief=None):
+        """Applies bg (and relief, if given) to a widget; returns True if a config call was issued."""
+        prev = self.applied.get(widget)
+        if relief is None: relief = prev[1] if prev else STYLE_CONFIG["key_relief"]
+        if prev == (bg, relief):
+            self.skipped_calls += 1
+            return False
+        try:
+            self._apply(widget, bg, relief)
+        except tk.TclError:
+            self.applied.pop(widget, None)
+            return False
+        self.applied[widget] = (bg, relief)
+        self.config_calls += 1
+        return True
+
+    def stats(self):
+        return {"config_calls": self.config_calls, "skipped_calls": self.skipped_calls, "tracked_widgets": len(self.applied)}
+
+    def reset_stats(self):
+        self.config_calls = 0; self.skipped_calls = 0
+
+    def _apply(self, widget, bg, relief):
+        widget.config(bg=bg, relief=relief)
+
+class CanvasKeyRenderer(IncrementalKeyRenderer):
+    """Same diffing, but key handles are canvas item tags; relief is drawn as a dark outline when sunken."""
+    def __init__(self, canvas=None):
+        super().__init__()
+        self.canvas = canvas
+
+    def _apply(self, tag, bg, relief):
+        self.canvas.itemconfigure(tag, fill=bg, outline=STYLE_CONFIG["key_sunken_outline"] if relief == tk.SUNKEN else bg)
+
+# --- Built Layout Cache ---
+class BuiltLayout:
+    """One drawn layout: its frame plus the per-layout key maps the visual mode's handlers read."""
+    __slots__ = ("name", "frame", "renderer", "layout_index", "key_widgets_map", "widget_to_key_def",
+                 "default_bg_colors", "active_toggle_widgets", "key_id_widgets", "toggle_widget_mask", "modifier_widgets", "build_ms")
+
+    def __init__(self, name, frame, renderer, layout_index):
+        self.name = name; self.frame = frame; self.renderer = renderer; self.layout_index = layout_index
+        self.key_widgets_map = {}; self.widget_to_key_def = {}; self.default_bg_colors = {}
+        self.active_toggle_widgets = {}; self.key_id_widgets = []
+        self.toggle_widget_mask = 0; self.modifier_widgets = ()
+        self.build_ms = 0.0
+
+    def index_modifiers(self):
+        """Precomputes the bits of toggles drawn as keys and (keysym, bit, widgets) for every other drawn modifier."""
+        self.toggle_widget_mask = modifier_mask(self.active_toggle_widgets)
+        self.modifier_widgets = tuple((keysym, bit, tuple(self.key_widgets_map[keysym.lower()]))
+                                      for keysym, bit in MODIFIER_BITS.items()
+                                      if keysym not in self.active_toggle_widgets and self.key_widgets_map.get(keysym.lower()))
+
+class LayoutCache:
+    """Bounded LRU of built layouts with hit/miss/eviction counters and per-layout build times."""
+    def __init__(self, capacity, on_evict=None):
+        self.capacity = max(1, capacity)
+        self.on_evict = on_evict
+        self.entries = collections.OrderedDict()
+        self.hits = 0; self.misses = 0; self.evictions = 0; self.prebuilds = 0
+        self.build_ms = {}
+
+    def __contains__(self, name): return name in self.entries
+    def __len__(self): return len(self.entries)
+
+    def get(self, name):
+        built = self.entries.get(name)
+        if built is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(name)
+        return built
+
+    def put(self, name, built):
+        self.entries[name] = built
+        self.entries.move_to_end(name)
+        self.build_ms[name] = built.build_ms
+        while len(self.entries) > self.capacity:
+            _, evicted = self.entries.popitem(last=False)
+            self.evictions += 1
+            if self.on_evict: self.on_evict(evicted)
+
+    def discard(self, name):
+        built = self.entries.pop(name, None)
+        if built is not None and self.on_evict: self.on_evict(built)
+
+    def clear(self):
+        for name in list(self.entries): self.discard(name)
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions, "prebuilds": self.prebuilds,
+                "cached": list(self.entries), "capacity": self.capacity, "build_ms": dict(self.build_ms)}
+
+# --- Input-to-Paint Latency Monitor ---
+class LatencyMonitor:
+    """Times key events through the tool itself, in microseconds:
+    'handler' = handler entry to dispatch done, 'paint' = handler entry to the next idle pass (after Tk has
+    redrawn the changed widgets), 'queue' = estimated time the event waited in the Tk queue, from event.time.
+    With input coalescing on, 'handler' also covers the wait for the event's batch to be drained."""
+    MAX_QUEUE_DELAY_MS = 60_000
+
+    def __init__(self, root):
+        self.root = root
+        self.histograms = {"queue": StreamingHistogram(), "handler": StreamingHistogram(), "paint": StreamingHistogram()}
+        self._pending_starts = []
+        self._idle_scheduled = False
+        self._clock_offset_ms = None # Smallest (host ms - event.time) seen: the zero-queue-delay baseline
+
+    def observe(self, event_time, start_ns):
+        """Records one handled event; start_ns is perf_counter_ns() taken on handler entry."""
+        end_ns = time.perf_counter_ns()
+        self.histograms["handler"].record((end_ns - start_ns) // 1000)
+        if event_time:
+            offset_ms = start_ns // 1_000_000 - event_time
+            if self._clock_offset_ms is None or offset_ms < self._clock_offset_ms or offset_ms - self._clock_offset_ms > self.MAX_QUEUE_DELAY_MS:
+                self._clock_offset_ms = offset_ms # New baseline (first event, a faster event, or the X clock wrapped)
+            self.histograms["queue"].record((offset_ms - self._clock_offset_ms) * 1000)
+        self._pending_starts.append(start_ns)
+        if not self._idle_scheduled:
+            self._idle_scheduled = True
+            self.root.after_idle(self._on_idle)
+
+    def _on_idle(self):
+        self._idle_scheduled = False
+        now_ns = time.perf_counter_ns()
+        record = self.histograms["paint"].record
+        for start_ns in self._pending_starts: record((now_ns - start_ns) // 1000)
+        self._pending_starts.clear()
+
+    def reset(self):
+        for histogram in self.histograms.values(): histogram.reset()
+        self._clock_offset_ms = None
+
+    def summary_text(self):
+        lines = [f"{'us':<8}{'n':>7}{'p50':>7}{'p95':>7}{'p99':>7}{'max':>8}"]
+        for name, histogram in self.histograms.items():
+            st = histogram.summary()
+            lines.append(f"{name:<8}{st['count']:>7}{st['p50']:>7}{st['p95']:>7}{st['p99']:>7}{st['max']:>8}")
+        return "\n".join(lines)
+
+    def report(self, extra=None):
+        report = {"generated": time.strftime("%Y-%m-%d %H:%M:%S"), "unit": "us",
+                  "histograms": {name: {"summary": h.summary(), "buckets": h.nonzero_buckets()} for name, h in self.histograms.items()}}
+        if extra: report.update(extra)
+        return report
+
+    def export_report(self, path=None, extra=None):
+        """Writes report(extra) as JSON (default: a timestamped file in session_dir) and returns the path."""
+        if path is None:
+            os.makedirs(STYLE_CONFIG["session_dir"], exist_ok=True)
+            path = os.path.join(STYLE_CONFIG["session_dir"], time.strftime("latency-%Y%m%d-%H%M%S.json"))
+        with open(path, "w", encoding="utf-8") as f: json.dump(self.report(extra), f, indent=2)
+        return path
+
+# --- Throughput Stress Probe ---
+STRESS_SERIAL = 0x5A17 # event.serial of probe events; real key presses during a run are passed through unmeasured
+STRESS_CHECK_SERIAL = 0x5A18 # Keysym validity checks, swallowed before the app sees them
+STRESS_EXCLUDED_KEYSYMS = frozenset(("Escape", "Tab", "Scroll_Lock") + TOGGLE_KEYSYMS) # Close the app, restart the typing test, flip lock state
+
+class StressProbe:
+    """Finds the key event rate this machine's Tk keeps up with in the current mode and layout.
+
+    KeyPress/KeyRelease pairs for the active layout's keys are queued with event_generate at rates that
+    ramp up per kbstress.StressRamp. Every event carries (as event.time, on the probe's clock) the moment
+    the offered rate schedules it, so lag measured at handler entry includes any falling behind. While it
+    runs, the app's _handle_key_event and _drain_input are shadowed by timing wrappers on the instance.
+    The modes run their usual handlers so their cost is measured; what the probe events added to their
+    state (heatmap stats, logged rows, typed text) is rolled back with snapshot_state()/restore_state().
+    """
+    def __init__(self, app, on_done=None, on_step=None):
+        self.app = app
+        self.root = app.root
+        self.on_done = on_done # on_done(run, regressions) once the run is saved
+        self.on_step = on_step # on_step(step summary) after each ramp step
+        self.mode_name = app.mode_var.get()
+        self.layout_name = app.active_layout_name()
+        self.ramp = StressRamp(STYLE_CONFIG["stress_start_rate"], STYLE_CONFIG["stress_rate_factor"], STYLE_CONFIG["stress_max_rate"])
+        self.keysyms = []
+        self.step = None
+        self.run = None
+        self._epoch_ns = time.perf_counter_ns() - 1_000_000_000 # event.time 0 means "no time", so the clock starts at 1000 ms
+        self._after_id = None
+        self._handle = self._drain = None
+        self._snapshots = {}
+
+    @property
+    def running(self): return self._handle is not None
+
+    def _now_ms(self): return (time.perf_counter_ns() - self._epoch_ns) / 1e6
+
+    def start(self):
+        app = self.app
+        self._snapshots = {name: mode.snapshot_state() for name, mode in app.mode_instances.items()}
+        self._handle, self._drain = app._handle_key_event, app._drain_input
+        app._handle_key_event, app._drain_input = self._probed_handle, self._probed_drain
+        if self.root.winfo_exists(): self.root.focus_set()
+        self.keysyms = self._probe_keysyms(get_layout_index(self.layout_name))
+        if not self.keysyms:
+            self._restore()
+            app.info_label.config(text=f"Stress probe: none of the keys of {self.layout_name} can be generated")
+            return False
+        self._start_step()
+        return True
+
+    def _probe_keysyms(self, layout_index):
+        """One keysym per key of the layout that Tk knows, in a shuffled but repeatable order."""
+        keysyms = []
+        for key_def in layout_index.key_defs:
+            for keysym in sorted(key_def.keysyms):
+                if keysym in STRESS_EXCLUDED_KEYSYMS: break
+                try:
+                    self.root.event_generate("<KeyPress>", keysym=keysym, serial=STRESS_CHECK_SERIAL)
+                except tk.TclError:
+                    continue
+                keysyms.append(keysym)
+                break
+        random.Random(0).shuffle(keysyms)
+        return keysyms
+
+    def _probed_handle(self, event_type, event):
+        serial = event.serial
+        if serial == STRESS_CHECK_SERIAL: return
+        step = self.step
+        if serial != STRESS_SERIAL or step is None or event.time < step.start_ms: # Not ours, or left over from an earlier step
+            self._handle(event_type, event)
+            return
+        start_ns = time.perf_counter_ns()
+        self._handle(event_type, event)
+        step.observe((start_ns - self._epoch_ns) / 1e6, event.time, time.perf_counter_ns() - start_ns)
+
+    def _probed_drain(self):
+        start_ns = time.perf_counter_ns()
+        (self._drain or self.app._drain_input)() # A drain scheduled before _restore() still lands here
+        if self.step is not None and STYLE_CONFIG["input_coalescing"]: # Otherwise it ran inside a timed handler
+            self.step.add_handler_ns(time.perf_counter_ns() - start_ns)
+
+    def _start_step(self):
+        self.step = StepStats(self.ramp.rate, self._now_ms())
+        self.app.info_label.config(text=f"Stress probe: {self.ramp.rate} events/s...")
+        self._tick()
+
+    def _tick(self):
+        self._after_id = None
+        step = self.step
+        if step is None or not self.root.winfo_exists(): return
+        now = self._now_ms()
+        if step.end_ms is None:
+            elapsed = now - step.start_ms
+            if elapsed >= STYLE_CONFIG["stress_step_ms"]: step.end_ms = now
+            else: self._inject(step, elapsed)
+        if step.end_ms is not None and (step.handled >= step.injected or now - step.end_ms >= STYLE_CONFIG["stress_drain_timeout_ms"]):
+            step.drained_ms = now
+            self._finish_step()
+            return
+        self._after_id = self.root.after(STYLE_CONFIG["stress_tick_ms"], self._tick)
+
+    def _inject(self, step, elapsed_ms):
+        """Queues the press/release pairs the rate has scheduled by now; if Tk falls far behind, at most 50 ms
+        worth per tick, so the backlog shows up as lag instead of freezing the app."""
+        rate = step.rate
+        due = min(int(rate * elapsed_ms / 1000) + 1, step.injected + max(2, rate // 20))
+        ms_per_event = 1000 / rate
+        generate, keysyms, start_ms = self.root.event_generate, self.keysyms, step.start_ms
+        i = step.injected
+        while i < due:
+            keysym = keysyms[(i // 2) % len(keysyms)]
+            generate("<KeyPress>", keysym=keysym, when="tail", time=int(start_ms + i * ms_per_event), serial=STRESS_SERIAL)
+            generate("<KeyRelease>", keysym=keysym, when="tail", time=int(start_ms + (i + 1) * ms_per_event), serial=STRESS_SERIAL)
+            i += 2
+        step.injected = i
+
+    def _finish_step(self):
+        summary, self.step = self.step.summary(), None
+        if self.on_step: self.on_step(summary)
+        if self.ramp.add(summary): self._start_step()
+        else: self._finish()
+
+    def _restore(self):
+        for name in ("_handle_key_event", "_drain_input"): self.app.__dict__.pop(name, None)
+        self._handle = self._drain = None
+
+    def _roll_back(self):
+        """Undoes what the probe events did to the modes and to the live latency and health figures."""
+        app = self.app
+        if STYLE_CONFIG["input_coalescing"]: app._drain_input() # Probe events still queued for the views
+        for name, snapshot in self._snapshots.items():
+            mode = app.mode_instances.get(name)
+            if mode is not None: mode.restore_state(snapshot)
+        self._snapshots = {}
+        if app.latency: app.reset_latency_stats()
+        app.reset_health()
+
+    def cancel(self):
+        if self._after_id is not None: self.root.after_cancel(self._after_id); self._after_id = None
+        self.step = None
+        self._restore()
+        self._roll_back()
+
+    def _finish(self):
+        """Restores the app's handlers, saves the run to the machine's results file and compares it with the previous one."""
+        app = self.app
+        self._restore()
+        root = self.root
+        tk_info = {"tk": str(root.tk.call("info", "patchlevel")), "windowing": str(root.tk.call("tk", "windowingsystem")),
+                   "screen": f"{root.winfo_screenwidth()}x{root.winfo_screenheight()}"}
+        self.run = {"generated": time.strftime("%Y-%m-%d %H:%M:%S"), "machine": machine_info(tk_info),
+                    "mode": self.mode_name, "layout": self.layout_name, "keys": len(self.keysyms),
+                    "settings": {"input_coalescing": STYLE_CONFIG["input_coalescing"], "input_drain_ms": STYLE_CONFIG["input_drain_ms"],
+                                 "key_renderer": STYLE_CONFIG["key_renderer"], "latency_monitor": app.latency is not None,
+                                 "recording": app.recorder is not None, "stream_server": app.stream_server is not None,
+                                 "profiler": app.profiler.enabled, "step_ms": STYLE_CONFIG["stress_step_ms"]},
+                    **self.ramp.verdict(), "steps": self.ramp.steps}
+        path, previous = save_run(os.path.join(STYLE_CONFIG["session_dir"], "stress"), self.run)
+        regressions = compare_runs(self.run, previous, STYLE_CONFIG["stress_regression_tolerance"])
+        root.after_idle(self._settle, path, regressions) # Once probe events left in the Tk queue have been handled
+
+    def _settle(self, path, regressions):
+        self._roll_back()
+        rate = self.run["sustained_rate"]
+        self.app.info_label.config(text=f"Stress probe: sustained {rate or 0} events/s{' (REGRESSION)' if regressions else ''}; saved to {path}")
+        if self.on_done: self.on_done(self.run, regressions)
 
 # --- Base Mode Class ---
 class BaseMode:
+    """A tester mode. The app builds each mode once and then only shows and hides it.
+
+    Modes stay subscribed to the app's KeyboardStateEngine while hidden, so on_state_change
+    must stay cheap when self.visible is False; on_show() catches the UI up when it is shown again.
+    Modes that only repaint key state set ``coalesced`` and get the InputCoalescer's per-frame,
+    autorepeat-folded stream instead of every event.
+    """
+    coalesced = False
+
     def __init__(self, app_controller, parent_frame):
         self.app = app_controller
         self.root = app_controller.root
         self.frame = tk.Frame(parent_frame, bg=STYLE_CONFIG["content_frame_bg"])
+        self.visible = False
+        self.event_source = self.app.input if self.coalesced else self.app.engine
+        self.event_source.subscribe(self.on_state_change)
 
     def activate(self):
-        if self.frame.winfo_exists():
-            self.frame.pack(expand=True, fill=tk.BOTH, padx=5, pady=5)
-        else:
+        if not self.frame.winfo_exists():
             self.frame = tk.Frame(self.app.content_frame, bg=STYLE_CONFIG["content_frame_bg"])
             self._build_ui()
-            self.frame.pack(expand=True, fill=tk.BOTH, padx=5, pady=5)
+        self.frame.pack(expand=True, fill=tk.BOTH, padx=5, pady=5)
+        self.visible = True
+        self.on_show()
 
     def deactivate(self):
+        self.visible = False
         if self.frame.winfo_exists():
             self.frame.pack_forget()
 
+    def on_show(self):
+        """Called each time the mode becomes visible."""
+        pass
+
     def destroy_ui(self):
+        """Tears the mode down for good: stops its event feed and destroys its widgets."""
+        self.event_source.unsubscribe(self.on_state_change)
         if self.frame.winfo_exists():
             for widget in self.frame.winfo_children():
                 if widget.winfo_exists():
@@ -259,8 +785,25 @@ class BaseMode:
     def _build_ui(self):
         pass
 
-    def on_key_press(self, event): pass
-    def on_key_release(self, event): pass
+    def on_key_press(self, event):
+        self.app.input.push(PRESS, event.keysym, event.char, event.keycode, event.state, event.time)
+    def on_key_release(self, event):
+        self.app.input.push(RELEASE, event.keysym, event.char, event.keycode, event.state, event.time)
+
+    def on_state_change(self, event_type, keysym, char, keycode, state, time, modifiers_changed):
+        """Called for every key event (every kept event of each batch if coalesced), whether or not the mode is visible."""
+        pass
+
+    def on_batch_end(self):
+        """Called after each coalesced input batch (see InputCoalescer); a place to repaint once per frame."""
+        pass
+
+    def snapshot_state(self):
+        """State that synthetic input (the stress probe) would change, for restore_state() once it is over."""
+        return None
+
+    def restore_state(self, snapshot):
+        pass
 
     def update_app_info_label(self, text):
         if self.app.info_label and self.app.info_label.winfo_exists():
@@ -268,24 +811,34 @@ class BaseMode:
 
 # --- Visual Keyboard Display Mode ---
 class VisualKeyboardDisplayMode(BaseMode):
+    coalesced = True
+
     def __init__(self, app_controller, parent_frame):
         super().__init__(app_controller, parent_frame)
         self.avg_char_width = self.app.avg_char_width
         self.key_widgets_map = {}
         self.widget_to_key_def = {}
+        self.layout_index = None
+        self.key_id_widgets = []
         self.default_bg_colors = {}
-        self.modifier_keys_state = {
-            'Shift_L': False, 'Shift_R': False, 'Control_L': False, 'Control_R': False,
-            'Alt_L': False, 'Alt_R': False, 'ISO_Level3_Shift': False, 'Caps_Lock': False,
-            'Num_Lock': True, 'Super_L': False, 'Super_R': False, 'Meta_L': False, 'Meta_R': False
-        }
+        self.modifier_keys_state = self.app.engine.modifier_keys_state # Shared with (and updated by) the state engine
         self.active_toggle_widgets = {}
-        self.currently_pressed_physical_keys = set()
+        self.toggle_widget_mask = 0; self.modifier_widgets = ()
+        self.held_keys = self.app.input.held # Key id -> (keysym, char) of its press, as of the last folded batch
+        self._batch_count = 0; self._batch_last = None
+        self._suspect_revision = -1 # KeyHealthAnalyzer.revision the suspect marks were last applied for
+        self.renderer_kind = STYLE_CONFIG["key_renderer"]
+        self.renderer = None
+        self.active_layout = None
+        self.layout_cache = LayoutCache(STYLE_CONFIG["layout_cache_size"], on_evict=self._on_layout_evicted)
+        self.last_switch_ms = 0.0
+        self._prebuild_queue = []
+        self._prebuild_after_id = None
         self._build_ui()
 
     def _build_ui(self):
         super()._build_ui()
-        mode_control_frame = tk.Frame(self.frame, bg=STYLE_CONFIG["content_frame_bg"])
+        self.mode_control_frame = mode_control_frame = tk.Frame(self.frame, bg=STYLE_CONFIG["content_frame_bg"])
         mode_control_frame.pack(fill=tk.X, pady=(0, 10))
         tk.Label(mode_control_frame, text="Keyboard Layout:", bg=STYLE_CONFIG["content_frame_bg"], fg=STYLE_CONFIG["info_fg"], font=(STYLE_CONFIG["font_family"], STYLE_CONFIG["font_size_normal"])).pack(side=tk.LEFT, padx=(0,5))
         self.layout_var = tk.StringVar(master=self.root, value=list(LAYOUTS.keys())[0])
@@ -294,10 +847,14 @@ class VisualKeyboardDisplayMode(BaseMode):
         layout_menu.bind("<<ComboboxSelected>>", self.on_layout_config_change)
         self.keyboard_draw_area = tk.Frame(self.frame, bg=STYLE_CONFIG["content_frame_bg"])
         self.keyboard_draw_area.pack(expand=True, fill=tk.BOTH)
-        self.draw_visual_keyboard(self.layout_var.get())
+        self.layout_cache.clear(); self.active_layout = None
+        self.show_layout(self.layout_var.get())
 
     def on_layout_config_change(self, event=None):
-        self.draw_visual_keyboard(self.layout_var.get())
+        layout_name = self.layout_var.get()
+        was_cached = layout_name in self.layout_cache
+        self.show_layout(layout_name)
+        super().update_app_info_label(f"Layout {layout_name}: {'cached' if was_cached else 'built'} in {self.last_switch_ms:.1f} ms")
         if self.root.winfo_exists(): self.root.focus_set()
 
     def _create_key_button(self, parent_frame, key_def):
@@ -307,26 +864,32 @@ class VisualKeyboardDisplayMode(BaseMode):
             spacer = tk.Frame(parent_frame, width=max(5, spacer_width_px), height=1, bg=STYLE_CONFIG["content_frame_bg"])
             spacer.pack(side=tk.LEFT)
             return None
-        label = key_def['label']
-        width = int(STYLE_CONFIG["base_key_width"] * key_def['width_factor'])
-        height = int(STYLE_CONFIG["base_key_height"] * key_def['height_factor'])
-        font_size = STYLE_CONFIG["font_size_small"] if key_def.get('small_font') else STYLE_CONFIG["font_size_normal"]
+        label = key_def.label
+        width = int(STYLE_CONFIG["base_key_width"] * key_def.width_factor)
+        height = int(STYLE_CONFIG["base_key_height"] * key_def.height_factor)
+        font_size = STYLE_CONFIG["font_size_small"] if key_def.small_font else STYLE_CONFIG["font_size_normal"]
         btn = tk.Button(parent_frame, text=label, width=width, height=height, bg=STYLE_CONFIG["key_bg"], fg=STYLE_CONFIG["key_fg"], font=(STYLE_CONFIG["font_family"], font_size), relief=STYLE_CONFIG["key_relief"], borderwidth=STYLE_CONFIG["key_borderwidth"], highlightthickness=STYLE_CONFIG["highlight_thickness"], activebackground=STYLE_CONFIG["key_pressed_bg"], activeforeground=STYLE_CONFIG["key_fg"])
-        ipady_val = 3 if key_def['height_factor'] > 1.5 else 1
+        ipady_val = 3 if key_def.height_factor > 1.5 else 1
         padx_val, pady_val = (1,1)
-        if key_def['width_factor'] < 0.8 or key_def['height_factor'] < 0.8 : padx_val, pady_val = (0,0); ipady_val = 0
+        if key_def.width_factor < 0.8 or key_def.height_factor < 0.8 : padx_val, pady_val = (0,0); ipady_val = 0
         btn.pack(side=tk.LEFT, padx=padx_val, pady=pady_val, ipady=ipady_val)
-        self.default_bg_colors[btn] = STYLE_CONFIG["key_bg"]
-        self.widget_to_key_def[btn] = key_def
-        all_identifiers = set(key_def['keysyms'])
-        if key_def.get('char_override'): all_identifiers.add(key_def['char_override'])
+        self._register_key(btn, key_def)
+        return btn
+
+    def _register_key(self, handle, key_def):
+        """Records a drawn key (a Button, or a canvas item tag) in the lookup maps; handles are appended in key id order."""
+        self.default_bg_colors[handle] = STYLE_CONFIG["key_bg"]
+        self.renderer.track(handle, STYLE_CONFIG["key_bg"], STYLE_CONFIG["key_relief"])
+        self.widget_to_key_def[handle] = key_def
+        self.key_id_widgets.append(handle)
+        all_identifiers = set(key_def.keysyms)
+        if key_def.char_override: all_identifiers.add(key_def.char_override)
         for identifier in all_identifiers:
             processed_id = str(identifier).lower()
             if processed_id not in self.key_widgets_map: self.key_widgets_map[processed_id] = []
-            self.key_widgets_map[processed_id].append(btn)
-        if 'Caps_Lock' in key_def['keysyms']: self.active_toggle_widgets['Caps_Lock'] = btn
-        if 'Num_Lock' in key_def['keysyms']: self.active_toggle_widgets['Num_Lock'] = btn
-        return btn
+            self.key_widgets_map[processed_id].append(handle)
+        if 'Caps_Lock' in key_def.keysyms: self.active_toggle_widgets['Caps_Lock'] = handle
+        if 'Num_Lock' in key_def.keysyms: self.active_toggle_widgets['Num_Lock'] = handle
 
     def _draw_key_group(self, parent_frame, group_keys_list, group_id_prefix):
         for r_idx, row_keys in enumerate(group_keys_list):
@@ -344,14 +907,117 @@ class VisualKeyboardDisplayMode(BaseMode):
                 self._create_key_button(row_frame, key_def)
 
     def draw_visual_keyboard(self, layout_name):
+        """Rebuilds a layout from scratch (dropping any cached copy) and shows it."""
         if not self.keyboard_draw_area.winfo_exists(): return
-        for widget in self.keyboard_draw_area.winfo_children():
-            if widget.winfo_exists(): widget.destroy()
-        self.key_widgets_map.clear(); self.widget_to_key_def.clear();
-        self.default_bg_colors.clear(); self.active_toggle_widgets.clear()
+        self.layout_cache.discard(layout_name)
+        self.show_layout(layout_name)
+
+    def show_layout(self, layout_name):
+        """Shows a layout, reusing its cached frame when possible; modifier and pressed state carry over."""
+        if not self.keyboard_draw_area.winfo_exists(): return
+        start = time.perf_counter()
+        built = self.layout_cache.get(layout_name)
+        if built is None:
+            built = self._build_layout(layout_name)
+            if built is None: return
+            previous = self.active_layout
+            self._activate_built_layout(built)
+            self.layout_cache.put(layout_name, built)
+            if previous is not None and self.layout_cache.entries.get(previous.name) is not previous and previous.frame.winfo_exists():
+                previous.frame.destroy()
+        else:
+            self._activate_built_layout(built)
+        self._resync_layout_visuals()
+        if self.root.winfo_exists(): self.root.update_idletasks()
+        self.last_switch_ms = (time.perf_counter() - start) * 1e3
+        self._schedule_prebuild(layout_name)
+
+    def layout_cache_stats(self):
+        stats = self.layout_cache.stats()
+        stats["last_switch_ms"] = self.last_switch_ms
+        return stats
+
+    def _on_layout_evicted(self, built):
+        if built is self.active_layout: return # Still on screen; show_layout destroys it once it is replaced.
+        if built.frame.winfo_exists(): built.frame.destroy()
+
+    def _bind_layout(self, built):
+        self.renderer = built.renderer; self.layout_index = built.layout_index
+        self.key_widgets_map = built.key_widgets_map; self.widget_to_key_def = built.widget_to_key_def
+        self.default_bg_colors = built.default_bg_colors; self.active_toggle_widgets = built.active_toggle_widgets
+        self.key_id_widgets = built.key_id_widgets
+        self.toggle_widget_mask = built.toggle_widget_mask; self.modifier_widgets = built.modifier_widgets
+
+    def _activate_built_layout(self, built):
+        if self.active_layout is built: return
+        if self.active_layout is not None and self.active_layout.frame.winfo_exists(): self.active_layout.frame.pack_forget()
+        built.frame.pack(expand=True, fill=tk.BOTH)
+        self.active_layout = built
+        self._bind_layout(built)
+
+    def _build_layout(self, layout_name):
+        """Draws a layout into a new, unpacked frame; the mode's bound maps are left untouched."""
         layout_config = LAYOUTS.get(layout_name)
-        if not layout_config: return
-        fkey_edit_outer_frame = tk.Frame(self.keyboard_draw_area, bg=STYLE_CONFIG["content_frame_bg"])
+        if not layout_config: return None
+        start = time.perf_counter()
+        renderer = CanvasKeyRenderer() if self.renderer_kind == "canvas" else IncrementalKeyRenderer()
+        built = BuiltLayout(layout_name, tk.Frame(self.keyboard_draw_area, bg=STYLE_CONFIG["content_frame_bg"]), renderer, get_layout_index(layout_name))
+        self._bind_layout(built)
+        try:
+            if self.renderer_kind == "canvas": self._draw_canvas_keyboard(built.frame, layout_config)
+            else: self._draw_button_keyboard(built.frame, layout_config)
+        finally:
+            if self.active_layout is not None: self._bind_layout(self.active_layout)
+        built.index_modifiers()
+        built.build_ms = (time.perf_counter() - start) * 1e3
+        return built
+
+    def _resync_layout_visuals(self):
+        """Brings a (re)shown layout in line with the mode's modifier and pressed-key state."""
+        self._apply_suspect_marks()
+        pressed = set()
+        for keysym, char in self.held_keys.values():
+            if keysym not in MODIFIER_BITS: pressed.update(self._find_widgets_for_event(keysym, char))
+        modifier_handles = set(self.active_toggle_widgets.values())
+        for _keysym, _bit, widgets in self.modifier_widgets: modifier_handles.update(widgets)
+        for handle in self.key_id_widgets:
+            if handle in modifier_handles: continue
+            if handle in pressed: self.renderer.set_visual(handle, STYLE_CONFIG["key_pressed_bg"], tk.SUNKEN)
+            else: self.renderer.set_visual(handle, self.default_bg_colors[handle], STYLE_CONFIG["key_relief"])
+        self.update_all_modifier_visuals()
+
+    def _schedule_prebuild(self, layout_name):
+        count = STYLE_CONFIG["layout_prebuild_count"]
+        if count <= 0 or not self.root.winfo_exists(): return
+        names = list(LAYOUTS)
+        pos = names.index(layout_name) if layout_name in names else 0
+        neighbours = []
+        for step in range(1, len(names)):
+            for candidate in (names[(pos + step) % len(names)], names[(pos - step) % len(names)]):
+                if candidate not in neighbours and candidate != layout_name: neighbours.append(candidate)
+        self._prebuild_queue = neighbours[:count]
+        if self._prebuild_after_id is not None: self.root.after_cancel(self._prebuild_after_id)
+        self._prebuild_after_id = self.root.after(STYLE_CONFIG["layout_prebuild_delay_ms"], self._prebuild_next)
+
+    def _prebuild_next(self):
+        """Builds one queued layout per idle tick; speculative builds never evict anything."""
+        self._prebuild_after_id = None
+        if not self.keyboard_draw_area.winfo_exists(): return
+        while self._prebuild_queue:
+            layout_name = self._prebuild_queue.pop(0)
+            if layout_name in self.layout_cache: continue
+            if len(self.layout_cache) >= self.layout_cache.capacity: self._prebuild_queue.clear(); return
+            built = self._build_layout(layout_name)
+            if built is None: continue
+            self.layout_cache.put(layout_name, built)
+            self.layout_cache.entries.move_to_end(layout_name, last=False) # Prebuilt, not used: least recently used
+            self.layout_cache.prebuilds += 1
+            break
+        if self._prebuild_queue:
+            self._prebuild_after_id = self.root.after(STYLE_CONFIG["layout_prebuild_delay_ms"], self._prebuild_next)
+
+    def _draw_button_keyboard(self, parent, layout_config):
+        fkey_edit_outer_frame = tk.Frame(parent, bg=STYLE_CONFIG["content_frame_bg"])
         fkey_edit_outer_frame.pack(fill=tk.X, pady=(0,5), anchor=tk.N)
         fkey_block_frame = tk.Frame(fkey_edit_outer_frame, bg=STYLE_CONFIG["content_frame_bg"])
         self._draw_key_group(fkey_block_frame, layout_config["f_keys_row"], "fkeys")
@@ -361,7 +1027,7 @@ class VisualKeyboardDisplayMode(BaseMode):
             edit_block_frame = tk.Frame(fkey_edit_outer_frame, bg=STYLE_CONFIG["content_frame_bg"])
             self._draw_key_group(edit_block_frame, layout_config["edit_block"], "edit")
             edit_block_frame.pack(side=tk.LEFT, anchor=tk.NW, padx=(0,15))
-        center_row_frame = tk.Frame(self.keyboard_draw_area, bg=STYLE_CONFIG["content_frame_bg"])
+        center_row_frame = tk.Frame(parent, bg=STYLE_CONFIG["content_frame_bg"])
         center_row_frame.pack(fill=tk.X, pady=5, anchor=tk.N)
         main_block_frame = tk.Frame(center_row_frame, bg=STYLE_CONFIG["content_frame_bg"])
         self._draw_key_group(main_block_frame, layout_config["main_block"], "main")
@@ -380,116 +1046,622 @@ class VisualKeyboardDisplayMode(BaseMode):
             numpad_frame = tk.Frame(center_row_frame, bg=STYLE_CONFIG["content_frame_bg"])
             self._draw_key_group(numpad_frame, layout_config["numpad_block"], "num")
             numpad_frame.pack(side=tk.LEFT, anchor=tk.NW, padx=(20,0))
-        self.update_all_modifier_visuals()
-        if self.root.winfo_exists(): self.root.update_idletasks()
+
+    @staticmethod
+    def _block_geometry(group_keys_list):
+        """Places a block's keys in key units: returns ([(key_def, x, y, w, h)], width, height).
+        Rows are left-aligned; a row that starts with a SPACER is centered (e.g. the arrow-key Up row)."""
+        row_widths = [sum(0.5 if k == SPACER else k.width_factor for k in row) for row in group_keys_list]
+        block_width = max(row_widths, default=0.0)
+        placements, block_height = [], 0.0
+        for r_idx, row_keys in enumerate(group_keys_list):
+            x = (block_width - row_widths[r_idx]) / 2 if row_keys and row_keys[0] == SPACER else 0.0
+            for key_def in row_keys:
+                if key_def == SPACER: x += 0.5; continue
+                placements.append((key_def, x, r_idx, key_def.width_factor, key_def.height_factor))
+                block_height = max(block_height, r_idx + key_def.height_factor)
+                x += key_def.width_factor
+        return placements, block_width, block_height
+
+    def _draw_canvas_keyboard(self, parent, layout_config):
+        blocks = {name: self._block_geometry(layout_config.get(name, [])) for name in LAYOUT_BLOCK_ORDER}
+        main_w, main_h = blocks["main_block"][1], blocks["main_block"][2]
+        main_y = blocks["f_keys_row"][2] + 0.5
+        nav_x = max(main_w, blocks["f_keys_row"][1]) + 0.5
+        cluster_w = max(blocks["edit_block"][1], blocks["navigation_block"][1], blocks["arrow_keys_block"][1])
+        origins = {
+            "f_keys_row": (0.0, 0.0), "edit_block": (nav_x, 0.0), "main_block": (0.0, main_y),
+            "navigation_block": (nav_x, main_y), "arrow_keys_block": (nav_x, main_y + main_h - blocks["arrow_keys_block"][2]),
+            "numpad_block": (nav_x + cluster_w + 0.5, main_y),
+        }
+        unit_x = STYLE_CONFIG["base_key_width"] * self.avg_char_width + 2 * STYLE_CONFIG["key_borderwidth"] + 2
+        unit_y = int(unit_x * 0.9)
+        gap = STYLE_CONFIG["canvas_key_gap"]
+        total_w = max(origins[n][0] + blocks[n][1] for n in LAYOUT_BLOCK_ORDER)
+        total_h = max(origins[n][1] + blocks[n][2] for n in LAYOUT_BLOCK_ORDER)
+        canvas = tk.Canvas(parent, width=int(total_w * unit_x) + gap, height=int(total_h * unit_y) + gap,
+                           bg=STYLE_CONFIG["content_frame_bg"], highlightthickness=0, borderwidth=0)
+        canvas.pack(anchor=tk.NW, pady=5)
+        self.renderer.canvas = canvas
+        fonts = {False: (STYLE_CONFIG["font_family"], STYLE_CONFIG["font_size_normal"]), True: (STYLE_CONFIG["font_family"], STYLE_CONFIG["font_size_small"])}
+        key_bg = STYLE_CONFIG["key_bg"]
+        for block_name in LAYOUT_BLOCK_ORDER:
+            ox, oy = origins[block_name]
+            for key_def, x, y, w, h in blocks[block_name][0]:
+                x0, y0 = (ox + x) * unit_x + gap, (oy + y) * unit_y + gap
+                x1, y1 = x0 + w * unit_x - gap, y0 + h * unit_y - gap
+                tag = f"key{len(self.key_id_widgets)}"
+                canvas.create_rectangle(x0, y0, x1, y1, fill=key_bg, outline=key_bg, width=2, tags=(tag, "key"))
+                canvas.create_text((x0 + x1) / 2, (y0 + y1) / 2, text=key_def.label, fill=STYLE_CONFIG["key_fg"],
+                                   font=fonts[bool(key_def.small_font)], tags=("keylabel",))
+                self._register_key(tag, key_def)
 
     def update_all_modifier_visuals(self):
+        render = self.renderer.set_visual
+        mask = self.app.engine.modifier_mask
         for mod_key_name, widget in self.active_toggle_widgets.items():
-            is_active = self.modifier_keys_state.get(mod_key_name, False)
-            bg = STYLE_CONFIG["key_active_modifier_bg"] if is_active else self.default_bg_colors.get(widget, STYLE_CONFIG["key_bg"])
-            if widget.winfo_exists(): widget.config(bg=bg)
-        for mod_ks_name, is_held in self.modifier_keys_state.items():
-            if mod_ks_name in self.active_toggle_widgets: continue
-            widgets_to_update = self.key_widgets_map.get(mod_ks_name.lower(), [])
+            is_active = mask & MODIFIER_BITS[mod_key_name]
+            render(widget, STYLE_CONFIG["key_active_modifier_bg"] if is_active else self.default_bg_colors.get(widget, STYLE_CONFIG["key_bg"]))
+        active_toggles = mask & self.toggle_widget_mask
+        held_keysyms = {keysym for keysym, _char in self.held_keys.values()}
+        for mod_ks_name, bit, widgets_to_update in self.modifier_widgets:
+            is_held = mask & bit
             for widget in widgets_to_update:
-                if not widget.winfo_exists(): continue
                 if is_held:
-                    widget.config(bg=STYLE_CONFIG["key_active_modifier_bg"], relief=tk.SUNKEN)
-                elif not any(pk == mod_ks_name for pk in self.currently_pressed_physical_keys):
+                    render(widget, STYLE_CONFIG["key_active_modifier_bg"], tk.SUNKEN)
+                elif mod_ks_name not in held_keysyms:
                     key_def = self.widget_to_key_def.get(widget)
-                    is_active_toggle = key_def and any(mks in self.active_toggle_widgets and self.modifier_keys_state.get(mks) for mks in key_def['keysyms'])
-                    if not is_active_toggle:
-                        widget.config(bg=self.default_bg_colors.get(widget, STYLE_CONFIG["key_bg"]), relief=STYLE_CONFIG["key_relief"])
+                    if not (key_def and key_def.modifier_mask & active_toggles):
+                        render(widget, self.default_bg_colors.get(widget, STYLE_CONFIG["key_bg"]), STYLE_CONFIG["key_relief"])
 
     def _find_widgets_for_event(self, keysym, char):
-        widgets = set()
-        for w_check, kd_check in self.widget_to_key_def.items():
-            if kd_check.get('char_override') == char and char and w_check.winfo_exists():
-                widgets.add(w_check)
-                return list(widgets)
-        keys_to_check = {keysym, keysym.lower(), keysym.upper()}
-        if char: keys_to_check.add(char)
-        for k_check in keys_to_check:
-            norm_k = str(k_check).lower()
-            if norm_k in self.key_widgets_map:
-                for w_item in self.key_widgets_map[norm_k]:
-                    if w_item.winfo_exists(): widgets.add(w_item)
-        return list(widgets)
+        if self.layout_index is None: return []
+        return [self.key_id_widgets[key_id] for key_id in self.layout_index.lookup(keysym, char)]
 
-    def on_key_press(self, event):
-        super().update_app_info_label(f"Press: {event.keysym} (char: '{event.char}')")
-        keysym = event.keysym; char = event.char
-        self.currently_pressed_physical_keys.add(keysym)
-        if keysym in self.active_toggle_widgets: self.modifier_keys_state[keysym] = not self.modifier_keys_state[keysym]
-        elif keysym in self.modifier_keys_state: self.modifier_keys_state[keysym] = True
+    def on_show(self):
+        if self.active_layout is not None: self._resync_layout_visuals()
+
+    def on_state_change(self, event_type, keysym, char, keycode, state, time, modifiers_changed):
+        if not self.visible: return # The coalescer keeps the held keys; on_show repaints from them.
+        self._batch_count += 1; self._batch_last = (event_type, keysym, char) # Repainted once in on_batch_end
+
+    def on_batch_end(self):
+        count, self._batch_count = self._batch_count, 0
+        if not count or not self.visible: return
+        event_type, keysym, char = self._batch_last
+        if count == 1: # The usual case; the per-key path touches fewer keys than a full resync
+            if event_type == PRESS: self._show_key_press(keysym, char)
+            else: self._show_key_release(keysym, char)
+        else:
+            self._resync_layout_visuals()
+            super().update_app_info_label(f"{'Press' if event_type == PRESS else 'Release'}: {keysym} (+{count - 1} more this frame)")
+        if self.app.health.revision != self._suspect_revision: self._show_new_suspects()
+
+    def _apply_suspect_marks(self):
+        """Makes key_suspect_bg the resting colour of every key the health analyzer has flagged (key_bg for the rest)."""
+        health = self.app.health
+        self._suspect_revision = health.revision
+        suspects = set()
+        for keysym, char in health.suspects.items(): suspects.update(self._find_widgets_for_event(keysym, char))
+        resting = (STYLE_CONFIG["key_relief"],)
+        for handle in self.key_id_widgets:
+            bg = STYLE_CONFIG["key_suspect_bg"] if handle in suspects else STYLE_CONFIG["key_bg"]
+            old = self.default_bg_colors[handle]
+            if old == bg: continue
+            self.default_bg_colors[handle] = bg
+            if self.renderer.applied.get(handle) == (old,) + resting: self.renderer.set_visual(handle, bg, STYLE_CONFIG["key_relief"])
+
+    def _show_new_suspects(self):
+        self._apply_suspect_marks()
+        if self.app.health.last_finding: super().update_app_info_label(f"Suspect key, {self.app.health.last_finding}")
+
+    def _show_key_press(self, keysym, char):
+        super().update_app_info_label(f"Press: {keysym} (char: '{char}')")
         self.update_all_modifier_visuals()
         target_widgets = self._find_widgets_for_event(keysym, char)
         for widget in target_widgets:
-            if not widget.winfo_exists(): continue
             key_def = self.widget_to_key_def.get(widget)
-            is_modifier_widget = key_def and any(mks in self.modifier_keys_state for mks in key_def['keysyms'])
-            if not is_modifier_widget or keysym not in self.active_toggle_widgets: widget.config(bg=STYLE_CONFIG["key_pressed_bg"], relief=tk.SUNKEN)
+            is_modifier_widget = key_def and key_def.modifier_mask
+            if not is_modifier_widget or keysym not in self.active_toggle_widgets: self.renderer.set_visual(widget, STYLE_CONFIG["key_pressed_bg"], tk.SUNKEN)
 
-    def on_key_release(self, event):
-        super().update_app_info_label(f"Release: {event.keysym}")
-        keysym = event.keysym; char = event.char
-        if keysym in self.currently_pressed_physical_keys: self.currently_pressed_physical_keys.remove(keysym)
-        if keysym in self.modifier_keys_state and keysym not in self.active_toggle_widgets: self.modifier_keys_state[keysym] = False
+    def _show_key_release(self, keysym, char):
+        super().update_app_info_label(f"Release: {keysym}")
         self.update_all_modifier_visuals()
+        mask = self.app.engine.modifier_mask
         target_widgets = self._find_widgets_for_event(keysym, char)
         for widget in target_widgets:
-            if not widget.winfo_exists(): continue
             key_def = self.widget_to_key_def.get(widget)
-            is_active_toggle_mod = key_def and any(mks in self.active_toggle_widgets and self.modifier_keys_state.get(mks) for mks in key_def['keysyms'])
-            is_active_held_mod = key_def and any(mks in self.modifier_keys_state and self.modifier_keys_state.get(mks) and mks not in self.active_toggle_widgets for mks in key_def['keysyms'])
-            if is_active_toggle_mod or is_active_held_mod:
-                widget.config(bg=STYLE_CONFIG["key_active_modifier_bg"], relief=STYLE_CONFIG["key_relief"])
+            if key_def and key_def.modifier_mask & mask: # An active toggle or a still-held modifier
+                self.renderer.set_visual(widget, STYLE_CONFIG["key_active_modifier_bg"], STYLE_CONFIG["key_relief"])
             else:
-                widget.config(bg=self.default_bg_colors.get(widget, STYLE_CONFIG["key_bg"]), relief=STYLE_CONFIG["key_relief"])
+                self.renderer.set_visual(widget, self.default_bg_colors.get(widget, STYLE_CONFIG["key_bg"]), STYLE_CONFIG["key_relief"])
+
+# --- Heatmap Mode ---
+class HeatmapMode(VisualKeyboardDisplayMode):
+    """Colours every key of the selected layout by a per-key statistic (press count, dwell, inter-key interval).
+
+    Stats live in a kbstats.KeyStats per layout and are updated in O(1) per event, also while the mode is
+    hidden; colours are recomputed in one vectorized pass at most every heatmap_refresh_ms.
+    """
+    coalesced = False # Counts every press, so it takes the engine's stream like the statistics modes
+
+    def __init__(self, app_controller, parent_frame):
+        global kbstats
+        import kbstats
+        self.layout_stats = {}
+        self.metric = "count"
+        self.legend_label = None
+        self._held_keys = {} # Key id (keycode, or keysym if 0) -> (KeyStats, key ids, press time) the press was counted on
+        self._pending_release = None # (key, time) of a release that may be the first half of an X11 autorepeat pair
+        self._refresh_after_id = None
+        super().__init__(app_controller, parent_frame)
+
+    def _build_ui(self):
+        super()._build_ui()
+        font = (STYLE_CONFIG["font_family"], STYLE_CONFIG["font_size_normal"])
+        tk.Label(self.mode_control_frame, text="Colour by:", bg=STYLE_CONFIG["content_frame_bg"], fg=STYLE_CONFIG["info_fg"], font=font).pack(side=tk.LEFT, padx=(15, 5))
+        self.metric_var = tk.StringVar(master=self.root, value=kbstats.METRIC_LABELS[self.metric])
+        metric_menu = ttk.Combobox(self.mode_control_frame, textvariable=self.metric_var, values=[kbstats.METRIC_LABELS[m] for m in kbstats.METRICS], state="readonly", width=22, font=font)
+        metric_menu.pack(side=tk.LEFT, padx=5)
+        metric_menu.bind("<<ComboboxSelected>>", self.on_metric_change)
+        tk.Button(self.mode_control_frame, text="Reset", command=self.reset_stats, takefocus=0, bg=STYLE_CONFIG["key_bg"], fg=STYLE_CONFIG["key_fg"],
+                  activebackground=STYLE_CONFIG["key_pressed_bg"], font=font, relief=STYLE_CONFIG["key_relief"]).pack(side=tk.LEFT, padx=5)
+        self.legend_label = tk.Label(self.mode_control_frame, text="", bg=STYLE_CONFIG["content_frame_bg"], fg=STYLE_CONFIG["info_fg"],
+                                     font=(STYLE_CONFIG["font_family"], STYLE_CONFIG["font_size_small"]))
+        self.legend_label.pack(side=tk.RIGHT, padx=5)
+        self.refresh_heatmap()
+
+    def current_stats(self):
+        """KeyStats of the shown layout, created on first use."""
+        if self.layout_index is None: return None
+        stats = self.layout_stats.get(self.layout_index.name)
+        if stats is None:
+            stats = self.layout_stats[self.layout_index.name] = kbstats.KeyStats(len(self.layout_index.key_defs))
+        return stats
+
+    def on_metric_change(self, event=None):
+        labels = {label: name for name, label in kbstats.METRIC_LABELS.items()}
+        self.metric = labels.get(self.metric_var.get(), "count")
+        self.refresh_heatmap()
+        if self.root.winfo_exists(): self.root.focus_set()
+
+    def reset_stats(self):
+        stats = self.current_stats()
+        if stats is not None: stats.reset()
+        self._held_keys.clear(); self._pending_release = None
+        self.refresh_heatmap()
+        if self.root.winfo_exists(): self.root.focus_set()
+
+    def _commit_release(self):
+        key, time = self._pending_release
+        self._pending_release = None
+        stats, key_ids, _down_since = self._held_keys.pop(key, (None, (), 0))
+        for key_id in key_ids: stats.release(key_id, time)
+
+    def on_state_change(self, event_type, keysym, char, keycode, state, time, modifiers_changed):
+        key = keycode or keysym # The release may come with another keysym (Shift went down meanwhile)
+        pending = self._pending_release
+        if pending is not None:
+            # X11 autorepeat: a release and a press with one timestamp, once the key has been held for
+            # repeat_delay_ms (the rule of KeyHealthAnalyzer and kbbatch). The pair is dropped and the hold goes on.
+            if event_type == PRESS and pending == (key, time) and time - self._held_keys[key][2] >= self.app.health.repeat_delay_ms:
+                self._pending_release = None
+                return
+            self._commit_release()
+        if event_type == PRESS:
+            if key in self._held_keys: return # Autorepeat
+            stats = self.current_stats()
+            if stats is None: return
+            key_ids = self.layout_index.lookup(keysym, char)
+            self._held_keys[key] = (stats, key_ids, time)
+            for key_id in key_ids: stats.press(key_id, time)
+        elif key in self._held_keys:
+            self._pending_release = (key, time) # Counted once the next event shows it is not autorepeat
+        if self._refresh_after_id is None and self.visible and self.root.winfo_exists():
+            self._refresh_after_id = self.root.after(STYLE_CONFIG["heatmap_refresh_ms"], self.refresh_heatmap)
+
+    def on_batch_end(self):
+        pass
+
+    def snapshot_state(self):
+        return {name: stats.copy() for name, stats in self.layout_stats.items()}
+
+    def restore_state(self, snapshot):
+        self.layout_stats = snapshot
+        self._held_keys.clear(); self._pending_release = None
+        self.refresh_heatmap()
+
+    def _resync_layout_visuals(self):
+        self.refresh_heatmap()
+
+    def refresh_heatmap(self):
+        """Recolours every key of the shown layout from its stats in one vectorized pass."""
+        if self._refresh_after_id is not None and self.root.winfo_exists(): self.root.after_cancel(self._refresh_after_id)
+        self._refresh_after_id = None
+        if self._pending_release is not None: self._commit_release() # The pair's press would have come with the release
+        stats = self.current_stats()
+        if stats is None or self.renderer is None: return
+        colors, low, high = kbstats.heat_colors(stats.metric(self.metric), STYLE_CONFIG["heatmap_colors"])
+        set_visual = self.renderer.set_visual
+        for handle, color in zip(self.key_id_widgets, colors):
+            set_visual(handle, color or self.default_bg_colors[handle], STYLE_CONFIG["key_relief"])
+        if self.legend_label is not None and self.legend_label.winfo_exists():
+            self.legend_label.config(text=f"{kbstats.METRIC_LABELS[self.metric]}: {low:.0f} - {high:.0f}   {stats.total_presses} presses")
 
 # --- Simple Event Logger Mode ---
 class EventLoggerMode(BaseMode):
+    """Virtualized event log: events go into a kblog.EventStore and only the rows that fit the text area are drawn.
+
+    A render formats at most one screenful of rows, whether the store holds ten events or millions.
+    The view follows the newest event until it is scrolled up, and a filter either narrows the view
+    to its matches or highlights them for Prev/Next jumps.
+    """
     def __init__(self, app_controller, parent_frame):
         super().__init__(app_controller, parent_frame)
+        self.store = EventStore(STYLE_CONFIG["log_store_capacity"])
+        self.all_rows = FilteredView(self.store)
+        self.matches = FilteredView(self.store)
+        self.shown = self.all_rows # all_rows, or matches when only matches are shown
+        self.top_row = None # Row id at the top of the text area while not following
+        self.follow = True
+        self.cursor_row = None # Match selected by the last jump
+        self.visible_rows = 15
+        self._rendered_end = 0
+        self._render_after_id = None
         self._build_ui()
 
     def _build_ui(self):
         super()._build_ui()
+        font = (STYLE_CONFIG["font_family"], STYLE_CONFIG["font_size_normal"])
         tk.Label(self.frame, text="Raw Key Event Log:", bg=STYLE_CONFIG["content_frame_bg"],
                  fg=STYLE_CONFIG["info_fg"], font=(STYLE_CONFIG["font_family"], STYLE_CONFIG["font_size_normal"]+2, "bold")
                  ).pack(pady=(5,2), anchor=tk.W)
-        self.log_text = ScrolledText(self.frame, height=15, width=80, wrap=tk.WORD,
-                                     bg=STYLE_CONFIG["text_widget_bg"], fg=STYLE_CONFIG["text_widget_fg"],
-                                     font=(STYLE_CONFIG["font_family"], STYLE_CONFIG["font_size_normal"]),
-                                     relief=tk.FLAT, borderwidth=1,
-                                     insertbackground=STYLE_CONFIG["key_fg"])
-        self.log_text.pack(expand=True, fill=tk.BOTH, pady=5)
+        filter_frame = tk.Frame(self.frame, bg=STYLE_CONFIG["content_frame_bg"])
+        filter_frame.pack(fill=tk.X)
+        tk.Label(filter_frame, text="Filter:", bg=STYLE_CONFIG["content_frame_bg"], fg=STYLE_CONFIG["info_fg"], font=font).pack(side=tk.LEFT, padx=(0, 5))
+        self.filter_entry = tk.Entry(filter_frame, width=32, bg=STYLE_CONFIG["key_bg"], fg=STYLE_CONFIG["key_fg"], insertbackground=STYLE_CONFIG["key_fg"],
+                                     relief=tk.FLAT, font=font)
+        self.filter_entry.pack(side=tk.LEFT, padx=5)
+        self.filter_entry.bind("<Return>", self.apply_filter)
+        self.only_matches_var = tk.BooleanVar(master=self.root, value=True)
+        tk.Checkbutton(filter_frame, text="Only matches", variable=self.only_matches_var, command=self.apply_filter, takefocus=0,
+                       bg=STYLE_CONFIG["content_frame_bg"], fg=STYLE_CONFIG["info_fg"], selectcolor=STYLE_CONFIG["key_bg"],
+                       activebackground=STYLE_CONFIG["content_frame_bg"], activeforeground=STYLE_CONFIG["info_fg"], font=font).pack(side=tk.LEFT, padx=5)
+        for text, command in (("Apply", self.apply_filter), ("Prev", lambda: self.jump(-1)), ("Next", lambda: self.jump(1))):
+            tk.Button(filter_frame, text=text, command=command, takefocus=0, bg=STYLE_CONFIG["key_bg"], fg=STYLE_CONFIG["key_fg"],
+                      activebackground=STYLE_CONFIG["key_pressed_bg"], font=font, relief=STYLE_CONFIG["key_relief"]).pack(side=tk.LEFT, padx=2)
+        log_frame = tk.Frame(self.frame, bg=STYLE_CONFIG["content_frame_bg"])
+        log_frame.pack(expand=True, fill=tk.BOTH, pady=5)
+        self.log_scrollbar = ttk.Scrollbar(log_frame, orient=tk.VERTICAL, command=self._on_scrollbar)
+        self.log_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        x_scrollbar = ttk.Scrollbar(log_frame, orient=tk.HORIZONTAL)
+        x_scrollbar.pack(side=tk.BOTTOM, fill=tk.X)
+        # The text area only ever holds the visible rows; the vertical scrollbar is driven by the store, not by the widget.
+        self.log_text = tk.Text(log_frame, height=self.visible_rows, width=80, wrap=tk.NONE,
+                                bg=STYLE_CONFIG["text_widget_bg"], fg=STYLE_CONFIG["text_widget_fg"],
+                                font=font, relief=tk.FLAT, borderwidth=1, takefocus=0,
+                                insertbackground=STYLE_CONFIG["key_fg"], xscrollcommand=x_scrollbar.set)
+        x_scrollbar.config(command=self.log_text.xview)
+        self.log_text.pack(expand=True, fill=tk.BOTH)
+        self.log_text.tag_configure("match", foreground=STYLE_CONFIG["log_match_fg"])
+        self.log_text.tag_configure("current", background=STYLE_CONFIG["log_current_bg"])
         self.log_text.config(state=tk.DISABLED)
-        clear_button = tk.Button(self.frame, text="Clear Log", command=self.clear_log,
+        self.line_height = max(1, tkinter.font.Font(root=self.root, font=font).metrics("linespace"))
+        self.log_text.bind("<Configure>", self._on_resize)
+        self.log_text.bind("<MouseWheel>", lambda e: self.scroll(-3 if e.delta > 0 else 3))
+        self.log_text.bind("<Button-4>", lambda e: self.scroll(-3))
+        self.log_text.bind("<Button-5>", lambda e: self.scroll(3))
+        bottom_frame = tk.Frame(self.frame, bg=STYLE_CONFIG["content_frame_bg"])
+        bottom_frame.pack(fill=tk.X)
+        clear_button = tk.Button(bottom_frame, text="Clear Log", command=self.clear_log,
                                  bg=STYLE_CONFIG["key_bg"], fg=STYLE_CONFIG["key_fg"],
                                  activebackground=STYLE_CONFIG["key_pressed_bg"],
                                  font=(STYLE_CONFIG["font_family"], STYLE_CONFIG["font_size_normal"]),
                                  relief=STYLE_CONFIG["key_relief"])
-        clear_button.pack(pady=5)
+        clear_button.pack(side=tk.LEFT, pady=5)
+        self.counter_label = tk.Label(bottom_frame, text="", bg=STYLE_CONFIG["content_frame_bg"], fg=STYLE_CONFIG["info_fg"],
+                                      font=(STYLE_CONFIG["font_family"], STYLE_CONFIG["font_size_small"]))
+        self.counter_label.pack(side=tk.RIGHT, pady=5)
+        self._update_counter_label(0, 0)
+
+    def log_event(self, event_type, keysym, char, keycode, state, time=0, raw=None):
+        """Stores one event; raw is the evdev backend's (scancode, kernel time in us) for the event, if any."""
+        self.store.append(event_type, keysym, char, keycode, state, time, raw)
+        if self.visible and self._render_after_id is None and self.root.winfo_exists():
+            self._render_after_id = self.root.after(STYLE_CONFIG["log_flush_interval_ms"], self.render)
 
-    def log_event(self, event_type, event):
+    def _top_position(self):
+        """Position in self.shown of the first visible row."""
+        count = len(self.shown)
+        last_top = max(0, count - self.visible_rows)
+        if self.follow or self.top_row is None: return last_top
+        return min(self.shown.position_of(self.top_row), last_top)
+
+    def render(self):
+        """Redraws the visible rows (at most one screenful, whatever the store holds), the scrollbar and the counters."""
+        self._render_after_id = None
         if not self.log_text.winfo_exists(): return
+        self.matches.update()
+        shown, store = self.shown, self.store
+        count = len(shown)
+        top = self._top_position()
+        rows = [shown.row_at(position) for position in range(top, min(count, top + self.visible_rows))]
         self.log_text.config(state=tk.NORMAL)
-        log_entry = f"{event_type:<10} Keysym: '{event.keysym}', Char: '{event.char}', KeyCode: {event.keycode}, State: {hex(event.state)}\n"
-        self.log_text.insert(tk.END, log_entry)
-        self.log_text.see(tk.END)
+        self.log_text.delete("1.0", tk.END)
+        self.log_text.insert("1.0", "\n".join(store.format_row(row) for row in rows))
+        if shown is not self.matches and not self.matches.filter.empty:
+            for line, row in enumerate(rows, 1):
+                if row in self.matches: self.log_text.tag_add("match", f"{line}.0", f"{line}.end")
+        if self.cursor_row in rows:
+            line = rows.index(self.cursor_row) + 1
+            self.log_text.tag_add("current", f"{line}.0", f"{line + 1}.0")
         self.log_text.config(state=tk.DISABLED)
-        super().update_app_info_label(f"{event_type}: {event.keysym} (char: '{event.char}')")
+        if count: self.log_scrollbar.set(top / count, (top + len(rows)) / count)
+        else: self.log_scrollbar.set(0, 1)
+        if store.end > self._rendered_end and len(store):
+            self._rendered_end = store.end
+            event_type, keysym, char = store.row(store.end - 1)[:3]
+            super().update_app_info_label(f"{'Press' if event_type == PRESS else 'Release'}: {keysym} (char: {char!r})")
+        self._update_counter_label(top, len(rows))
+
+    def _update_counter_label(self, top, row_count):
+        if self.counter_label.winfo_exists():
+            store = self.store
+            matches = "" if self.matches.filter.empty else f"Matches: {len(self.matches)}  "
+            showing = f"Rows {top + 1}-{top + row_count} of {len(self.shown)}" if row_count else "No rows"
+            self.counter_label.config(text=f"Captured: {store.end}  Kept: {len(store)}  Dropped: {store.dropped}  {matches}{showing}"
+                                           + ("" if self.follow else "  (paused: scroll to the end to follow)"))
+
+    def scroll_to(self, position, follow=None):
+        """Puts shown row `position` at the top; following resumes when the last row comes into view."""
+        count = len(self.shown)
+        last_top = max(0, count - self.visible_rows)
+        position = max(0, min(position, last_top))
+        self.follow = position >= last_top if follow is None else follow
+        self.top_row = self.shown.row_at(position) if count else None
+        self.render()
+
+    def scroll(self, rows):
+        self.scroll_to(self._top_position() + rows)
+
+    def _on_scrollbar(self, action, amount, unit=None):
+        if action == "moveto": self.scroll_to(int(float(amount) * len(self.shown)))
+        else: self.scroll(int(amount) * (max(1, self.visible_rows - 1) if unit == "pages" else 1))
+
+    def _on_resize(self, event):
+        inset = 2 * sum(self.log_text.winfo_pixels(self.log_text.cget(option)) for option in ("borderwidth", "highlightthickness", "pady"))
+        rows = max(1, (event.height - inset) // self.line_height)
+        if rows != self.visible_rows:
+            self.visible_rows = rows
+            self.render()
+
+    def apply_filter(self, event=None):
+        """Parses the filter entry (syntax: see kblog.py) and shows its matches or highlights them."""
+        try:
+            event_filter = EventFilter.parse(self.filter_entry.get())
+        except ValueError as e:
+            super().update_app_info_label(f"Filter: {e}")
+            return
+        start = time.perf_counter()
+        self.matches.set_filter(event_filter)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        self.shown = self.matches if self.only_matches_var.get() and not event_filter.empty else self.all_rows
+        self.cursor_row = None
+        self.follow = True
+        self.render()
+        if not event_filter.empty:
+            super().update_app_info_label(f"{len(self.matches)} of {len(self.store)} events match {event_filter.describe()} ({elapsed_ms:.1f} ms)")
+        if self.root.winfo_exists(): self.root.focus_set()
+
+    def jump(self, direction):
+        """Selects the next (direction > 0) or previous match after the selected one, or after the top of the view."""
+        self.matches.update()
+        if self.matches.filter.empty:
+            super().update_app_info_label("Enter a filter to jump between its matches.")
+            return
+        top = self._top_position()
+        anchor = self.cursor_row
+        if anchor is None and len(self.shown):
+            anchor = self.shown.row_at(top) - 1 if direction > 0 else self.shown.row_at(min(len(self.shown), top + self.visible_rows) - 1) + 1
+        row = None if anchor is None else self.matches.after(anchor) if direction > 0 else self.matches.before(anchor)
+        if row is None:
+            super().update_app_info_label(f"No {'later' if direction > 0 else 'earlier'} match.")
+            return
+        self.cursor_row = row
+        self.scroll_to(self.shown.position_of(row) - self.visible_rows // 2, follow=False)
+
+    def on_show(self):
+        self.render() # Catches up with whatever was stored while the mode was hidden
+
+    def on_state_change(self, event_type, keysym, char, keycode, state, time, modifiers_changed):
+        raw_input = self.app.raw_input
+        self.log_event(event_type, keysym, char, keycode, state, time, raw_input.current if raw_input is not None else None)
+
+    def snapshot_state(self):
+        return self.store.end
+
+    def restore_state(self, snapshot):
+        self.store.truncate(snapshot)
+        self.matches.update()
+        if self.top_row is not None and self.top_row >= self.store.end: self.top_row = None; self.follow = True
+        if self.cursor_row is not None and self.cursor_row >= self.store.end: self.cursor_row = None
+        self._rendered_end = min(self._rendered_end, self.store.end)
+        if self.visible: self.render()
 
-    def on_key_press(self, event): self.log_event("Press", event)
-    def on_key_release(self, event): self.log_event("Release", event)
     def clear_log(self):
         if not self.log_text.winfo_exists(): return
-        self.log_text.config(state=tk.NORMAL)
-        self.log_text.delete(1.0, tk.END)
-        self.log_text.config(state=tk.DISABLED)
+        self.store.clear()
+        self.matches.update()
+        self.top_row = self.cursor_row = None
+        self.follow = True
+        self.render()
         super().update_app_info_label("Log cleared.")
 
+# --- Typing Test Mode ---
+_WORD_CORPUS = None
+
+def get_word_corpus():
+    """The typing test's WordCorpus: STYLE_CONFIG["typing_corpus"] if set and readable, else the built-in words."""
+    global _WORD_CORPUS
+    if _WORD_CORPUS is None:
+        path = STYLE_CONFIG["typing_corpus"]
+        try:
+            _WORD_CORPUS = WordCorpus.open(path) if path else None
+        except OSError as e:
+            print(f"Typing corpus {path} not usable ({e}); using the built-in word list")
+        if _WORD_CORPUS is None: _WORD_CORPUS = WordCorpus.from_words(BUILTIN_WORDS)
+    return _WORD_CORPUS
+
+class TypingTestMode(BaseMode):
+    """Timed typing test in the style of Monkeytype.
+
+    Every keystroke is scored in O(1) by a kbtyping.TypingSession and only the typed character's tag
+    changes in the text widget. Target and pressed characters are mapped to keys of the selected layout,
+    so the result names the switches that were missed most.
+    """
+    WORD_LENGTHS = {"Short (2-5)": (2, 5), "Medium (3-8)": (3, 8), "Long (6-12)": (6, 12), "Any length": (1, MAX_WORD_LEN)}
+    DURATIONS = (15, 30, 60, 120)
+    BATCH_WORDS = 40 # Words appended whenever the cursor gets near the end of the text
+    LOOKAHEAD_CHARS = 80
+
+    def __init__(self, app_controller, parent_frame):
+        super().__init__(app_controller, parent_frame)
+        self.session = None
+        self.layout_index = None
+        self.duration_s = STYLE_CONFIG["typing_default_seconds"]
+        self.finished = False
+        self.rng = random.Random()
+        self._tick_after_id = None
+        self._build_ui()
+
+    def _build_ui(self):
+        super()._build_ui()
+        font = (STYLE_CONFIG["font_family"], STYLE_CONFIG["font_size_normal"])
+        control_frame = tk.Frame(self.frame, bg=STYLE_CONFIG["content_frame_bg"])
+        control_frame.pack(fill=tk.X, pady=(0, 10))
+        tk.Label(control_frame, text="Keyboard Layout:", bg=STYLE_CONFIG["content_frame_bg"], fg=STYLE_CONFIG["info_fg"], font=font).pack(side=tk.LEFT, padx=(0, 5))
+        self.layout_var = tk.StringVar(master=self.root, value=list(LAYOUTS.keys())[0])
+        self.duration_var = tk.StringVar(master=self.root, value=f"{self.duration_s} s")
+        self.length_var = tk.StringVar(master=self.root, value=list(self.WORD_LENGTHS)[1])
+        for variable, values, width in ((self.layout_var, list(LAYOUTS.keys()), 20), (self.duration_var, [f"{d} s" for d in self.DURATIONS], 6),
+                                        (self.length_var, list(self.WORD_LENGTHS), 12)):
+            menu = ttk.Combobox(control_frame, textvariable=variable, values=values, state="readonly", width=width, font=font)
+            menu.pack(side=tk.LEFT, padx=5)
+            menu.bind("<<ComboboxSelected>>", self.restart)
+        tk.Label(control_frame, text="Letters:", bg=STYLE_CONFIG["content_frame_bg"], fg=STYLE_CONFIG["info_fg"], font=font).pack(side=tk.LEFT, padx=(10, 5))
+        self.letters_entry = tk.Entry(control_frame, width=12, bg=STYLE_CONFIG["key_bg"], fg=STYLE_CONFIG["key_fg"], insertbackground=STYLE_CONFIG["key_fg"],
+                                      relief=tk.FLAT, font=font)
+        self.letters_entry.pack(side=tk.LEFT, padx=5)
+        self.letters_entry.bind("<Return>", self.restart)
+        tk.Button(control_frame, text="Restart", command=self.restart, takefocus=0, bg=STYLE_CONFIG["key_bg"], fg=STYLE_CONFIG["key_fg"],
+                  activebackground=STYLE_CONFIG["key_pressed_bg"], font=font, relief=STYLE_CONFIG["key_relief"]).pack(side=tk.LEFT, padx=5)
+        self.stats_label = tk.Label(control_frame, text="", bg=STYLE_CONFIG["content_frame_bg"], fg=STYLE_CONFIG["info_fg"], font=font)
+        self.stats_label.pack(side=tk.RIGHT, padx=5)
+        self.text = tk.Text(self.frame, height=6, wrap=tk.WORD, bg=STYLE_CONFIG["text_widget_bg"], fg=STYLE_CONFIG["typing_pending_fg"],
+                            font=(STYLE_CONFIG["font_family"], STYLE_CONFIG["font_size_normal"] + 7), relief=tk.FLAT, padx=15, pady=15,
+                            cursor="arrow", takefocus=0)
+        self.text.pack(expand=True, fill=tk.BOTH, pady=5)
+        self.text.tag_configure("ok", foreground=STYLE_CONFIG["typing_correct_fg"])
+        self.text.tag_configure("bad", foreground=STYLE_CONFIG["typing_error_fg"], underline=True)
+        self.text.tag_configure("cursor", background=STYLE_CONFIG["typing_caret_bg"], foreground=STYLE_CONFIG["window_bg"])
+        self.result_label = tk.Label(self.frame, text="Start typing to begin. Tab restarts.", justify=tk.LEFT, anchor=tk.W,
+                                     bg=STYLE_CONFIG["content_frame_bg"], fg=STYLE_CONFIG["info_fg"], font=font)
+        self.result_label.pack(fill=tk.X, pady=5)
+        self.restart()
+
+    def restart(self, event=None):
+        """Starts a new test with the current layout, duration, word length and letter settings."""
+        if self._tick_after_id is not None: self.root.after_cancel(self._tick_after_id); self._tick_after_id = None
+        self.layout_index = get_layout_index(self.layout_var.get())
+        self.duration_s = int(self.duration_var.get().split()[0])
+        layout_index = self.layout_index
+        def key_of(char):
+            key_ids = layout_index.lookup(CHAR_KEYSYMS.get(char, char), char)
+            return key_ids[0] if key_ids else -1
+        self.session = TypingSession((), len(layout_index.key_defs), key_of)
+        self.finished = False
+        self.text.config(state=tk.NORMAL)
+        self.text.delete("1.0", tk.END)
+        self.text.config(state=tk.DISABLED)
+        if not self._add_words(): self.result_label.config(text="No words match these letters and lengths.")
+        else: self.result_label.config(text="Start typing to begin. Tab restarts.")
+        self._move_cursor(-1, 0)
+        self._update_stats_label()
+        if self.root.winfo_exists(): self.root.focus_set()
+
+    def _add_words(self):
+        min_len, max_len = self.WORD_LENGTHS.get(self.length_var.get(), (1, MAX_WORD_LEN))
+        words = get_word_corpus().sample(self.rng, self.BATCH_WORDS, min_len, max_len, self.letters_entry.get().strip() or None)
+        if not words: return 0
+        appended = self.session.extend(words)
+        self.text.config(state=tk.NORMAL)
+        self.text.insert(tk.END, appended)
+        self.text.config(state=tk.DISABLED)
+        return len(words)
+
+    def _move_cursor(self, old, new):
+        if old >= 0: self.text.tag_remove("cursor", f"1.{old}")
+        self.text.tag_add("cursor", f"1.{new}")
+        self.text.see(f"1.{new}")
+
+    def on_state_change(self, event_type, keysym, char, keycode, state, time, modifiers_changed):
+        if event_type != PRESS or not self.visible or self.session is None: return
+        if keysym == "Tab": self.restart(); return
+        if self.finished or self.root.focus_get() is self.letters_entry: return
+        session = self.session
+        if keysym == "BackSpace":
+            pos = session.backspace()
+            if pos < 0: return
+            self.text.tag_remove("ok", f"1.{pos}"); self.text.tag_remove("bad", f"1.{pos}")
+            self._move_cursor(pos + 1, pos)
+            return
+        if len(char) != 1 or not char.isprintable(): return
+        pos = session.position
+        key_ids = self.layout_index.lookup(keysym, char)
+        ok = session.type_char(char, key_ids[0] if key_ids else -1)
+        self.text.tag_add("ok" if ok else "bad", f"1.{pos}")
+        if len(session.target) - session.position < self.LOOKAHEAD_CHARS: self._add_words()
+        self._move_cursor(pos, pos + 1)
+        if self._tick_after_id is None: self._tick()
+
+    def _tick(self):
+        """Refreshes the live figures a few times a second and ends the test when the time is up."""
+        self._tick_after_id = None
+        if not self.stats_label.winfo_exists(): return
+        if self.session.elapsed_s() >= self.duration_s: self.finish(); return
+        self._update_stats_label()
+        self._tick_after_id = self.root.after(STYLE_CONFIG["typing_refresh_ms"], self._tick)
+
+    def _update_stats_label(self):
+        elapsed = min(self.session.elapsed_s(), self.duration_s)
+        stats = self.session.stats(elapsed)
+        self.stats_label.config(text=f"{self.duration_s - elapsed:4.0f} s   {stats['wpm']:5.1f} wpm   {stats['accuracy']:5.1f}% acc")
+
+    def finish(self):
+        self.finished = True
+        stats = self.session.stats(self.duration_s)
+        self._update_stats_label()
+        key_defs = self.layout_index.key_defs
+        worst = ", ".join(f"{key_defs[key_id].label.strip() or key_id} {rate:.0%} of {attempts}" for key_id, rate, attempts in self.session.worst_keys())
+        self.result_label.config(text=f"{stats['wpm']:.1f} wpm (raw {stats['raw_wpm']:.1f}), {stats['accuracy']:.1f}% accuracy, "
+                                      f"{stats['chars']} characters, {stats['errors']} errors in {self.duration_s} s.\n"
+                                      f"Most missed keys: {worst or 'none'}.   Tab for a new test.")
+        super().update_app_info_label(f"Typing test: {stats['wpm']:.1f} wpm, {stats['accuracy']:.1f}% accuracy")
+
+    def restore_state(self, snapshot):
+        self.restart() # Probe keystrokes were typed into the test
+
+    def on_show(self):
+        if self.root.winfo_exists(): self.root.focus_set()
+
+def parse_stream_address(value):
+    """(host, port) from a KBTEST_STREAM value "[host:]port"; an empty part falls back to STYLE_CONFIG. Raises ValueError."""
+    host, _, port = value.rpartition(":")
+    if host.startswith("[") and host.endswith("]"): host = host[1:-1] # [::1]:8765
+    if not port: return host or STYLE_CONFIG["stream_host"], STYLE_CONFIG["stream_port"]
+    if not port.isdigit() or not 0 <= int(port) <= 65535: raise ValueError(f"port '{port}' is not a number from 0 to 65535")
+    return host or STYLE_CONFIG["stream_host"], int(port)
+
 # --- Main Application Controller ---
 class KeyboardTesterApp:
     def __init__(self, root):
@@ -498,14 +1670,32 @@ class KeyboardTesterApp:
         root.configure(bg=STYLE_CONFIG["window_bg"])
         root.minsize(750, 600)
 
+        if STYLE_CONFIG["font_family"] not in tkinter.font.families(root):
+            STYLE_CONFIG["font_family"] = "Arial" # A common fallback
         self.font_normal_obj = tkinter.font.Font(family=STYLE_CONFIG["font_family"], size=STYLE_CONFIG["font_size_normal"])
         self.avg_char_width = self.font_normal_obj.measure("0")
 
+        self.profiler = HotPathProfiler(PROFILE_TARGETS)
+        self._profiler_after_id = None
+        self.profile_dump_path = os.environ.get("KBTEST_PROFILE_DUMP") or STYLE_CONFIG["profile_dump_path"]
+        if self.profile_dump_path: self.profiler.start_cprofile()
+
+        self.recorder = None
+        self.latency = LatencyMonitor(root) if STYLE_CONFIG["latency_monitor"] else None
+        self.latency_overlay = None
+        self._init_key_path()
+        self.health_overlay = None
+        self.stream_server = None
+        self.stress_probe = None
         self.active_mode_instance = None
+        self.mode_instances = {} # Built on first use, then kept for the app's lifetime
+        self.last_mode_switch_ms = 0.0
         self.modes = {
             "Visual Keyboard": VisualKeyboardDisplayMode,
-            "Event Logger": EventLoggerMode
+            "Event Logger": EventLoggerMode,
+            "Typing Test": TypingTestMode
         }
+        if HAVE_NUMPY: self.modes["Heatmap"] = HeatmapMode
 
         top_control_frame = tk.Frame(root, bg=STYLE_CONFIG["window_bg"], pady=10)
         top_control_frame.pack(fill=tk.X)
@@ -520,6 +1710,21 @@ class KeyboardTesterApp:
         mode_menu = ttk.Combobox(top_control_frame, textvariable=self.mode_var, values=list(self.modes.keys()), state="readonly", width=18, font=(STYLE_CONFIG["font_family"], STYLE_CONFIG["font_size_normal"]))
         mode_menu.pack(side=tk.LEFT, padx=5)
         mode_menu.bind("<<ComboboxSelected>>", self.on_app_mode_change)
+        self.record_button = tk.Button(top_control_frame, text="Record", command=self.toggle_recording, takefocus=0,
+                                       bg=STYLE_CONFIG["key_bg"], fg=STYLE_CONFIG["key_fg"], activebackground=STYLE_CONFIG["key_pressed_bg"],
+                                       font=(STYLE_CONFIG["font_family"], STYLE_CONFIG["font_size_normal"]), relief=STYLE_CONFIG["key_relief"])
+        self.record_button.pack(side=tk.LEFT, padx=5)
+        if self.latency:
+            tk.Button(top_control_frame, text="Latency", command=self.toggle_latency_overlay, takefocus=0,
+                      bg=STYLE_CONFIG["key_bg"], fg=STYLE_CONFIG["key_fg"], activebackground=STYLE_CONFIG["key_pressed_bg"],
+                      font=(STYLE_CONFIG["font_family"], STYLE_CONFIG["font_size_normal"]), relief=STYLE_CONFIG["key_relief"]).pack(side=tk.LEFT, padx=5)
+        tk.Button(top_control_frame, text="Health", command=self.toggle_health_overlay, takefocus=0,
+                  bg=STYLE_CONFIG["key_bg"], fg=STYLE_CONFIG["key_fg"], activebackground=STYLE_CONFIG["key_pressed_bg"],
+                  font=(STYLE_CONFIG["font_family"], STYLE_CONFIG["font_size_normal"]), relief=STYLE_CONFIG["key_relief"]).pack(side=tk.LEFT, padx=5)
+        self.profile_button = tk.Button(top_control_frame, text="Profile", command=self.toggle_profiler, takefocus=0,
+                                        bg=STYLE_CONFIG["key_bg"], fg=STYLE_CONFIG["key_fg"], activebackground=STYLE_CONFIG["key_pressed_bg"],
+                                        font=(STYLE_CONFIG["font_family"], STYLE_CONFIG["font_size_normal"]), relief=STYLE_CONFIG["key_relief"])
+        self.profile_button.pack(side=tk.LEFT, padx=5)
         self.info_label = tk.Label(top_control_frame, text="Select a mode to begin. Esc to close.", bg=STYLE_CONFIG["window_bg"], fg=STYLE_CONFIG["info_fg"], font=(STYLE_CONFIG["font_family"], STYLE_CONFIG["font_size_normal"]))
         self.info_label.pack(side=tk.LEFT, padx=20, expand=True, fill=tk.X)
 
@@ -529,37 +1734,363 @@ class KeyboardTesterApp:
 
         root.bind("<KeyPress>", self._handle_key_press)
         root.bind("<KeyRelease>", self._handle_key_release)
-        root.bind("<Escape>", lambda e: self.root.destroy() if self.root.winfo_exists() else None)
+        root.bind("<Escape>", lambda e: self.close())
+        root.protocol("WM_DELETE_WINDOW", self.close)
+        if STYLE_CONFIG["profiler"] or os.environ.get("KBTEST_PROFILE", "") not in ("", "0"): self.toggle_profiler()
+        stream = os.environ.get("KBTEST_STREAM")
+        if stream or STYLE_CONFIG["stream_server"]:
+            try:
+                host, port = parse_stream_address(stream or "")
+                problem = None
+            except ValueError as e:
+                host, port = STYLE_CONFIG["stream_host"], STYLE_CONFIG["stream_port"]
+                problem = f"KBTEST_STREAM={stream!r} ignored ({e}); "
+            self.start_stream_server(host, port)
+            if problem: self.info_label.config(text=problem + self.info_label.cget("text"))
+        evdev_source = os.environ.get("KBTEST_EVDEV") or (STYLE_CONFIG["evdev_source"] if STYLE_CONFIG["input_backend"] == "evdev" else None)
+        if evdev_source: self.start_raw_input(evdev_source)
         if self.root.winfo_exists(): root.focus_set()
 
+    def _init_key_path(self):
+        """Creates the Tk-free part of the key path: state engine, input coalescer and health analyzer."""
+        self.engine = KeyboardStateEngine()
+        self.input = InputCoalescer(self.engine)
+        self._latency_pending = [] # (event.time, handler entry ns) of queued events, observed after the drain
+        self.raw_input = None # kbevdev.EvdevReader while the evdev backend is in use
+        # Subscribed before any mode, so modes see this event's findings. It needs every event, autorepeat
+        # included, so it is an engine subscriber, never one of the coalescer's.
+        self.health = KeyHealthAnalyzer(STYLE_CONFIG["health_chatter_ms"], STYLE_CONFIG["health_ghost_window_ms"],
+                                        pressed_keys=self.engine.currently_pressed_physical_keys)
+        self.engine.subscribe(self.health.on_state_change)
+
+    def close(self):
+        if self.stress_probe and self.stress_probe.running: self.stress_probe.cancel()
+        self.stop_raw_input()
+        if self.stream_server: self.engine.unsubscribe(self.stream_server.on_state_change); self.stream_server.close()
+        self.stop_recording()
+        if self.health.events: print(self.health.summary_text()) # End-of-session switch health summary
+        if self.profiler.enabled:
+            self.profiler.disable(); self.export_profile_report()
+        if self.profile_dump_path: # pstats data for pstats/snakeviz, plus the top entries as text next to it
+            with open(self.profile_dump_path + ".txt", "w", encoding="utf-8") as f: f.write(self.profiler.stop_cprofile(self.profile_dump_path))
+        if self.root.winfo_exists(): self.root.destroy()
+
+    def toggle_recording(self):
+        if self.recorder: self.stop_recording()
+        else: self.start_recording()
+        if self.root.winfo_exists(): self.root.focus_set()
+
+    def start_recording(self, path=None):
+        """Starts writing every key event to a .kbts session file (see kbrecord.py)."""
+        if self.recorder: return self.recorder.path
+        self.recorder = SessionRecorder(path or new_session_path(STYLE_CONFIG["session_dir"]))
+        self.health.reset() # The session's health report covers exactly the recorded events
+        self.engine.subscribe(self.recorder.on_state_change)
+        self.record_button.config(text="Stop Rec", bg=STYLE_CONFIG["key_active_modifier_bg"])
+        self.info_label.config(text=f"Recording to {self.recorder.path}")
+        return self.recorder.path
+
+    def stop_recording(self):
+        if not self.recorder: return None
+        recorder, self.recorder = self.recorder, None
+        self.engine.unsubscribe(recorder.on_state_change)
+        try:
+            recorder.close()
+        except Exception as e: # Whatever stopped the writer thread; the file has no trailer
+            failure = f"Recording to {recorder.path} failed after {recorder.records_written} events: {e}"
+        else:
+            failure = None
+        health_path = self.export_health_report(os.path.splitext(recorder.path)[0] + "-health.json")
+        if self.record_button.winfo_exists(): self.record_button.config(text="Record", bg=STYLE_CONFIG["key_bg"])
+        if self.info_label.winfo_exists():
+            self.info_label.config(text=failure or f"Saved {recorder.records_written} events to {recorder.path}, "
+                                                   f"{len(self.health.suspects)} suspect keys in {os.path.basename(health_path)}")
+        if failure: print(failure, file=sys.stderr)
+        return None if failure else recorder.path
+
+    def start_stream_server(self, host, port):
+        """Publishes the key event stream to local viewers (see kbstream.py); returns the bound (host, port) or None."""
+        from kbstream import EventStreamServer # asyncio is only loaded when streaming is switched on
+        server = EventStreamServer(host, port, STYLE_CONFIG["stream_frame_ms"], STYLE_CONFIG["stream_client_queue"])
+        try:
+            address = server.start()
+        except OSError as e:
+            self.info_label.config(text=f"Event stream not started: {e}")
+            return None
+        self.stream_server = server
+        self.engine.subscribe(server.on_state_change)
+        self.info_label.config(text=f"Streaming key events on {address[0]}:{address[1]}")
+        return address
+
+    def start_raw_input(self, source="auto"):
+        """Takes key input from a kbevdev.EvdevReader (an evdev device, "auto", or a recorded evdev stream)
+        instead of Tk's key events; falls back to Tk events if the source cannot be opened."""
+        self.stop_raw_input()
+        try:
+            if source == "auto":
+                keyboards = find_keyboards()
+                if not keyboards: raise OSError("no keyboard found under /dev/input")
+                source = keyboards[0]
+            self.raw_input = EvdevReader(source)
+        except OSError as e:
+            self.info_label.config(text=f"evdev input unavailable ({e}); using Tk key events")
+            return None
+        self.info_label.config(text=f"Reading keys from {self.raw_input.name}")
+        self.root.after(STYLE_CONFIG["evdev_poll_ms"], self._poll_raw_input)
+        return self.raw_input
+
+    def stop_raw_input(self):
+        if self.raw_input is None: return
+        raw_input, self.raw_input = self.raw_input, None
+        raw_input.close()
+
+    def _poll_raw_input(self):
+        """Pushes the events the evdev reader thread queued since the last poll and drains them as one batch."""
+        raw_input = self.raw_input
+        if raw_input is None or not self.root.winfo_exists(): return
+        finished = raw_input.finished
+        if raw_input.drain(self.input.push): self._drain_input()
+        if finished: # The reader thread is done and everything it queued has been fed
+            self.stop_raw_input()
+            self.info_label.config(text=f"evdev input from {raw_input.name} ended after {raw_input.events_drained} events"
+                                        + (f": {raw_input.error}" if raw_input.error else "") + "; using Tk key events")
+            return
+        self.root.after(STYLE_CONFIG["evdev_poll_ms"], self._poll_raw_input)
+
     def on_app_mode_change(self, event=None):
         selected_mode_name = self.mode_var.get()
         self.switch_mode(selected_mode_name)
 
+    def get_mode(self, mode_name):
+        """Returns the instance of a mode, building it on first use (None for an unknown name)."""
+        mode = self.mode_instances.get(mode_name)
+        if mode is None and mode_name in self.modes:
+            mode = self.mode_instances[mode_name] = self.modes[mode_name](self, self.content_frame)
+        return mode
+
     def switch_mode(self, mode_name):
-        if self.active_mode_instance:
-            self.active_mode_instance.deactivate()
-            self.active_mode_instance.destroy_ui()
-
-        mode_class = self.modes.get(mode_name)
-        if mode_class:
-            self.active_mode_instance = mode_class(self, self.content_frame)
-            self.active_mode_instance.activate()
+        """Hides the current mode and shows mode_name; modes are never rebuilt, so their state and logs survive."""
+        start = time.perf_counter()
+        mode = self.get_mode(mode_name)
+        if mode:
+            if mode is not self.active_mode_instance:
+                if self.active_mode_instance: self.active_mode_instance.deactivate()
+                self.active_mode_instance = mode
+                mode.activate()
+            self.last_mode_switch_ms = (time.perf_counter() - start) * 1e3
             if self.info_label.winfo_exists():
-                self.info_label.config(text=f"{mode_name} active. Esc to close.")
+                self.info_label.config(text=f"{mode_name} active ({self.last_mode_switch_ms:.1f} ms). Esc to close.")
+        elif self.info_label.winfo_exists():
+            self.info_label.config(text="Error: Selected mode not found.")
+        if self.root.winfo_exists(): self.root.focus_set()
+
+    def toggle_profiler(self):
+        """Switches the hot-path timers on or off; while on, the info bar shows the busiest methods of each interval."""
+        if self.profiler.enabled:
+            self.profiler.disable()
+            if self._profiler_after_id is not None: self.root.after_cancel(self._profiler_after_id); self._profiler_after_id = None
+            path = self.export_profile_report()
+            self.profile_button.config(text="Profile", bg=STYLE_CONFIG["key_bg"])
+            self.info_label.config(text=f"Profiler off; totals written to {path}")
         else:
-            self.active_mode_instance = None
-            if self.info_label.winfo_exists():
-                self.info_label.config(text="Error: Selected mode not found.")
+            self.profiler.reset(); self.profiler.enable()
+            self.profile_button.config(text="Profiling", bg=STYLE_CONFIG["key_active_modifier_bg"])
+            self.info_label.config(text="Profiler on.")
+            self._profiler_after_id = self.root.after(STYLE_CONFIG["profiler_refresh_ms"], self._refresh_profiler_status)
+        if self.root.winfo_exists(): self.root.focus_set()
+
+    def _refresh_profiler_status(self):
+        self._profiler_after_id = None
+        if not self.profiler.enabled or not self.info_label.winfo_exists(): return
+        self.info_label.config(text=HotPathProfiler.format_window(*self.profiler.window()))
+        self._profiler_after_id = self.root.after(STYLE_CONFIG["profiler_refresh_ms"], self._refresh_profiler_status)
+
+    def _create_overlay(self, buttons, **place):
+        """A small text panel with a row of (text, command) buttons, placed over the window; returns (frame, label)."""
+        overlay = tk.Frame(self.root, bg=STYLE_CONFIG["text_widget_bg"], bd=1, relief=tk.SOLID)
+        label = tk.Label(overlay, justify=tk.LEFT, bg=STYLE_CONFIG["text_widget_bg"], fg=STYLE_CONFIG["text_widget_fg"], font=("Courier", STYLE_CONFIG["font_size_small"]))
+        label.pack(padx=4, pady=(4, 0))
+        button_row = tk.Frame(overlay, bg=STYLE_CONFIG["text_widget_bg"])
+        button_row.pack(fill=tk.X, padx=4, pady=4)
+        for text, command in buttons:
+            tk.Button(button_row, text=text, command=command, takefocus=0, bg=STYLE_CONFIG["key_bg"], fg=STYLE_CONFIG["key_fg"],
+                      font=(STYLE_CONFIG["font_family"], STYLE_CONFIG["font_size_small"]), relief=STYLE_CONFIG["key_relief"]).pack(side=tk.LEFT, padx=(0, 4))
+        overlay.place(**place)
+        return overlay, label
+
+    def toggle_latency_overlay(self):
+        """Shows/hides a small live p50/p95/p99/max panel in the bottom-right corner of the window."""
+        if self.latency_overlay is not None:
+            self.latency_overlay.destroy(); self.latency_overlay = None
+        else:
+            self.latency_overlay, label = self._create_overlay((("Export", self.export_latency_report), ("Reset", self.reset_latency_stats)),
+                                                               relx=1.0, rely=1.0, x=-8, y=-8, anchor=tk.SE)
+            self._refresh_latency_overlay(label)
         if self.root.winfo_exists(): self.root.focus_set()
 
-    def _handle_key_press(self, event):
-        if self.active_mode_instance and hasattr(self.active_mode_instance, 'on_key_press'):
-            self.active_mode_instance.on_key_press(event)
-    def _handle_key_release(self, event):
-        if self.active_mode_instance and hasattr(self.active_mode_instance, 'on_key_release'):
-            self.active_mode_instance.on_key_release(event)
+    def toggle_health_overlay(self):
+        """Shows/hides the live switch health summary (chatter, missing releases, ghosting, rollover) bottom-left."""
+        if self.health_overlay is not None:
+            self.health_overlay.destroy(); self.health_overlay = None
+        else:
+            self.health_overlay, label = self._create_overlay((("Export", self.export_health_report), ("Reset", self.reset_health)),
+                                                              relx=0.0, rely=1.0, x=8, y=-8, anchor=tk.SW)
+            self._refresh_health_overlay(label)
+        if self.root.winfo_exists(): self.root.focus_set()
+
+    def _refresh_health_overlay(self, label):
+        if self.health_overlay is None or not label.winfo_exists(): return
+        label.config(text=self.health.summary_text())
+        self.root.after(STYLE_CONFIG["latency_overlay_refresh_ms"], self._refresh_health_overlay, label)
+
+    def reset_health(self):
+        self.health.reset()
+        if self.active_mode_instance and self.active_mode_instance.visible: self.active_mode_instance.on_show()
+        if self.root.winfo_exists(): self.root.focus_set()
+
+    def export_health_report(self, path=None):
+        """Writes the health analyzer's report as JSON (default: a timestamped file in session_dir); returns the path."""
+        if path is None:
+            os.makedirs(STYLE_CONFIG["session_dir"], exist_ok=True)
+            path = os.path.join(STYLE_CONFIG["session_dir"], time.strftime("health-%Y%m%d-%H%M%S.json"))
+        with open(path, "w", encoding="utf-8") as f: json.dump(self.health.report(), f, indent=2)
+        if self.info_label.winfo_exists(): self.info_label.config(text=f"Health report written to {path}")
+        if self.root.winfo_exists(): self.root.focus_set()
+        return path
+
+    def export_profile_report(self, path=None):
+        """Writes the hot-path profiler's totals as text (default: a timestamped file in session_dir); returns the path."""
+        if path is None:
+            os.makedirs(STYLE_CONFIG["session_dir"], exist_ok=True)
+            path = os.path.join(STYLE_CONFIG["session_dir"], time.strftime("profile-%Y%m%d-%H%M%S.txt"))
+        with open(path, "w", encoding="utf-8") as f: f.write(self.profiler.report_text())
+        return path
+
+    def _refresh_latency_overlay(self, label):
+        if self.latency_overlay is None or not label.winfo_exists(): return
+        label.config(text=self.latency.summary_text() + "\n" + self.input_summary_text())
+        self.root.after(STYLE_CONFIG["latency_overlay_refresh_ms"], self._refresh_latency_overlay, label)
+
+    def input_summary_text(self):
+        depth = self.input.depth_histogram.summary()
+        text = (f"{'batches':<8}{self.input.batches:>7}  depth p99 {depth['p99']} max {depth['max']}\n"
+                f"{'folded':<8}{self.input.events_folded:>7}  of {self.input.events_received} events")
+        if self.raw_input is not None and self.raw_input.live:
+            delay = self.raw_input.delay_histogram.summary()
+            text += f"\n{'kernel':<8}{delay['count']:>7}  p50 {delay['p50']} p99 {delay['p99']} us to app"
+        return text
+
+    def input_stats(self):
+        stats = self.input.stats()
+        if self.raw_input is not None:
+            stats["evdev"] = {"source": self.raw_input.name, "events": self.raw_input.events_drained, "overflows": self.raw_input.syn_dropped,
+                              "kernel_to_app_us": self.raw_input.delay_histogram.summary()}
+        return stats
+
+    def reset_latency_stats(self):
+        self.latency.reset(); self.input.reset_stats()
+        if self.raw_input is not None: self.raw_input.delay_histogram.reset()
+        if self.root.winfo_exists(): self.root.focus_set()
+
+    def export_latency_report(self):
+        path = self.latency.export_report(extra={"input": self.input_stats()})
+        self.info_label.config(text=f"Latency report written to {path}")
+        if self.root.winfo_exists(): self.root.focus_set()
+        return path
+
+    def active_layout_name(self):
+        """Layout selected in the current mode, or the first layout for modes without one (Event Logger)."""
+        layout_var = getattr(self.active_mode_instance, "layout_var", None)
+        return layout_var.get() if layout_var is not None else next(iter(LAYOUTS))
+
+    def run_stress_probe(self, on_done=None, on_step=None):
+        """Starts the throughput stress probe (see StressProbe); on_step(step summary) is called after each rate step and
+        on_done(run, regressions) when it has finished."""
+        if self.stress_probe and self.stress_probe.running: return self.stress_probe
+        if self.raw_input is not None:
+            self.info_label.config(text="Stress probe: not available while the evdev backend delivers the keys")
+            return None
+        self.stress_probe = StressProbe(self, on_done, on_step)
+        return self.stress_probe if self.stress_probe.start() else None
+
+    def _handle_key_press(self, event): self._handle_key_event(PRESS, event)
+    def _handle_key_release(self, event): self._handle_key_event(RELEASE, event)
+
+    def _handle_key_event(self, event_type, event):
+        if self.raw_input is not None: return # The evdev backend delivers the keys
+        start_ns = time.perf_counter_ns()
+        first_in_batch = self.input.push(event_type, event.keysym, event.char, event.keycode, event.state, event.time)
+        if self.latency: self._latency_pending.append((event.time, start_ns))
+        if not STYLE_CONFIG["input_coalescing"]: self._drain_input() # Every event is its own batch
+        elif first_in_batch:
+            if STYLE_CONFIG["input_drain_ms"] > 0: self.root.after(STYLE_CONFIG["input_drain_ms"], self._drain_input)
+            else: self.root.after_idle(self._drain_input)
+
+    def _drain_input(self):
+        """Hands every key event queued since the last frame to the views as one folded batch, then lets the modes repaint once."""
+        self.input.drain()
+        for mode in self.mode_instances.values(): mode.on_batch_end()
+        if self.latency:
+            for event_time, start_ns in self._latency_pending: self.latency.observe(event_time, start_ns)
+            self._latency_pending.clear()
+# Methods the built-in profiler times (see kbprofile.py). Tk bindings and engine subscribers hold bound
+# methods from before profiling starts, so they are covered through the methods they call.
+PROFILE_TARGETS = (
+    (KeyboardTesterApp, "_handle_key_event"), (KeyboardTesterApp, "_drain_input"),
+    (KeyboardStateEngine, "feed"), (KeyHealthAnalyzer, "feed"),
+    (VisualKeyboardDisplayMode, "_show_key_press"), (VisualKeyboardDisplayMode, "_show_key_release"),
+    (VisualKeyboardDisplayMode, "on_batch_end"), (VisualKeyboardDisplayMode, "update_all_modifier_visuals"),
+    (VisualKeyboardDisplayMode, "_find_widgets_for_event"), (VisualKeyboardDisplayMode, "_resync_layout_visuals"),
+    (VisualKeyboardDisplayMode, "draw_visual_keyboard"), (VisualKeyboardDisplayMode, "show_layout"),
+    (VisualKeyboardDisplayMode, "_build_layout"),
+    (EventLoggerMode, "log_event"), (EventLoggerMode, "render"),
+    (HeatmapMode, "refresh_heatmap"),
+)
+
+def stress_main(argv=None):
+    """`python pythonkytest.py stress`: opens the app in the given mode and layout, runs the stress probe and
+    saves the result under session_dir/stress. Exit status 1 if the sustained rate regressed, 2 if the probe did not finish."""
+    parser = argparse.ArgumentParser(prog="pythonkytest.py stress", description="Find the key event rate this machine keeps up with")
+    parser.add_argument("--mode", default="Visual Keyboard", help="tester mode to measure (default: Visual Keyboard)")
+    parser.add_argument("--layout", choices=list(LAYOUTS), help="layout to select in that mode (default: the mode's own default)")
+    parser.add_argument("--start-rate", type=int, default=STYLE_CONFIG["stress_start_rate"], help="events/s of the first step")
+    parser.add_argument("--max-rate", type=int, default=STYLE_CONFIG["stress_max_rate"], help="highest events/s tried")
+    parser.add_argument("--step-ms", type=int, default=STYLE_CONFIG["stress_step_ms"], help="how long each rate is held")
+    args = parser.parse_args(argv)
+    STYLE_CONFIG.update(stress_start_rate=max(2, args.start_rate), stress_max_rate=max(2, args.max_rate), stress_step_ms=max(100, args.step_ms))
+    root = tk.Tk()
+    app = KeyboardTesterApp(root)
+    if args.mode not in app.modes:
+        root.destroy()
+        parser.error(f"unknown mode '{args.mode}' (available: {', '.join(app.modes)})")
+    app.mode_var.set(args.mode)
+    app.switch_mode(args.mode)
+    mode = app.active_mode_instance
+    if args.layout and getattr(mode, "layout_var", None) is not None:
+        mode.layout_var.set(args.layout)
+        if hasattr(mode, "on_layout_config_change"): mode.on_layout_config_change()
+        else: mode.restart()
+    status = {"code": 2}
+    def step(summary):
+        print(f"stress {summary['rate']:>6}/s: lag p95 {summary['lag_ms']['p95']} ms, growth {summary['lag_slope_ms_per_s']} ms/s, "
+              f"{summary['handler_us_per_event']} us/event, {summary['busy']:.0%} busy")
+    def done(run, regressions):
+        print(format_report(run))
+        for line in regressions: print(f"REGRESSION: {line}")
+        status["code"] = 1 if regressions else 0
+        app.close()
+    def start():
+        if app.run_stress_probe(done, step) is None: app.close()
+    root.after(500, start) # Let the window map and paint first
+    root.mainloop()
+    return status["code"]
+
 if __name__ == "__main__":
+    if sys.argv[1:2] == ["analyze"]: # Headless batch analysis of recorded sessions, see kbbatch.py
+        import kbbatch
+        sys.exit(kbbatch.main(sys.argv[2:]))
+    if sys.argv[1:2] == ["stress"]: # Event-rate saturation probe, see StressProbe and kbstress.py
+        sys.exit(stress_main(sys.argv[2:]))
     root = tk.Tk()
     app = KeyboardTesterApp(root)
     root.mainloop()
\ No newline at end of file
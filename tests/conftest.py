@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The kb*.py modules live at the repository root, next to pythonkytest.py.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,41 @@
+import pytest
+
+pytest.importorskip("numpy")
+pytest.importorskip("tkinter")
+import kbbatch
+from kbrecord import SessionRecorder
+from kbstate import PRESS, RELEASE
+
+
+def record(path, events):
+    recorder = SessionRecorder(str(path))
+    for event in events: recorder.record(*event)
+    recorder.close()
+    return str(path)
+
+
+def test_x11_autorepeat_is_one_press_not_chatter(tmp_path):
+    events = [(PRESS, 'a', 'a', 38, 0, 1000)]
+    for t in range(1500, 2000, 33): events += [(RELEASE, 'a', 'a', 38, 0, t), (PRESS, 'a', 'a', 38, 0, t)]
+    events.append((RELEASE, 'a', 'a', 38, 0, 2100))
+    row, stats, chatter = kbbatch.analyze_file(record(tmp_path / "repeat.kbts", events), "QWERTY_Full_US", 10)
+    assert row["presses"] == 1 and row["chatter"] == 0 and row["orphan_releases"] == 0
+    assert stats.dwell_sum.sum() == 1100
+
+
+def test_zero_gap_bounce_is_chatter(tmp_path):
+    events = [(PRESS, 'a', 'a', 38, 0, 1000), (RELEASE, 'a', 'a', 38, 0, 1030), (PRESS, 'a', 'a', 38, 0, 1030),
+              (RELEASE, 'a', 'a', 38, 0, 1040)]
+    row, _stats, chatter = kbbatch.analyze_file(record(tmp_path / "bounce.kbts", events), "QWERTY_Full_US", 10)
+    assert row["presses"] == 2 and row["chatter"] == 1 and chatter.sum() == 1
+
+
+def test_unreadable_sessions_are_skipped(tmp_path, capsys):
+    good = record(tmp_path / "good.kbts", [(PRESS, 'a', 'a', 38, 0, 1000), (RELEASE, 'a', 'a', 38, 0, 1080)])
+    (tmp_path / "bad.kbts").write_bytes(bytes(40))
+    session_rows, _rows, skipped = kbbatch.run(str(tmp_path), "QWERTY_Full_US", jobs=1)
+    assert [row["session"] for row in session_rows] == [good]
+    assert [path for path, _error in skipped] == [str(tmp_path / "bad.kbts")] and "truncated" in skipped[0][1]
+    assert (tmp_path / "summary-sessions.csv").exists()
+    assert kbbatch.main([str(tmp_path), "--jobs", "1"]) == 0
+    assert "skipped" in capsys.readouterr().err
@@ -0,0 +1,93 @@
+import io
+import time
+
+import pytest
+
+from kbevdev import (EV_KEY, EV_SYN, INPUT_EVENT, KEY_PRESS, KEY_RELEASE, KEY_REPEAT, SYN_DROPPED, X_CONTROL, X_LOCK,
+                     X_MOD2, X_SHIFT, EvdevReader, EvdevTranslator, encode_key_events)
+from kbstate import PRESS, RELEASE
+
+KEY_A, KEY_1, KEY_KP7, KEY_LEFTSHIFT, KEY_LEFTCTRL, KEY_CAPSLOCK, KEY_NUMLOCK, BTN_LEFT = 30, 2, 71, 42, 29, 58, 69, 0x110
+
+
+class Trickle(io.RawIOBase):
+    """A stream that hands out at most `size` bytes per read, so records get split between reads."""
+    def __init__(self, data, size): self.data, self.size = data, size
+    def readable(self): return True
+
+    def read(self, n=-1):
+        chunk, self.data = self.data[:min(n, self.size)], self.data[min(n, self.size):]
+        return chunk
+
+
+def read_all(source):
+    reader = EvdevReader(source)
+    deadline = time.monotonic() + 5
+    while not reader.finished and time.monotonic() < deadline: time.sleep(0.001)
+    events = []
+    reader.drain(lambda *event: events.append((event, reader.current)))
+    reader.close()
+    assert reader.error is None
+    return reader, events
+
+
+def test_decodes_presses_releases_and_shift():
+    data = encode_key_events([(1_000_000, KEY_LEFTSHIFT, KEY_PRESS), (1_010_000, KEY_A, KEY_PRESS, 0x1E),
+                              (1_050_500, KEY_A, KEY_RELEASE, 0x1E), (1_060_000, KEY_LEFTSHIFT, KEY_RELEASE), (1_070_000, KEY_1, KEY_PRESS)])
+    reader, events = read_all(data)
+    assert [event for event, _current in events] == [
+        (PRESS, 'Shift_L', '', 50, X_MOD2, 1000),
+        (PRESS, 'A', 'A', 38, X_SHIFT | X_MOD2, 1010),
+        (RELEASE, 'A', 'A', 38, X_SHIFT | X_MOD2, 1050),
+        (RELEASE, 'Shift_L', '', 50, X_SHIFT | X_MOD2, 1060),
+        (PRESS, '1', '1', 10, X_MOD2, 1070),
+    ]
+    assert [current for _event, current in events][1:3] == [(0x1E, 1_010_000), (0x1E, 1_050_500)]
+    assert reader.records_read == 15 and reader.events_drained == 5
+
+
+def test_records_split_across_reads():
+    keys = [(i * 1000, KEY_A, KEY_PRESS if i % 2 == 0 else KEY_RELEASE) for i in range(50)]
+    data = encode_key_events(keys)
+    _reader, whole = read_all(data)
+    _reader, trickled = read_all(Trickle(data, INPUT_EVENT.size // 2 + 3))
+    assert trickled == whole and len(whole) == 50
+
+
+def test_trailing_partial_record_is_ignored():
+    data = encode_key_events([(0, KEY_A, KEY_PRESS), (1000, KEY_A, KEY_RELEASE)])
+    reader, events = read_all(data + data[:INPUT_EVENT.size - 1])
+    assert len(events) == 2 and reader.records_read == 6
+
+
+def test_autorepeat_is_a_press_with_the_held_scancode():
+    data = encode_key_events([(0, KEY_A, KEY_PRESS, 0x70004), (500_000, KEY_A, KEY_REPEAT), (533_000, KEY_A, KEY_REPEAT),
+                              (600_000, KEY_A, KEY_RELEASE, 0x70004)])
+    _reader, events = read_all(data)
+    assert [(event[0], event[1]) for event, _ in events] == [(PRESS, 'a'), (PRESS, 'a'), (PRESS, 'a'), (RELEASE, 'a')]
+    assert {current[0] for _, current in events} == {0x70004}
+
+
+def test_lock_toggles_and_keypad():
+    translator = EvdevTranslator(caps_lock=False, num_lock=True)
+    records = [(0, 0, EV_KEY, KEY_KP7, KEY_PRESS), (0, 0, EV_KEY, KEY_NUMLOCK, KEY_PRESS), (0, 0, EV_KEY, KEY_NUMLOCK, KEY_RELEASE),
+               (0, 0, EV_KEY, KEY_KP7, KEY_PRESS), (0, 0, EV_KEY, KEY_CAPSLOCK, KEY_PRESS), (0, 0, EV_KEY, KEY_A, KEY_PRESS),
+               (0, 0, EV_KEY, KEY_LEFTSHIFT, KEY_PRESS), (0, 0, EV_KEY, KEY_A, KEY_PRESS)]
+    events = [event for event, _scancode, _time_us in translator.translate(records)]
+    assert events[0][1:3] == ('KP_7', '7') and events[3][1:3] == ('KP_Home', '')
+    assert events[5][1:3] == ('A', 'A') and events[5][4] == X_LOCK
+    assert events[7][1:3] == ('a', 'a') and events[7][4] == X_LOCK | X_SHIFT
+
+
+def test_control_chars_buttons_and_overflow():
+    translator = EvdevTranslator()
+    records = [(0, 0, EV_KEY, KEY_LEFTCTRL, KEY_PRESS), (0, 0, EV_KEY, KEY_A, KEY_PRESS), (0, 0, EV_KEY, BTN_LEFT, KEY_PRESS),
+               (0, 0, EV_SYN, SYN_DROPPED, 0)]
+    events = [event for event, _scancode, _time_us in translator.translate(records)]
+    assert len(events) == 2 and events[1][1:3] == ('a', '\x01') and events[1][4] & X_CONTROL
+    assert translator.syn_dropped == 1
+
+
+def test_missing_device():
+    with pytest.raises(OSError):
+        EvdevReader("/nonexistent/input/event99")
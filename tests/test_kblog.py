@@ -0,0 +1,134 @@
+import random
+
+import pytest
+
+import kblog
+from kblog import EventFilter, EventStore, FilteredView
+from kbrecord import SessionRecorder
+from kbstate import PRESS, RELEASE
+
+KEYS = [("a", "A", 38), ("s", "S", 39), ("Return", "Return", 36), ("Shift_L", "Shift_L", 50)]
+
+
+def random_events(count, seed=7):
+    rng = random.Random(seed)
+    for i in range(count):
+        lower, upper, keycode = rng.choice(KEYS)
+        state = rng.choice((0, 0x1, 0x4, 0x5, 0x10))
+        keysym = upper if state & 0x1 else lower
+        yield (rng.choice((PRESS, RELEASE)), keysym, keysym if len(keysym) == 1 else "", keycode, state, i * 10)
+
+
+def filled_store(count, capacity=kblog.DEFAULT_CAPACITY):
+    store = EventStore(capacity)
+    for event in random_events(count): store.append(*event)
+    return store
+
+
+def brute_force(store, event_filter, start=0):
+    return [row for row in range(max(start, store.base), store.end) if event_filter.matches_index(store, row - store.base)]
+
+
+def test_append_and_row():
+    store = EventStore()
+    assert store.append(PRESS, "a", "a", 38, 0, 5) == 0
+    assert store.append(RELEASE, "A", "A", 38, 1, 2**32 + 7, raw=(30, 123456)) == 1
+    assert len(store) == 2 and store.end == 2
+    assert store.row(0) == (PRESS, "a", "a", 38, 0, 5, None)
+    assert store.row(1) == (RELEASE, "A", "A", 38, 1, 7, (30, 123456))
+    assert store.string_id("a") is not None and store.string_id("missing") is None
+    with pytest.raises(IndexError): store.row(2)
+
+
+def test_trim_keeps_ids_and_postings():
+    store = filled_store(100, capacity=10)
+    assert len(store) <= 10 and store.end == 100 and store.base == store.dropped == 100 - len(store)
+    with pytest.raises(IndexError): store.row(store.base - 1)
+    for index in store._indexes():
+        for rows in index.values(): assert rows and rows[0] >= store.base
+    event_filter = EventFilter.parse("keycode=38")
+    assert list(event_filter.query(store)) == brute_force(store, event_filter)
+
+
+def test_clear_carries_ids_on():
+    store = filled_store(20)
+    store.clear()
+    assert len(store) == 0 and store.base == store.end == 20 and store.dropped == 0
+    assert store.append(PRESS, "a", "a", 38, 0, 0) == 20
+
+
+def test_truncate_drops_the_newest_rows():
+    store = filled_store(500)
+    view = FilteredView(store, EventFilter.parse("keycode=38"))
+    store.truncate(300)
+    assert store.end == 300 and list(EventFilter.parse("keycode=38").query(store)) == brute_force(store, view.filter)
+    view.update()
+    assert list(view.rows) == brute_force(store, view.filter)
+    for event in random_events(50, seed=3): store.append(*event)
+    view.update()
+    assert store.end == 350 and list(view.rows) == brute_force(store, view.filter)
+    store.truncate(store.base - 1)
+    assert len(store) == 0 and store.end == store.base
+
+
+def test_parse():
+    event_filter = EventFilter.parse("kc=38,39 release shift -ctrl Return")
+    assert event_filter.keycodes == {38, 39} and event_filter.event_type == RELEASE
+    assert event_filter.keysyms == {"Return"}
+    assert event_filter.state_all == 0x1 and event_filter.state_none == 0x4
+    assert EventFilter.parse("state=0x14").state_all == 0x14
+    assert EventFilter.parse("").empty
+
+
+@pytest.mark.parametrize("text", ["keycode=x", "state=zz", "colour=red", "keysym=", "!nosuchmod", "shift -shift"])
+def test_parse_rejects(text):
+    with pytest.raises(ValueError): EventFilter.parse(text)
+
+
+@pytest.mark.parametrize("text", ["", "press", "keycode=38", "ks=A,s", "shift", "-shift release",
+                                  "kc=38,36 ctrl !numlock", "state=0x5", "Return press -ctrl", "ks=nothing"])
+def test_query_matches_brute_force(text):
+    store = filled_store(3000)
+    event_filter = EventFilter.parse(text)
+    assert list(event_filter.query(store)) == brute_force(store, event_filter)
+    assert list(event_filter.query(store, 1234)) == brute_force(store, event_filter, 1234)
+
+
+def test_filtered_view_follows_the_store():
+    store = EventStore(capacity=400)
+    events = list(random_events(1000))
+    view = FilteredView(store, EventFilter.parse("keycode=38 shift"))
+    for i in range(0, len(events), 150):
+        for event in events[i:i + 150]: store.append(*event)
+        view.update()
+        assert list(view.rows) == brute_force(store, view.filter)
+    rows = list(view.rows)
+    assert len(view) == len(rows) and all(row in view for row in rows)
+    assert view.after(rows[0]) == rows[1] and view.before(rows[1]) == rows[0]
+    assert view.before(rows[0]) is None and view.after(rows[-1]) is None
+    assert view.position_of(rows[2]) == 2 and view.position_of(rows[2] + 1) == 3
+    assert view.row_at(view.position_of(rows[-1])) == rows[-1]
+
+
+def test_empty_filter_view():
+    store = filled_store(50)
+    view = FilteredView(store)
+    assert len(view) == 50 and view.row_at(0) == 0 and 49 in view and 50 not in view
+    assert view.after(10) == 11 and view.before(0) is None and view.position_of(100) == 50
+    store.clear()
+    view.update()
+    assert len(view) == 0 and view.after(0) is None
+
+
+def test_main_exit_status(tmp_path, capsys):
+    path = tmp_path / "session.kbts"
+    recorder = SessionRecorder(str(path))
+    for event in random_events(200): recorder.record(*event)
+    recorder.close()
+    assert kblog.main([str(path), "keycode=38 release", "--limit", "3"]) == 0
+    out, err = capsys.readouterr()
+    assert len(out.splitlines()) == 3 and "events match" in err
+    assert kblog.main([str(path), "keycode=nope"]) != 0
+    assert kblog.main([str(tmp_path / "missing.kbts")]) != 0
+    (tmp_path / "junk.kbts").write_bytes(b"not a session")
+    assert kblog.main([str(tmp_path / "junk.kbts")]) != 0
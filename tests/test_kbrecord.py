@@ -0,0 +1,105 @@
+import os
+import struct
+
+import pytest
+
+from kbrecord import FILE_EXTENSION, HEADER_SIZE, RECORD_SIZE, TRAILER_STRUCT, SessionReader, SessionRecorder, new_session_path
+from kbstate import PRESS, RELEASE
+
+EVENTS = [
+    (PRESS, "Shift_L", "", 50, 0, 1000),
+    (PRESS, "A", "A", 38, 1, 1010),
+    (RELEASE, "a", "a", 38, 0, 1075),
+    (RELEASE, "Shift_L", "", 50, 1, 1080),
+    (PRESS, "eacute", "é", 47, 0, 4294967295),
+]
+
+
+def record(path, events):
+    recorder = SessionRecorder(str(path))
+    for event in events: recorder.record(*event)
+    recorder.close()
+    return recorder
+
+
+def test_round_trip(tmp_path):
+    path = tmp_path / ("session" + FILE_EXTENSION)
+    recorder = record(path, EVENTS)
+    assert recorder.records_written == len(EVENTS)
+    with SessionReader(str(path)) as reader:
+        assert len(reader) == len(EVENTS)
+        assert list(reader.iter_events()) == EVENTS
+        host_ns = [reader[i][6] for i in range(len(reader))]
+        assert host_ns == sorted(host_ns)
+        assert reader[-1][:6] == EVENTS[-1]
+        with pytest.raises(IndexError): reader[len(EVENTS)]
+    assert path.stat().st_size > HEADER_SIZE + len(EVENTS) * RECORD_SIZE + TRAILER_STRUCT.size
+
+
+def test_empty_session(tmp_path):
+    path = tmp_path / "empty.kbts"
+    record(path, [])
+    with SessionReader(str(path)) as reader:
+        assert len(reader) == 0 and list(reader.iter_events()) == []
+
+
+def test_close_is_idempotent(tmp_path):
+    recorder = record(tmp_path / "twice.kbts", EVENTS[:1])
+    recorder.close()
+    assert recorder.records_written == 1
+
+
+@pytest.mark.parametrize("keep", [
+    lambda size: size - 1,                                          # trailer cut short
+    lambda size: size - TRAILER_STRUCT.size,                        # no trailer at all (writer killed)
+    lambda size: HEADER_SIZE + 2 * RECORD_SIZE + 5,                 # cut inside the records
+    lambda size: HEADER_SIZE,                                       # header only
+    lambda size: 10,                                                # cut inside the header
+])
+def test_truncated_file_is_rejected(tmp_path, keep):
+    path = tmp_path / "cut.kbts"
+    record(path, EVENTS)
+    data = path.read_bytes()
+    path.write_bytes(data[:keep(len(data))])
+    with pytest.raises(ValueError):
+        SessionReader(str(path))
+
+
+def test_empty_file_is_rejected(tmp_path):
+    path = tmp_path / "zero.kbts"
+    path.write_bytes(b"")
+    with pytest.raises(ValueError):
+        SessionReader(str(path))
+
+
+def test_not_a_session_file(tmp_path):
+    path = tmp_path / "other.kbts"
+    path.write_bytes(b"x" * 100)
+    with pytest.raises(ValueError, match="not a keyboard tester session"):
+        SessionReader(str(path))
+
+
+def test_new_session_paths_are_unique(tmp_path):
+    paths = [new_session_path(str(tmp_path)) for _ in range(5)]
+    assert len(set(paths)) == 5 and all(os.path.exists(path) for path in paths)
+
+
+class FullDisk:
+    def __init__(self, file): self.file = file
+    def write(self, data): raise OSError(28, "No space left on device")
+    def tell(self): return self.file.tell()
+    def close(self): self.file.close()
+
+
+def test_writer_failure_is_raised_by_close(tmp_path):
+    recorder = SessionRecorder(str(tmp_path / "full.kbts"))
+    recorder._file = FullDisk(recorder._file)
+    for event in EVENTS * 3: recorder.record(*event)
+    with pytest.raises(OSError, match="No space"): recorder.close()
+    assert isinstance(recorder.error, OSError)
+
+
+def test_trailer_failure_is_raised_by_close(tmp_path):
+    recorder = SessionRecorder(str(tmp_path / "long.kbts"))
+    recorder.record(PRESS, "x" * 70000, "", 1, 0, 0) # Longer than the string table's <H length field
+    with pytest.raises(struct.error): recorder.close()
@@ -0,0 +1,110 @@
+from kbstate import (MODIFIER_BITS, PRESS, RELEASE, InputCoalescer, KeyboardStateEngine, autorepeat_events,
+                     fold_autorepeat, synthetic_events)
+
+
+def press(keysym, keycode=0, time=0, char=None):
+    return (PRESS, keysym, keysym if char is None and len(keysym) == 1 else char or '', keycode, 0, time)
+
+
+def release(keysym, keycode=0, time=0, char=None):
+    return (RELEASE, keysym, keysym if char is None and len(keysym) == 1 else char or '', keycode, 0, time)
+
+
+def test_fold_drops_presses_of_held_keys():
+    held = {38: ('a', 'a')}
+    kept, folded = fold_autorepeat([press('a', 38, 10), press('a', 38, 43), release('a', 38, 60)], held)
+    assert kept == [release('a', 38, 60)] and folded == 2 and held == {}
+
+
+def test_fold_drops_x11_release_press_pairs():
+    events = [press('a', 38, 0), release('a', 38, 33), press('a', 38, 33), release('a', 38, 66), press('a', 38, 66), release('a', 38, 90)]
+    held = {}
+    kept, folded = fold_autorepeat(events, held)
+    assert kept == [press('a', 38, 0), release('a', 38, 90)] and folded == 4 and held == {}
+
+
+def test_fold_keeps_real_repress():
+    events = [press('a', 38, 0), release('a', 38, 40), press('a', 38, 41), release('a', 38, 80)]
+    kept, folded = fold_autorepeat(events, {})
+    assert kept == events and folded == 0
+
+
+def test_fold_leaves_key_down_across_batches():
+    held = {}
+    fold_autorepeat([press('a', 38, 0)], held)
+    assert held == {38: ('a', 'a')}
+    kept, folded = fold_autorepeat([release('a', 38, 33), press('a', 38, 33)], held)
+    assert kept == [] and folded == 2 and held == {38: ('a', 'a')}
+
+
+def test_fold_shifted_release_lets_go_of_the_pressed_key():
+    held = {}
+    events = [press('a', 38, 0), press('Shift_L', 50, 5), release('A', 38, 10, 'A'), press('a', 38, 20)]
+    kept, folded = fold_autorepeat(events, held)
+    # The release carries the press's keysym and char; the next press of the key is not mistaken for autorepeat
+    assert kept == [press('a', 38, 0), press('Shift_L', 50, 5), release('a', 38, 10), press('a', 38, 20)]
+    assert folded == 0 and held == {50: ('Shift_L', ''), 38: ('a', 'a')}
+
+
+def test_fold_without_keycodes_uses_keysyms():
+    kept, folded = fold_autorepeat([press('a'), press('a'), press('b'), release('a', time=1)], {})
+    assert kept == [press('a'), press('b'), release('a', time=1)] and folded == 1
+
+
+def test_engine_tracks_keys_by_keycode():
+    engine = KeyboardStateEngine()
+    for event in (press('a', 38, 0), press('Shift_L', 50, 5), release('A', 38, 10, 'A')): engine.feed(*event)
+    assert engine.currently_pressed_physical_keys == {50: 'Shift_L'}
+    assert engine.modifier_keys_state['Shift_L']
+    engine.feed(*release('Shift_L', 50, 15))
+    assert engine.currently_pressed_physical_keys == {} and not engine.modifier_keys_state['Shift_L']
+
+
+def test_engine_toggles():
+    engine = KeyboardStateEngine()
+    caps = MODIFIER_BITS['Caps_Lock']
+    assert engine.feed(*press('Caps_Lock', 66)) and engine.modifier_mask & caps
+    assert not engine.feed(*release('Caps_Lock', 66)) and engine.modifier_mask & caps
+    engine.feed(*press('Caps_Lock', 66)); engine.feed(*release('Caps_Lock', 66))
+    assert not engine.modifier_mask & caps
+
+
+def test_replay_without_notify_matches_feed():
+    events = synthetic_events(5000, seed=3) + [press('q', 24), press('Shift_L', 50), release('Q', 24, char='Q')]
+    fed, replayed = KeyboardStateEngine(), KeyboardStateEngine()
+    for event in events: fed.feed(*event)
+    replayed.replay(events, notify=False)
+    assert replayed.modifier_mask == fed.modifier_mask
+    assert replayed.currently_pressed_physical_keys == fed.currently_pressed_physical_keys == {50: 'Shift_L'}
+
+
+def test_coalescer_feeds_every_event_to_the_engine_and_folds_for_views():
+    engine = KeyboardStateEngine()
+    coalescer = InputCoalescer(engine)
+    raw, views = [], []
+    engine.subscribe(lambda *change: raw.append(change[:6]))
+    coalescer.subscribe(lambda *change: views.append(change[:6]))
+    events = autorepeat_events(200, repeats=5)
+    for i, event in enumerate(events):
+        coalescer.push(*event)
+        if i % 7 == 6: coalescer.drain()
+    coalescer.drain()
+    assert raw == events
+    assert len(views) < len(events) and coalescer.events_folded == len(events) - len(views)
+    down = set()
+    for event_type, keysym, *_ in views: # Views never see a press of a key that is already down
+        assert (keysym not in down) if event_type == PRESS else (keysym in down)
+        (down.add if event_type == PRESS else down.remove)(keysym)
+    assert coalescer.held == {} and engine.currently_pressed_physical_keys == {}
+    assert coalescer.stats()["events"] == len(events)
+
+
+def test_coalescer_flags_modifier_changes_and_draining():
+    engine = KeyboardStateEngine()
+    coalescer = InputCoalescer(engine)
+    seen = []
+    coalescer.subscribe(lambda *change: seen.append((change[1], change[6], coalescer.draining)))
+    for event in (press('Shift_L', 50), press('a', 38), release('Caps_Lock', 66), release('Shift_L', 50)): coalescer.push(*event)
+    assert seen == []
+    assert coalescer.drain() == 4 and coalescer.drain() == 0
+    assert seen == [('Shift_L', True, True), ('a', False, True), ('Caps_Lock', False, True), ('Shift_L', True, True)]
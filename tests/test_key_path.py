@@ -0,0 +1,154 @@
+"""The app's key path (handler -> InputCoalescer -> engine subscribers), driven without a display."""
+import types
+
+import pytest
+
+pytest.importorskip("tkinter")
+import pythonkytest as kt
+from kblog import EventFilter, EventStore, FilteredView
+from kbstate import PRESS, RELEASE
+
+
+class FakeRoot:
+    """Stands in for the Tk root: collects the drains the handlers schedule."""
+    def __init__(self): self.scheduled = []
+    def after_idle(self, callback): self.scheduled.append(callback)
+    def after(self, _ms, callback): self.scheduled.append(callback)
+    def winfo_exists(self): return False
+
+    def run_idle(self):
+        while self.scheduled: self.scheduled.pop(0)()
+
+
+@pytest.fixture
+def app():
+    app = kt.KeyboardTesterApp.__new__(kt.KeyboardTesterApp)
+    app.root = FakeRoot()
+    app.latency = None
+    app.mode_instances = {}
+    app._init_key_path()
+    return app
+
+
+def key(app, event_type, keysym, keycode, time, frame_end=False):
+    event = types.SimpleNamespace(keysym=keysym, char=keysym if len(keysym) == 1 else '', keycode=keycode, state=0, time=time)
+    (app._handle_key_press if event_type == PRESS else app._handle_key_release)(event)
+    if frame_end: app.root.run_idle()
+
+
+def test_double_press_is_reported_live(app):
+    key(app, PRESS, 'a', 38, 1000)
+    key(app, PRESS, 'a', 38, 2000, frame_end=True) # No release in between, too late for autorepeat
+    assert app.health.report()["totals"]["missing_releases"] == 1
+    assert 'a' in app.health.suspects
+
+
+def test_double_press_in_one_frame_is_reported_live(app):
+    key(app, PRESS, 'a', 38, 1000)
+    key(app, RELEASE, 'a', 38, 1050)
+    key(app, PRESS, 'b', 56, 1100)
+    key(app, PRESS, 'b', 56, 1900, frame_end=True)
+    assert app.health.report()["totals"]["missing_releases"] == 1
+    assert app.input.events_received == 4
+
+
+def test_zero_gap_chatter_is_reported_live(app):
+    key(app, PRESS, 'a', 38, 1000)
+    key(app, RELEASE, 'a', 38, 1030)
+    key(app, PRESS, 'a', 38, 1030) # Bounce on release, same timestamp as the release
+    key(app, RELEASE, 'a', 38, 1040, frame_end=True)
+    assert app.health.report()["totals"]["chatter"] == 1
+
+
+def test_x11_autorepeat_is_not_chatter(app):
+    key(app, PRESS, 'a', 38, 1000)
+    for t in range(1500, 2000, 33):
+        key(app, RELEASE, 'a', 38, t); key(app, PRESS, 'a', 38, t)
+    key(app, RELEASE, 'a', 38, 2100, frame_end=True)
+    report = app.health.report()
+    assert report["suspects"] == [] and app.health.keys[38].repeats == len(range(1500, 2000, 33))
+    assert app.input.events_folded == 2 * len(range(1500, 2000, 33)) # Folded for the views only
+
+
+def test_shifted_release_leaves_no_key_stuck(app):
+    key(app, PRESS, 'a', 38, 1000)
+    key(app, PRESS, 'Shift_L', 50, 1010)
+    key(app, RELEASE, 'A', 38, 1050, frame_end=True)
+    key(app, RELEASE, 'Shift_L', 50, 1060, frame_end=True)
+    assert app.engine.currently_pressed_physical_keys == {} and app.input.held == {}
+    report = app.health.report()
+    assert report["totals"]["stuck"] == 0 and report["totals"]["orphan_releases"] == 0
+
+
+def test_stress_probe_rolls_back_the_event_log(app):
+    logger = kt.EventLoggerMode.__new__(kt.EventLoggerMode)
+    logger.app, logger.root, logger.visible = app, app.root, False
+    logger.store = EventStore()
+    logger.all_rows, logger.matches = FilteredView(logger.store), FilteredView(logger.store, EventFilter.parse("kc=38"))
+    logger.top_row = logger.cursor_row = None; logger.follow = True; logger._rendered_end = 0
+    app.engine.subscribe(logger.on_state_change)
+    app.mode_instances = {"Event Logger": logger}
+    app.active_mode_instance = None
+    key(app, PRESS, 'a', 38, 1000)
+    key(app, RELEASE, 'a', 38, 1050, frame_end=True)
+    probe = kt.StressProbe.__new__(kt.StressProbe)
+    probe.app = app
+    probe._snapshots = {name: mode.snapshot_state() for name, mode in app.mode_instances.items()}
+    for i in range(20): key(app, PRESS, 'a', 38, 2000 + i * 1000) # Double presses the health analyzer reports
+    logger.matches.update()
+    assert len(logger.matches) == 22 and app.health.report()["totals"]["missing_releases"]
+    probe._roll_back()
+    assert logger.store.end == 2 and list(logger.matches.rows) == [0, 1]
+    assert app.health.report()["totals"]["missing_releases"] == 0
+    key(app, PRESS, 'a', 38, 50000, frame_end=True)
+    logger.matches.update()
+    assert list(logger.matches.rows) == [0, 1, 2]
+
+
+def test_heatmap_drops_x11_autorepeat_pairs(app):
+    pytest.importorskip("numpy")
+    import kbstats
+    kt.kbstats = kbstats
+    heatmap = kt.HeatmapMode.__new__(kt.HeatmapMode)
+    heatmap.app, heatmap.root, heatmap.visible = app, app.root, False
+    heatmap.layout_index = kt.get_layout_index(next(iter(kt.LAYOUTS)))
+    heatmap.layout_stats, heatmap._held_keys, heatmap._pending_release, heatmap._refresh_after_id = {}, {}, None, None
+    app.engine.subscribe(heatmap.on_state_change)
+    key(app, PRESS, 'a', 38, 1000)
+    for t in range(1500, 2000, 33): # Autorepeat after a 500 ms delay, as X11 sends it
+        key(app, RELEASE, 'a', 38, t)
+        key(app, PRESS, 'a', 38, t)
+    key(app, RELEASE, 'a', 38, 2000)
+    key(app, PRESS, 's', 39, 2100)
+    key(app, RELEASE, 's', 39, 2110) # Bounce-like short press: its release stays pending...
+    key(app, PRESS, 's', 39, 2110)
+    key(app, RELEASE, 's', 39, 2150, frame_end=True) # ...and counts, held for under repeat_delay_ms
+    heatmap.renderer = None
+    heatmap.refresh_heatmap() # Counts the last release
+    stats = heatmap.current_stats()
+    (a,) = heatmap.layout_index.lookup('a', 'a')
+    (s,) = heatmap.layout_index.lookup('s', 's')
+    assert stats.counts[a] == 1 and stats.dwell_sum[a] == 1000 and stats.dwell_count[a] == 1
+    assert stats.counts[s] == 2 and stats.dwell_count[s] == 2
+    assert heatmap._pending_release is None and not heatmap._held_keys
+
+
+@pytest.mark.parametrize("value, address", [("", ("127.0.0.1", 8765)), ("9000", ("127.0.0.1", 9000)),
+                                            ("0.0.0.0:9001", ("0.0.0.0", 9001)), ("[::1]:80", ("::1", 80))])
+def test_parse_stream_address(value, address):
+    assert kt.parse_stream_address(value) == address
+
+
+@pytest.mark.parametrize("value", ["localhost:abc", "localhost:-1", "70000", "host: 80"])
+def test_parse_stream_address_rejects(value):
+    with pytest.raises(ValueError): kt.parse_stream_address(value)
+
+
+def test_profile_report_is_written_to_a_file(app, tmp_path, monkeypatch):
+    monkeypatch.setitem(kt.STYLE_CONFIG, "session_dir", str(tmp_path))
+    app.profiler = kt.HotPathProfiler(kt.PROFILE_TARGETS)
+    app.profiler.enable()
+    key(app, PRESS, 'a', 38, 1000, frame_end=True)
+    app.profiler.disable()
+    path = app.export_profile_report()
+    assert path.startswith(str(tmp_path)) and "_handle_key_event" in open(path, encoding="utf-8").read()